@@ -1,5 +1,9 @@
+from typing import Callable
+
 from numpy import ndarray
 
+__version__: str
+
 class EDFFileConfig:
     keyword: str
     dataset_name: str
@@ -17,10 +21,70 @@ class LSTData:
     attributes: dict[str, str]
     data: ndarray
 
+class DetectorStats:
+    events: int
+    max_channel: int | None
+    pixels: int
+    clamped: int
+
+class LSTProbe:
+    file_size: int
+    data_offset: int
+    map_size_width: int
+    map_size_height: int
+    pixel_size_width: int
+    pixel_size_height: int
+    pen_size: int
+    max_x: int
+    max_y: int
+    timer_reduce: int
+    particle: str | None
+    beam_energy: str | None
+    dataset_bytes: dict[str, int]
+    total_bytes: int
+
 class ParsingResult:
     datasets: list[LSTData]
     computed_datasets: list[LSTData]
     attributes: dict[str, str]
+    stats: dict[str, DetectorStats]
+
+class CancelToken:
+    cancelled: bool
+
+    def __init__(self) -> None: ...
+    def cancel(self) -> None: ...
+
+class LstStream:
+    parsed_bytes: int
+    events: int
+    timer_events: int
+
+    def __init__(
+        self,
+        file_path: str,
+        config: Config,
+        mode: str = "dense",
+        detectors: list[str] | None = None,
+    ) -> None: ...
+    def poll(self) -> int: ...
+    def snapshot(self) -> ParsingResult | None: ...
+
+class WriterOptions:
+    streaming: bool
+    band_rows: int
+    mode: str
+    threads: int
+
+    def __init__(
+        self,
+        streaming: bool = False,
+        band_rows: int = 4,
+        mode: str = "dense",
+        threads: int = 1,
+    ) -> None: ...
+
+ProgressCallback = Callable[[int, int, int, float], None]
 
 class Detector:
     adc: int
@@ -51,4 +115,35 @@ class Config:
         edf: list[EDFConfig] | None,
     ) -> None: ...
 
-def parse_lst(filename: str, config: Config) -> ParsingResult: ...
+def parse_lst(
+    filename: str,
+    config: Config,
+    mode: str = "dense",
+    detectors: list[str] | None = None,
+    threads: int = 1,
+    progress: ProgressCallback | None = None,
+    progress_interval: float = 0.5,
+    cancel: CancelToken | None = None,
+    progress_bar: bool = True,
+    pixel_roi: tuple[int, int, int, int] | None = None,
+    time_window: tuple[int, int] | None = None,
+    byte_range: tuple[int, int] | None = None,
+) -> ParsingResult: ...
+
+def parse_lst_to_hdf5(
+    filename: str,
+    config: Config,
+    output_path: str,
+    options: WriterOptions | None = None,
+    detectors: list[str] | None = None,
+    progress: ProgressCallback | None = None,
+    progress_interval: float = 0.5,
+    cancel: CancelToken | None = None,
+    progress_bar: bool = True,
+) -> dict[str, DetectorStats]: ...
+
+def probe_lst(
+    filename: str,
+    config: Config,
+    detectors: list[str] | None = None,
+) -> LSTProbe: ...
@@ -4,6 +4,8 @@ import pathlib
 import lstrs
 import yaml
 
+from new_aglae_data_converter.lst.storage import StorageConfig, parse_storage_config
+
 logger = logging.getLogger(__name__)
 
 
@@ -45,3 +47,15 @@ def parse_config(config_file: pathlib.Path) -> lstrs.Config:
         computed_detectors=computed_detectors,
         edf=edf,
     )
+
+
+def parse_storage(config_file: pathlib.Path) -> StorageConfig | None:
+    """
+    Parse the HDF5 storage options of the lst datasets, None if the config file has no `storage` section.
+    """
+    with open(config_file, "r") as f:
+        config = yaml.safe_load(f)
+
+    if config.get("storage") is None:
+        return None
+    return parse_storage_config(config["storage"])
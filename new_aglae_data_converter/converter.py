@@ -1,21 +1,69 @@
 import argparse
 import logging
 import pathlib
+from typing import Callable
 
+import lstrs
 from enums import ExtractionType
 from globals.converter import convert_globals_to_hdf5
 from lst.converter import convert_lst_to_hdf5
+from lst.cache import ParseCache
+from lst.manifest import Manifest
+from lst.pipeline import convert_lst_files_pipelined
+from lst.pool import convert_lst_files_in_pool
+from lst.scheduler import AUTO_BUDGET_RATIO, get_available_memory, parse_memory_budget, parse_size
+from lst.storage import StorageConfig
 
-from new_aglae_data_converter.config import parse_config
+from new_aglae_data_converter.config import parse_config, parse_storage
 
 logger = logging.getLogger(__name__)
 
 
+def get_config(config_path: pathlib.Path | None = None) -> lstrs.Config:
+    """
+    Parse the config file for lst parsing, or the default one if `config_path` is None.
+    """
+    return parse_config(get_config_path(config_path))
+
+
+def get_storage_config(config_path: pathlib.Path | None = None) -> StorageConfig | None:
+    """
+    Parse the HDF5 storage options of the lst datasets, see `get_config`.
+    """
+    return parse_storage(get_config_path(config_path))
+
+
+def get_config_path(config_path: pathlib.Path | None = None) -> pathlib.Path:
+    """
+    Get the config file for lst parsing, the default one if `config_path` is None.
+    """
+    # Throw error if no config file is provided
+    if not config_path:
+        config_path = pathlib.Path(__file__).parents[1] / "config.yml"
+    if not config_path.exists():
+        config_path = pathlib.Path(__file__).parents[0] / "config.yml"
+    if not config_path.exists():
+        logger.error("Default config file is missing.")
+        logger.error("Tried %s", pathlib.Path(__file__).parents[1] / "config.yml")
+        logger.error("Tried %s", pathlib.Path(__file__).parents[0] / "config.yml")
+        raise ValueError("Default config file is missing. Provide a config file.")
+    logger.debug("Using confg file: %s", config_path)
+    return config_path
+
+
 def convert(
     extraction_types: tuple[ExtractionType, ...],
     data_path: pathlib.Path,
     output_path: pathlib.Path,
     config_path: pathlib.Path | None = None,
+    lst_streaming: bool = False,
+    lst_progress: Callable[[pathlib.Path, int, int, int, float], None] | None = None,
+    lst_cancel: lstrs.CancelToken | None = None,
+    lst_memory_budget: int | None = None,
+    lst_jobs: int = 1,
+    lst_pipeline: bool = False,
+    lst_cache: ParseCache | None = None,
+    lst_resume: bool = False,
 ):
     """
     Extract data files included in `extraction_types` from `data_path` and
@@ -24,6 +72,16 @@ def convert(
     :param data_path: Path to the folder containing the data files.
     :param output_path: Path to the folder where the HDF5 files should be saved.
     :param config_path: Path to a config file for lst parsing.
+    :param lst_streaming: Write the lst maps to HDF5 while parsing them.
+    :param lst_progress: Progress callback of the lst parsing.
+    :param lst_cancel: lstrs.CancelToken to stop the lst conversion.
+    :param lst_memory_budget: Memory in bytes for converting lst files concurrently.
+    :param lst_jobs: Number of processes converting lst files. With more than one,
+        a failing file doesn't stop the conversion and the progress isn't reported.
+    :param lst_pipeline: Parse the next lst file while writing the previous one.
+        Not used with several jobs or when streaming.
+    :param lst_cache: Cache of the parsed lst histograms.
+    :param lst_resume: Skip the lst files whose output is up to date in the manifest of `output_path`.
     :return: Number of processed files.
     """
     # Check that the paths exist. Raise FileNotFoundError if not.
@@ -32,24 +90,66 @@ def convert(
     logger.info("Reading from : %s", data_path)
     logger.info("Saving files to : %s", output_path)
 
-    # Throw error if no config file is provided
-    if not config_path:
-        config_path = pathlib.Path(__file__).parents[1] / "config.yml"
-    if not config_path.exists():
-        config_path = pathlib.Path(__file__).parents[0] / "config.yml"
-    if not config_path.exists():
-        logger.error("Default config file is missing.")
-        logger.error("Tried %s", pathlib.Path(__file__).parents[1] / "config.yml")
-        logger.error("Tried %s", pathlib.Path(__file__).parents[0] / "config.yml")
-        raise ValueError("Default config file is missing. Provide a config file.")
-    logger.debug("Using confg file: %s", config_path)
+    config_path = get_config_path(config_path)
     config = parse_config(config_path)
+    lst_storage = parse_storage(config_path)
+    if lst_pipeline and (lst_jobs > 1 or lst_streaming):
+        logger.warning("The lst files aren't pipelined with several jobs or when streaming.")
+    if lst_jobs > 1 and (lst_progress is not None or lst_cancel is not None):
+        logger.warning("The lst progress isn't reported and the conversion can't be cancelled with several jobs.")
 
     processed_files_num = 0
     if ExtractionType.GLOBALS in extraction_types or ExtractionType.STANDARDS in extraction_types:
         processed_files_num += convert_globals_to_hdf5(extraction_types, data_path, output_path, config)
-    if ExtractionType.LST in extraction_types:
-        processed_files_num += convert_lst_to_hdf5(data_path, output_path, config)
+    lst_manifest = (
+        Manifest(output_path, resume=lst_resume, storage=lst_storage)
+        if ExtractionType.LST in extraction_types
+        else None
+    )
+    if ExtractionType.LST in extraction_types and lst_jobs > 1:
+        processed_files_num += convert_lst_files_in_pool(
+            data_path,
+            output_path,
+            config,
+            config_path,
+            lst_jobs,
+            streaming=lst_streaming,
+            memory_budget=lst_memory_budget,
+            cache=lst_cache,
+            manifest=lst_manifest,
+            storage=lst_storage,
+        )
+    elif ExtractionType.LST in extraction_types and lst_pipeline and not lst_streaming:
+        memory_limit = lst_memory_budget
+        if memory_limit is None:
+            if (available_memory := get_available_memory()) is not None:
+                memory_limit = int(available_memory * AUTO_BUDGET_RATIO)
+            else:
+                logger.warning("Couldn't read the available memory, the pipeline memory isn't limited.")
+        processed_files_num += convert_lst_files_pipelined(
+            data_path,
+            output_path,
+            config,
+            progress=lst_progress,
+            cancel=lst_cancel,
+            memory_limit=memory_limit,
+            cache=lst_cache,
+            manifest=lst_manifest,
+            storage=lst_storage,
+        )
+    elif ExtractionType.LST in extraction_types:
+        processed_files_num += convert_lst_to_hdf5(
+            data_path,
+            output_path,
+            config,
+            streaming=lst_streaming,
+            progress=lst_progress,
+            cancel=lst_cancel,
+            memory_budget=lst_memory_budget,
+            cache=lst_cache,
+            manifest=lst_manifest,
+            storage=lst_storage,
+        )
 
     return processed_files_num
 
@@ -91,9 +191,50 @@ if __name__ == "__main__":
         help="Path to config file for LST parsing.",
         required=False,
     )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Write the LST maps to HDF5 row by row while parsing, for maps too large for memory.",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=str,
+        help="Convert several LST files at once within this memory, e.g. '16G' or 'auto'. "
+        "Files too large for the budget are streamed.",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="Number of processes converting LST files (default: 1).",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="Parse the next LST file while the previous one is compressed and written.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=pathlib.Path,
+        help="Directory caching the parsed LST histograms, reused while the LST file and detector config don't change.",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=str,
+        default="20G",
+        help="Size of the LST cache directory, least recently used entries are evicted (default: 20G).",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip the LST files already converted with the same input, config and converter version.",
+    )
     parser.add_argument("--log", default="INFO", help="Log level (default: INFO)")
 
     args = parser.parse_args()
+    if args.pipeline and (args.streaming or args.jobs > 1):
+        parser.error("--pipeline can't be combined with --streaming or --jobs")
 
     # Setup logger
     numeric_level = getattr(logging, args.log.upper(), None)
@@ -104,5 +245,11 @@ if __name__ == "__main__":
         data_path=args.data_path,
         output_path=args.output_path,
         config_path=args.config,
+        lst_streaming=args.streaming,
+        lst_memory_budget=parse_memory_budget(args.memory_budget) if args.memory_budget else None,
+        lst_jobs=args.jobs,
+        lst_pipeline=args.pipeline,
+        lst_cache=ParseCache(args.cache_dir, parse_size(args.cache_size)) if args.cache_dir else None,
+        lst_resume=args.resume,
     )
     logger.debug(f"Processed %s files.", processed_files_cnt)
@@ -25,6 +25,24 @@ def convert_globals_to_hdf5(
     :param output_path: Path to the folder where the HDF5 files should be saved.
     :return: Number of processed files.
     """
+    # Get global data files in the specified folder
+    data_files = get_global_files(data_path, config)
+    logger.info("Starting reading files...")
+    num_processed_files = insert_global_files_in_hdf5(extraction_types, data_files, output_path)
+
+    logger.info("%s files processed.", num_processed_files)
+    return num_processed_files
+
+
+def insert_global_files_in_hdf5(
+    extraction_types: tuple[ExtractionType, ...],
+    global_files: list[pathlib.Path],
+    output_path: pathlib.Path,
+) -> int:
+    """
+    Insert global data files in the globals and standards HDF5 files of `output_path`.
+    :return: Number of processed files.
+    """
     # Open HDF5 files for globals and standards data
     globals_file: h5py.File | None = None
     standards_file: h5py.File | None = None
@@ -33,31 +51,32 @@ def convert_globals_to_hdf5(
     if ExtractionType.STANDARDS in extraction_types:
         standards_file = h5py.File(output_path / "std.hdf5", mode="a")
 
-    # Get global data files in the specified folder
-    data_files = get_global_files(data_path, config)
-    logger.info("Starting reading files...")
     num_processed_files = 0
-    for global_file in data_files:
-        # Determine whether the current file contains standards or globals data
-        if is_file_std(global_file.name):
-            if not standards_file:
-                continue
-            file = standards_file
-        else:
-            if not globals_file:
-                continue
-            file = globals_file
-
-        file = standards_file if is_file_std(global_file.name) else globals_file
+    try:
+        for global_file in global_files:
+            # Determine whether the current file contains standards or globals data
+            if is_file_std(global_file.name):
+                if not standards_file:
+                    continue
+                file = standards_file
+            else:
+                if not globals_file:
+                    continue
+                file = globals_file
+
+            file = standards_file if is_file_std(global_file.name) else globals_file
+
+            # Insert the data from the global file into the appropriate HDF5 file
+            if file is not None:
+                insert_global_file_in_hdf5(file, global_file)
+                num_processed_files += 1
+            else:
+                logger.error("No HDF5 file opened for file %s.", global_file.name)
+    finally:
+        for file in (globals_file, standards_file):
+            if file is not None:
+                file.close()
 
-        # Insert the data from the global file into the appropriate HDF5 file
-        if file is not None:
-            insert_global_file_in_hdf5(file, global_file)
-            num_processed_files += 1
-        else:
-            logger.error("No HDF5 file opened for file %s.", global_file.name)
-
-    logger.info("%s files processed.", num_processed_files)
     return num_processed_files
 
 
@@ -116,7 +135,7 @@ def get_global_files(folder: pathlib.Path, config: lstrs.Config) -> list[pathlib
     :return: Iterator of global data files.
     """
     files = folder.glob("**/*")
-    global_extensions = _get_global_file_extensions(config)
+    global_extensions = get_global_file_extensions(config)
     global_files: list[pathlib.Path] = list(filter(lambda file: file.suffix[1:] in global_extensions, files))
     return sorted(global_files)
 
@@ -125,7 +144,7 @@ def is_file_std(filename: str) -> bool:
     return "_std_" in filename.lower()
 
 
-def _get_global_file_extensions(config: lstrs.Config) -> set[str]:
+def get_global_file_extensions(config: lstrs.Config) -> set[str]:
     detector_extensions = [detector.file_extension or name for name, detector in config.detectors.items()]
     computed_detector_extensions = [
         detector.file_extension or name for name, detector in config.computed_detectors.items()
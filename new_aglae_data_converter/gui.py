@@ -1,6 +1,7 @@
 import pathlib
 import sys
 
+import lstrs
 from PySide6.QtCore import QDir, QThread, Signal, Slot
 from PySide6.QtWidgets import (
     QApplication,
@@ -11,6 +12,7 @@ from PySide6.QtWidgets import (
     QLabel,
     QLineEdit,
     QMessageBox,
+    QProgressBar,
     QPushButton,
     QStyle,
     QTextEdit,
@@ -25,6 +27,9 @@ from enums import ExtractionType
 class ConverterWorker(QThread):
     finished_signal = Signal(int)
     failed_signal = Signal(Exception)
+    cancelled_signal = Signal()
+    # LST file name, percentage of the file parsed, events per second
+    progress_signal = Signal(str, int, float)
 
     data_path: pathlib.Path | None = None
     output_path: pathlib.Path | None = None
@@ -33,19 +38,35 @@ class ConverterWorker(QThread):
 
     def __init__(self):
         super().__init__()
+        self.cancel_token = lstrs.CancelToken()
 
     def run(self):
+        self.cancel_token = lstrs.CancelToken()
         try:
             processed_files_num = convert(
                 self.extraction_types,
                 self.data_path,
                 self.output_path,
                 self.config_path,
+                lst_progress=self.on_lst_progress,
+                lst_cancel=self.cancel_token,
             )
         except Exception as error:
+            if self.cancel_token.cancelled:
+                self.cancelled_signal.emit()
+                return
             self.failed_signal.emit(error)
         self.finished_signal.emit(processed_files_num)
 
+    def cancel(self):
+        self.cancel_token.cancel()
+
+    def on_lst_progress(
+        self, lst_file: pathlib.Path, parsed_bytes: int, total_bytes: int, events: int, events_per_second: float
+    ):
+        # Called from the parsing progress thread, the signal is queued to the GUI thread
+        self.progress_signal.emit(lst_file.name, int(100 * parsed_bytes / max(total_bytes, 1)), events_per_second)
+
 
 class ConverterWidget(QWidget):
     """A widget to download a http file to a destination file"""
@@ -58,10 +79,19 @@ class ConverterWidget(QWidget):
         self.worker = ConverterWorker()
         self.worker.finished_signal.connect(self.on_conversion_completed)
         self.worker.failed_signal.connect(self.on_conversion_failure)
+        self.worker.cancelled_signal.connect(self.on_conversion_cancelled)
+        self.worker.progress_signal.connect(self.on_conversion_progress)
 
         self.start_button = QPushButton("Start")
         self.start_button.setDisabled(True)
 
+        self.stop_button = QPushButton("Stop")
+        self.stop_button.setDisabled(True)
+
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setFormat("%p%")
+
         self.source_path_box = QLineEdit()
         self.source_path_box.setPlaceholderText("Run data folder path")
         self.source_path_box.addAction(
@@ -81,6 +111,7 @@ class ConverterWidget(QWidget):
         # buttons bar layout
         buttonslayout = QHBoxLayout()
         buttonslayout.addStretch()
+        buttonslayout.addWidget(self.stop_button)
         buttonslayout.addWidget(self.start_button)
 
         self.checkboxeslayout = ExtractionTypeChexboxesLayout()
@@ -95,12 +126,14 @@ class ConverterWidget(QWidget):
         self.config_file_input_layout = ConfigFileInputLayout()
         vlayout.addLayout(self.config_file_input_layout)
         vlayout.addLayout(buttonslayout)
+        vlayout.addWidget(self.progress_bar)
         vlayout.addWidget(self.context_box)
 
         self.resize(600, 300)
 
         self.start_button.clicked.connect(self.on_start)
         self.start_button.setDisabled(True)
+        self.stop_button.clicked.connect(self.on_stop)
 
     @Slot()
     def on_start(self):
@@ -124,6 +157,8 @@ class ConverterWidget(QWidget):
                 return
 
         self.start_button.setDisabled(True)
+        self.stop_button.setDisabled(False)
+        self.progress_bar.reset()
         self.worker.output_path = dest_path
         self.worker.data_path = source_path
         self.worker.extraction_types = self.checkboxeslayout.selected_extractions
@@ -137,15 +172,34 @@ class ConverterWidget(QWidget):
         )
         self.context_box.append("Conversion has started.")
 
+    @Slot()
+    def on_stop(self):
+        """When user press stop button"""
+        self.stop_button.setDisabled(True)
+        self.worker.cancel()
+        self.context_box.append("Stopping the conversion...")
+
+    @Slot()
+    def on_conversion_progress(self, lst_file: str, percentage: int, events_per_second: float):
+        self.progress_bar.setValue(percentage)
+        self.progress_bar.setFormat(f"{lst_file}: %p% ({events_per_second:,.0f} events/s)")
+
     @Slot()
     def on_conversion_completed(self, processed_files_num):
         self.start_button.setDisabled(False)
+        self.stop_button.setDisabled(True)
         self.context_box.append(f"Processed {processed_files_num} files.")
         self.context_box.append("Done.")
 
+    @Slot()
+    def on_conversion_cancelled(self):
+        self.start_button.setDisabled(False)
+        self.context_box.append("Conversion stopped.")
+
     @Slot()
     def on_conversion_failure(self, error: Exception):
         self.start_button.setDisabled(False)
+        self.stop_button.setDisabled(True)
         self.context_box.append(f"An error occured : {error} ({type(error).__name__})")
         raise type(error) from error
 
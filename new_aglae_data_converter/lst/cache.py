@@ -0,0 +1,183 @@
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import shutil
+
+import lstrs
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Bump when the entry format changes. Changes of the parsing output bump the lstrs version.
+CACHE_VERSION = 1
+
+# Bytes of the lst file hashed at its start, middle and end
+SAMPLE_SIZE = 1024**2
+
+
+@dataclasses.dataclass
+class CachedDataset:
+    name: str
+    attributes: dict[str, str]
+    data: np.ndarray
+
+
+@dataclasses.dataclass
+class CachedParsingResult:
+    """Parsing result loaded from the cache, with the same attributes as lstrs.ParsingResult, stats aside."""
+
+    datasets: list[CachedDataset]
+    computed_datasets: list[CachedDataset]
+    attributes: dict[str, str]
+
+
+class ParseCache:
+    """
+    On-disk cache of the histograms parsed from lst files, with a size-based LRU eviction.
+    An entry is a directory named by its key, with a `meta.json` file and one `.npy` file per dataset.
+    """
+
+    def __init__(self, directory: pathlib.Path, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def parse_lst(
+        self, lst_file: pathlib.Path, config: lstrs.Config, **kwargs
+    ) -> lstrs.ParsingResult | CachedParsingResult:
+        """
+        Same as lstrs.parse_lst in dense mode, served from the cache when the file
+        was already parsed with the same detector config.
+        """
+        key = get_cache_key(lst_file, config)
+        result = self.get(key)
+        if result is not None:
+            logger.info("Using cached parsing of %s", lst_file)
+            return result
+
+        result = lstrs.parse_lst(str(lst_file.absolute()), config, **kwargs)
+        try:
+            self.put(key, result)
+        except OSError as error:
+            logger.warning("Couldn't cache the parsing of %s: %s", lst_file, error)
+        return result
+
+    def get(self, key: str) -> CachedParsingResult | None:
+        entry = self.directory / key
+        try:
+            with open(entry / "meta.json") as meta_file:
+                meta = json.load(meta_file)
+            datasets = [
+                CachedDataset(dataset["name"], dataset["attributes"], np.load(entry / dataset["file"], mmap_mode="r"))
+                for dataset in meta["datasets"]
+            ]
+        except (OSError, ValueError, KeyError):
+            return None
+        # Mark the entry as recently used
+        os.utime(entry / "meta.json")
+
+        nb_datasets = meta["nb_datasets"]
+        return CachedParsingResult(datasets[:nb_datasets], datasets[nb_datasets:], meta["attributes"])
+
+    def put(self, key: str, result: lstrs.ParsingResult | CachedParsingResult):
+        entry = self.directory / key
+        tmp_entry = self.directory / f".{key}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        tmp_entry.mkdir()
+
+        datasets = []
+        for index, dataset in enumerate([*result.datasets, *result.computed_datasets]):
+            file = f"{index}.npy"
+            np.save(tmp_entry / file, dataset.data)
+            datasets.append({"name": dataset.name, "attributes": dict(dataset.attributes), "file": file})
+        meta = {
+            "version": CACHE_VERSION,
+            "attributes": dict(result.attributes),
+            "nb_datasets": len(result.datasets),
+            "datasets": datasets,
+        }
+        with open(tmp_entry / "meta.json", "w") as meta_file:
+            json.dump(meta, meta_file)
+
+        try:
+            os.rename(tmp_entry, entry)
+        except OSError:
+            # Another process cached the same file
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in `max_bytes`.
+        """
+        entries = []
+        for entry in self.directory.iterdir():
+            if entry.name.startswith(".") or not entry.is_dir():
+                continue
+            try:
+                last_used = (entry / "meta.json").stat().st_mtime
+                size = sum(file.stat().st_size for file in entry.iterdir())
+            except OSError:
+                continue
+            entries.append((last_used, size, entry))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries, key=lambda entry: entry[0]):
+            if total_size <= self.max_bytes:
+                break
+            logger.debug("Evicting %s from the parse cache", entry.name)
+            shutil.rmtree(entry, ignore_errors=True)
+            total_size -= size
+
+
+def get_cache_key(lst_file: pathlib.Path, config: lstrs.Config) -> str:
+    """
+    Hash the size, modification time and sampled content of `lst_file` with the config fields used by the parsing,
+    and the versions of the cache and of lstrs.
+    """
+    stat = lst_file.stat()
+    key = hashlib.blake2b(digest_size=20)
+    key.update(f"{CACHE_VERSION}:{lstrs.__version__}".encode())
+    key.update(f"{stat.st_size}:{stat.st_mtime_ns}:{hash_lst_file(lst_file)}".encode())
+    key.update(get_config_fingerprint(config).encode())
+    return key.hexdigest()
+
+
+def hash_lst_file(lst_file: pathlib.Path) -> str:
+    """
+    Hash samples of the start, middle and end of `lst_file`, reading the whole file would take longer than parsing it.
+    """
+    file_hash = hashlib.blake2b(digest_size=20)
+    size = lst_file.stat().st_size
+    with open(lst_file, "rb") as file:
+        for offset in (0, size // 2, max(size - SAMPLE_SIZE, 0)):
+            file.seek(offset)
+            file_hash.update(file.read(SAMPLE_SIZE))
+    return file_hash.hexdigest()
+
+
+def get_config_fingerprint(config: lstrs.Config, edf: bool = False) -> str:
+    """
+    Canonical representation of the detector config.
+    :param edf: Include the EDF settings, which don't change the parsing.
+    """
+    fields = {
+        "x": config.x,
+        "y": config.y,
+        "detectors": {
+            name: [detector.adc, detector.channels, detector.file_extension]
+            for name, detector in config.detectors.items()
+        },
+        "computed_detectors": {
+            name: [detector.detectors, detector.file_extension] for name, detector in config.computed_detectors.items()
+        },
+    }
+    if edf:
+        fields["edf"] = [
+            [edf_config.path, [[file.keyword, file.dataset_name] for file in edf_config.files]]
+            for edf_config in config.edf or []
+        ]
+    return json.dumps(fields, sort_keys=True)
@@ -0,0 +1,70 @@
+import itertools
+import logging
+import zlib
+from concurrent.futures import Executor, Future
+
+import h5py
+import numpy as np
+
+from new_aglae_data_converter.lst.storage import convert_counts
+
+logger = logging.getLogger(__name__)
+
+# Datasets smaller than this are compressed by HDF5 in the calling thread
+MIN_PARALLEL_BYTES = 16 * 1024**2
+
+# Level used by h5py when the gzip level isn't given
+DEFAULT_GZIP_LEVEL = 4
+
+# Compressed chunks waiting to be written, per worker
+QUEUED_CHUNKS_PER_WORKER = 4
+
+
+def write_chunks_in_parallel(
+    dataset: h5py.Dataset, data: np.ndarray, level: int | None, shuffle: bool, executor: Executor, workers: int
+):
+    """
+    Compress the chunks of `data` on `executor` and write them to the gzip `dataset`
+    with direct chunk writes, in the calling thread. The chunks are the ones the
+    HDF5 deflate and shuffle filters would write. Chunks without counts are not
+    written, they read as the fill value. The counts are converted to the dataset
+    type by `convert_counts`.
+    :param workers: Number of workers of `executor`, bounds the chunks held in memory.
+    """
+    level = DEFAULT_GZIP_LEVEL if level is None else level
+    chunk_shape = dataset.chunks
+    offsets = itertools.product(*(range(0, length, size) for length, size in zip(data.shape, chunk_shape)))
+
+    def compress(offset: tuple[int, ...]) -> bytes | None:
+        block = data[tuple(slice(start, start + size) for start, size in zip(offset, chunk_shape))]
+        if not block.any():
+            return None
+        # Edge chunks are stored whole, padded with the fill value
+        chunk = np.zeros(chunk_shape, dtype=dataset.dtype)
+        chunk[tuple(slice(0, length) for length in block.shape)] = convert_counts(block, dataset.dtype)
+        if shuffle:
+            return zlib.compress(chunk.view(np.uint8).reshape(-1, chunk.itemsize).T.tobytes(), level)
+        return zlib.compress(chunk.data, level)
+
+    pending: list[tuple[tuple[int, ...], Future]] = []
+    written_chunks = 0
+    for offset in offsets:
+        pending.append((offset, executor.submit(compress, offset)))
+        if len(pending) >= workers * QUEUED_CHUNKS_PER_WORKER:
+            written_chunks += write_chunk(dataset, *pending.pop(0))
+    for offset, future in pending:
+        written_chunks += write_chunk(dataset, offset, future)
+
+    logger.debug("%s: %s chunks written", dataset.name, written_chunks)
+
+
+def write_chunk(dataset: h5py.Dataset, offset: tuple[int, ...], future: Future) -> int:
+    """
+    Write a compressed chunk once ready.
+    :return: 1 if the chunk was written, 0 if it was empty.
+    """
+    compressed = future.result()
+    if compressed is None:
+        return 0
+    dataset.id.write_direct_chunk(offset, compressed)
+    return 1
@@ -1,11 +1,21 @@
+import functools
 import logging
 import pathlib
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Callable
 
 import h5py
 import lstrs
+import numpy as np
 from lstrs import ParsingResult
 from PyMca5.PyMcaIO import EDFStack
 from new_aglae_data_converter.edf import find_edf_stack
+from new_aglae_data_converter.lst.cache import CachedDataset, CachedParsingResult, ParseCache
+from new_aglae_data_converter.lst.compression import MIN_PARALLEL_BYTES, write_chunks_in_parallel
+from new_aglae_data_converter.lst.manifest import Manifest
+from new_aglae_data_converter.lst.scheduler import MemoryScheduler, probe_lst_files
+from new_aglae_data_converter.lst.sparse import write_sparse_dataset
+from new_aglae_data_converter.lst.storage import StorageConfig, StorageOptions, convert_counts
 
 logger = logging.getLogger(__name__)
 
@@ -14,29 +24,139 @@ def convert_lst_to_hdf5(
     data_path: pathlib.Path,
     output_path: pathlib.Path,
     config: lstrs.Config,
+    streaming: bool = False,
+    progress: Callable[[pathlib.Path, int, int, int, float], None] | None = None,
+    cancel: lstrs.CancelToken | None = None,
+    memory_budget: int | None = None,
+    cache: ParseCache | None = None,
+    manifest: Manifest | None = None,
+    storage: StorageConfig | None = None,
 ) -> int:
     """
     Convert lst files to HDF5 format and save them to the specified output path.
+    :param streaming: Write the map rows to the HDF5 file while parsing,
+        so the memory used doesn't grow with the map size.
+    :param progress: Called with the lst file, the parsed bytes, the file size,
+        the number of events and the events per second. The terminal progress
+        bar is hidden when a callback is given.
+    :param cancel: Token to stop the conversion from another thread.
+    :param memory_budget: Convert several files at once while their estimated memory
+        stays under this number of bytes. Files too large for the budget are streamed,
+        and the ones whose header can't be read are skipped.
+    :param cache: Cache of the parsed histograms, not used when streaming.
+    :param manifest: Manifest recording the conversions, skips the up to date files when resuming.
+    :param storage: HDF5 storage options of the datasets, not used when streaming.
     :return: Number of processed files.
     """
-    processed_files_num = 0
     paths = [data_path] if data_path.is_file() else get_lst_files(data_path)
-    for lst_file in paths:
-        logger.info("Reading from: %s" % lst_file)
+    if manifest is not None:
+        paths = manifest.select(paths, config)
 
-        result = lstrs.parse_lst(str(lst_file.absolute()), config)
+    if memory_budget is not None:
 
-        edf_stacks = []
-        if config.edf is not None:
-            edf_stacks = find_edf_stack(config.edf, lst_file)
+        def convert_job(lst_file: pathlib.Path, use_streaming: bool):
+            convert_lst_file(
+                lst_file,
+                output_path,
+                config,
+                use_streaming,
+                progress,
+                cancel,
+                cache=cache,
+                manifest=manifest,
+                storage=storage,
+            )
 
-        write_lst_hdf5(result, edf_stacks, lst_file, output_path)
-        processed_files_num += 1
+        # A file whose header can't be read is left out, the others are still converted
+        jobs = probe_lst_files(paths, config)
+        processed_files_num = len(MemoryScheduler(memory_budget).run(jobs, convert_job, streaming=streaming))
+    else:
+        processed_files_num = 0
+        for lst_file in paths:
+            convert_lst_file(
+                lst_file,
+                output_path,
+                config,
+                streaming,
+                progress,
+                cancel,
+                cache=cache,
+                manifest=manifest,
+                storage=storage,
+            )
+            processed_files_num += 1
 
     logger.debug("%s files processed.", processed_files_num)
     return processed_files_num
 
 
+def convert_lst_file(
+    lst_file: pathlib.Path,
+    output_path: pathlib.Path,
+    config: lstrs.Config,
+    streaming: bool = False,
+    progress: Callable[[pathlib.Path, int, int, int, float], None] | None = None,
+    cancel: lstrs.CancelToken | None = None,
+    progress_bar: bool = True,
+    cache: ParseCache | None = None,
+    manifest: Manifest | None = None,
+    storage: StorageConfig | None = None,
+):
+    """
+    Convert a single lst file, see `convert_lst_to_hdf5`.
+    :param progress_bar: Draw a progress bar on the terminal when no progress callback is given.
+    """
+    logger.info("Reading from: %s" % lst_file)
+    if streaming and storage is not None:
+        # Also the case of the files too large for the memory budget
+        logger.warning("%s is streamed, the storage options of the config file aren't used.", lst_file)
+
+    progress_options = get_progress_options(lst_file, progress, cancel, progress_bar)
+
+    edf_stacks = []
+    if config.edf is not None:
+        edf_stacks = find_edf_stack(config.edf, lst_file)
+
+    if not streaming and (cache is not None or storage is not None):
+        if cache is not None:
+            result = cache.parse_lst(lst_file, config, **progress_options)
+        else:
+            result = lstrs.parse_lst(str(lst_file.absolute()), config, **progress_options)
+        output_file = write_lst_hdf5(result, edf_stacks, lst_file, output_path, storage)
+    else:
+        # Parsed and written in a single native call, the datasets never go through Python
+        output_file = get_output_file(lst_file, output_path)
+        temporary_file = get_temporary_file(output_file)
+        options = lstrs.WriterOptions(streaming=streaming)
+        try:
+            lstrs.parse_lst_to_hdf5(str(lst_file.absolute()), config, str(temporary_file), options, **progress_options)
+            if edf_stacks:
+                with h5py.File(temporary_file, "a") as file:
+                    write_edf_stacks_to_group(file["data"], edf_stacks)
+        except BaseException:
+            temporary_file.unlink(missing_ok=True)
+            raise
+        temporary_file.replace(output_file)
+
+    if manifest is not None:
+        manifest.record(lst_file, config, output_file, streamed=streaming)
+
+
+def get_progress_options(
+    lst_file: pathlib.Path,
+    progress: Callable[[pathlib.Path, int, int, int, float], None] | None = None,
+    cancel: lstrs.CancelToken | None = None,
+    progress_bar: bool = True,
+) -> dict:
+    """
+    Get the progress keyword arguments of the lstrs parsing functions for `lst_file`.
+    """
+    progress_options = {"cancel": cancel, "progress_bar": progress_bar and progress is None}
+    if progress is not None:
+        progress_options["progress"] = functools.partial(progress, lst_file)
+    return progress_options
+
+
 def get_lst_files(folder: pathlib.Path):
     """
     Get all lst data files in the specified folder.
@@ -49,37 +169,91 @@ def get_lst_files(folder: pathlib.Path):
             yield file
 
 
-def write_dataset_to_group(group: h5py.Group, dataset: lstrs.LSTData):
-    logger.debug(f"{dataset.name}: {dataset.data.shape}")
+def get_output_file(data_path: pathlib.Path, output_path: pathlib.Path) -> pathlib.Path:
+    """
+    Get the HDF5 file written in `output_path` for a lst file.
+    """
+    return output_path.joinpath(data_path.name).with_suffix(".hdf5")
+
+
+def get_temporary_file(output_file: pathlib.Path) -> pathlib.Path:
+    """
+    Get the file written before being renamed to `output_file`, so an interrupted
+    conversion doesn't leave a truncated output behind.
+    """
+    return output_file.with_name(f"{output_file.name}.part")
 
-    dset = group.create_dataset(
-        dataset.name, shape=dataset.data.shape, dtype="i", data=dataset.data, compression="gzip"
-    )
+
+def write_edf_stacks_to_group(group: h5py.Group, edf_stacks: list[tuple[str, EDFStack.EDFStack]]):
+    for name, edf_stack in edf_stacks:
+        group.create_dataset(name, data=edf_stack.data, compression="gzip")
+
+
+def write_dataset_to_group(
+    group: h5py.Group,
+    dataset: lstrs.LSTData | CachedDataset,
+    options: StorageOptions = StorageOptions(),
+    executor: Executor | None = None,
+    workers: int = 1,
+):
+    """
+    Write a lst dataset. Large gzip datasets are compressed by chunks on `executor`, if given.
+    The counts out of the range of the stored type are clipped, see `convert_counts`.
+    :param workers: Number of workers of `executor`.
+    """
+    data = dataset.data
+    logger.debug(f"{dataset.name}: {data.shape}")
+
+    dtype = np.dtype(options.dtype)
+    if options.layout == "sparse":
+        dset = write_sparse_dataset(group, dataset.name, data, options.get_filter_kwargs(), dtype)
+    elif executor is not None and options.compression == "gzip" and data.nbytes >= MIN_PARALLEL_BYTES:
+        kwargs = options.get_dataset_kwargs(data.shape, dtype.itemsize)
+        dset = group.create_dataset(dataset.name, shape=data.shape, dtype=dtype, **kwargs)
+        write_chunks_in_parallel(dset, data, options.level, options.shuffle, executor, workers)
+    else:
+        kwargs = options.get_dataset_kwargs(data.shape, dtype.itemsize)
+        data = convert_counts(data, dtype)
+        dset = group.create_dataset(dataset.name, shape=data.shape, dtype=dtype, data=data, **kwargs)
 
     for key, value in dataset.attributes.items():
         dset.attrs[key] = value
 
 
 def write_lst_hdf5(
-    parsing_result: ParsingResult,
+    parsing_result: ParsingResult | CachedParsingResult,
     edf_stacks: list[tuple[str, EDFStack.EDFStack]],
     data_path: pathlib.Path,
     output_path: pathlib.Path,
-):
-    output_file = output_path.joinpath(data_path.name).with_suffix(".hdf5")
-    file = h5py.File(output_file, "w")
-    data_group = file.create_group("data")
+    storage: StorageConfig | None = None,
+) -> pathlib.Path:
+    """
+    Write the parsed lst file to HDF5, through a temporary file renamed once complete.
+    :param storage: HDF5 storage options of the datasets, the default ones if None.
+    :return: The written HDF5 file.
+    """
+    storage = storage or StorageConfig()
+    workers = storage.get_threads()
+    output_file = get_output_file(data_path, output_path)
+    temporary_file = get_temporary_file(output_file)
 
     logger.debug(f"from {data_path} to {output_file}")
 
-    for key, value in parsing_result.attributes.items():
-        data_group.attrs[key] = value
+    try:
+        with h5py.File(temporary_file, "w") as file, ThreadPoolExecutor(workers) as executor:
+            data_group = file.create_group("data")
 
-    for dataset in parsing_result.datasets:
-        write_dataset_to_group(data_group, dataset)
+            for key, value in parsing_result.attributes.items():
+                data_group.attrs[key] = value
 
-    for computed_dataset in parsing_result.computed_datasets:
-        write_dataset_to_group(data_group, computed_dataset)
+            for dataset in [*parsing_result.datasets, *parsing_result.computed_datasets]:
+                options = storage.get(dataset.name)
+                write_dataset_to_group(data_group, dataset, options, executor if workers > 1 else None, workers)
 
-    for name, edf_stack in edf_stacks:
-        data_group.create_dataset(name, data=edf_stack.data, compression="gzip")
+            write_edf_stacks_to_group(data_group, edf_stacks)
+    except BaseException:
+        temporary_file.unlink(missing_ok=True)
+        raise
+
+    temporary_file.replace(output_file)
+    return output_file
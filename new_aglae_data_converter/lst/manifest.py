@@ -0,0 +1,153 @@
+import contextlib
+import dataclasses
+import datetime
+import hashlib
+import logging
+import pathlib
+import sqlite3
+from typing import Iterable
+
+import lstrs
+
+from new_aglae_data_converter.lst.cache import get_config_fingerprint, hash_lst_file
+from new_aglae_data_converter.lst.storage import StorageConfig
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = ".lst_manifest.sqlite"
+
+# Version of the converted outputs, bump it when a change of the Python side
+# makes the previous outputs outdated. Changes of lstrs bump its own version.
+OUTPUT_VERSION = 1
+
+
+def get_converter_version() -> str:
+    return f"{OUTPUT_VERSION}+lstrs-{lstrs.__version__}"
+
+
+class Manifest:
+    """
+    Record of the lst files converted to an output folder, stored in a SQLite database
+    so worker processes can update it at the same time.
+    """
+
+    def __init__(self, output_path: pathlib.Path, resume: bool = False, storage: StorageConfig | None = None):
+        """
+        :param resume: Skip the files whose output is up to date.
+        :param storage: HDF5 storage options the files are converted with, part of the config hash.
+        """
+        self.path = output_path / MANIFEST_FILE
+        self.resume = resume
+        self.storage = storage
+        with self._connect() as connection:
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS conversions (
+                    input_file TEXT PRIMARY KEY,
+                    input_size INTEGER,
+                    input_mtime_ns INTEGER,
+                    input_hash TEXT,
+                    config_hash TEXT,
+                    converter_version TEXT,
+                    output_file TEXT,
+                    output_size INTEGER,
+                    output_checksum TEXT,
+                    converted_at TEXT
+                )"""
+            )
+
+    def select(self, lst_files: Iterable[pathlib.Path], config: lstrs.Config) -> list[pathlib.Path]:
+        """
+        Get the lst files to convert: all of them, or the outdated ones when resuming.
+        """
+        if not self.resume:
+            return list(lst_files)
+
+        outdated_files = []
+        for lst_file in lst_files:
+            if self.is_up_to_date(lst_file, config):
+                logger.info("%s is up to date, skipping it.", lst_file)
+            else:
+                outdated_files.append(lst_file)
+        return outdated_files
+
+    def is_up_to_date(self, lst_file: pathlib.Path, config: lstrs.Config) -> bool:
+        with self._connect() as connection:
+            row = connection.execute(
+                """SELECT input_size, input_mtime_ns, input_hash, config_hash, converter_version,
+                    output_file, output_size, output_checksum FROM conversions WHERE input_file = ?""",
+                (str(lst_file.absolute()),),
+            ).fetchone()
+        if row is None:
+            return False
+        (
+            input_size,
+            input_mtime_ns,
+            input_hash,
+            config_hash,
+            converter_version,
+            output_file,
+            output_size,
+            output_checksum,
+        ) = row
+
+        stat = lst_file.stat()
+        output_file = pathlib.Path(output_file)
+        return (
+            (input_size, input_mtime_ns) == (stat.st_size, stat.st_mtime_ns)
+            and config_hash == get_config_hash(config, self.storage)
+            and converter_version == get_converter_version()
+            and output_file.exists()
+            and output_file.stat().st_size == output_size
+            and input_hash == hash_lst_file(lst_file)
+            and output_checksum == get_file_checksum(output_file)
+        )
+
+    def record(self, lst_file: pathlib.Path, config: lstrs.Config, output_file: pathlib.Path, streamed: bool = False):
+        """
+        Record a successful conversion of `lst_file` to `output_file`.
+        :param streamed: The file was converted by the streaming writer, which doesn't use the storage options.
+            The conversion is then recorded without them, and stays outdated as long as they are set.
+        """
+        stat = lst_file.stat()
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO conversions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    str(lst_file.absolute()),
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    hash_lst_file(lst_file),
+                    get_config_hash(config, None if streamed else self.storage),
+                    get_converter_version(),
+                    str(output_file.absolute()),
+                    output_file.stat().st_size,
+                    get_file_checksum(output_file),
+                    datetime.datetime.now().isoformat(),
+                ),
+            )
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # A connection per operation, manifests are shared between threads and processes
+        connection = sqlite3.connect(self.path, timeout=60)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+
+def get_config_hash(config: lstrs.Config, storage: StorageConfig | None = None) -> str:
+    fingerprint = get_config_fingerprint(config, edf=True)
+    if storage is not None:
+        # The number of compression threads doesn't change the output
+        fingerprint += repr(dataclasses.replace(storage, threads=None))
+    return hashlib.blake2b(fingerprint.encode(), digest_size=20).hexdigest()
+
+
+def get_file_checksum(file_path: pathlib.Path) -> str:
+    file_hash = hashlib.blake2b(digest_size=20)
+    with open(file_path, "rb") as file:
+        while chunk := file.read(1024**2):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
@@ -0,0 +1,176 @@
+import logging
+import pathlib
+import threading
+from typing import Any, Callable
+
+import lstrs
+
+from new_aglae_data_converter.edf import find_edf_stack
+from new_aglae_data_converter.lst.cache import ParseCache
+from new_aglae_data_converter.lst.manifest import Manifest
+from new_aglae_data_converter.lst.converter import get_lst_files, get_progress_options, write_lst_hdf5
+from new_aglae_data_converter.lst.scheduler import estimate_peak_memory
+from new_aglae_data_converter.lst.storage import StorageConfig
+
+logger = logging.getLogger(__name__)
+
+# Files parsed or waiting to be written, on top of the one being written
+PIPELINE_DEPTH = 1
+
+
+class PipelineQueue:
+    """
+    Queue between the parsing and the writing stages, bounded by a number of items
+    and by the memory they hold. The producer reserves the room of an item before
+    building it, the memory stays accounted until the consumer releases it.
+    An item larger than the memory limit is still accepted once nothing else
+    holds memory, so the pipeline can't stall on it.
+    """
+
+    def __init__(self, max_items: int, max_bytes: int | None = None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._items: list[tuple[Any, int]] = []
+        self._reserved_items = 0
+        self._used_bytes = 0
+        self._closed = False
+        self._finished = False
+        self._error: BaseException | None = None
+        self._condition = threading.Condition()
+
+    def reserve(self, size: int = 0) -> bool:
+        """
+        Wait for room in the queue and reserve it for an item of `size` bytes, added by `put`.
+        :return: False if the queue was closed, the producer must stop.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._closed or self._has_room(size))
+            if self._closed:
+                return False
+            self._reserved_items += 1
+            self._used_bytes += size
+            return True
+
+    def put(self, item: Any, size: int = 0):
+        """
+        Add an item whose room was reserved.
+        """
+        with self._condition:
+            self._items.append((item, size))
+            self._condition.notify_all()
+
+    def finish(self, error: BaseException | None = None):
+        """
+        Signal the consumer that no more items will be added.
+        :param error: Raised by `get` once the queued items are consumed.
+        """
+        with self._condition:
+            self._finished = True
+            self._error = error
+            self._condition.notify_all()
+
+    def get(self) -> tuple[Any, int] | None:
+        """
+        Wait for an item. Its memory stays accounted until `release` is called.
+        :return: The item and its size, None once the producer is finished.
+        :raises BaseException: Error the producer finished with.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._items or self._finished)
+            if not self._items:
+                if self._error is not None:
+                    raise self._error
+                return None
+            self._reserved_items -= 1
+            self._condition.notify_all()
+            return self._items.pop(0)
+
+    def release(self, size: int):
+        with self._condition:
+            self._used_bytes -= size
+            self._condition.notify_all()
+
+    def close(self):
+        """Unblock and stop the producer."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def _has_room(self, size: int) -> bool:
+        if self._reserved_items >= self.max_items:
+            return False
+        if self.max_bytes is None or self._used_bytes == 0:
+            return True
+        return self._used_bytes + size <= self.max_bytes
+
+
+def convert_lst_files_pipelined(
+    data_path: pathlib.Path,
+    output_path: pathlib.Path,
+    config: lstrs.Config,
+    progress: Callable[[pathlib.Path, int, int, int, float], None] | None = None,
+    cancel: lstrs.CancelToken | None = None,
+    memory_limit: int | None = None,
+    cache: ParseCache | None = None,
+    manifest: Manifest | None = None,
+    storage: StorageConfig | None = None,
+) -> int:
+    """
+    Parse the next lst file while the previous one is compressed and written to HDF5.
+    Parsing runs in a background thread, it releases the GIL.
+    :param memory_limit: Memory in bytes that parsed files waiting to be written,
+        and the one being written, can hold.
+    :param cache: Cache of the parsed histograms.
+    :param manifest: Manifest recording the conversions, skips the up to date files when resuming.
+    :param storage: HDF5 storage options of the datasets.
+    :return: Number of processed files.
+    """
+    paths = [data_path] if data_path.is_file() else get_lst_files(data_path)
+    if manifest is not None:
+        paths = manifest.select(paths, config)
+    queue = PipelineQueue(PIPELINE_DEPTH, memory_limit)
+
+    def parse_files():
+        error = None
+        try:
+            for lst_file in paths:
+                size = 0
+                if memory_limit is not None:
+                    size = estimate_peak_memory(lstrs.probe_lst(str(lst_file.absolute()), config), streaming=False)
+                # Wait for the memory of the parsed histograms before allocating it
+                if not queue.reserve(size):
+                    return
+                edf_stacks = find_edf_stack(config.edf, lst_file) if config.edf is not None else []
+
+                logger.info("Reading from: %s" % lst_file)
+                progress_options = get_progress_options(lst_file, progress, cancel)
+                if cache is not None:
+                    result = cache.parse_lst(lst_file, config, **progress_options)
+                else:
+                    result = lstrs.parse_lst(str(lst_file.absolute()), config, **progress_options)
+                queue.put((lst_file, result, edf_stacks), size)
+        except BaseException as parsing_error:
+            # Raised again in the writing thread
+            error = parsing_error
+        finally:
+            queue.finish(error)
+
+    parser_thread = threading.Thread(target=parse_files, name="lst-parser", daemon=True)
+    parser_thread.start()
+
+    processed_files_num = 0
+    try:
+        while (item := queue.get()) is not None:
+            (lst_file, result, edf_stacks), size = item
+            output_file = write_lst_hdf5(result, edf_stacks, lst_file, output_path, storage)
+            if manifest is not None:
+                manifest.record(lst_file, config, output_file)
+            # Drop the parsed data before waiting for the next file
+            del item, result, edf_stacks
+            queue.release(size)
+            processed_files_num += 1
+    finally:
+        queue.close()
+        parser_thread.join()
+
+    return processed_files_num
@@ -0,0 +1,57 @@
+import logging
+import pathlib
+
+import lstrs
+
+from new_aglae_data_converter.lst.converter import get_lst_files
+from new_aglae_data_converter.lst.scheduler import probe_lst_files
+
+logger = logging.getLogger(__name__)
+
+# Parsing throughput used to estimate the conversion time, in bytes per second.
+# Conservative value for a single parsing thread reading from a network share.
+PARSING_THROUGHPUT = 100 * 1024**2
+
+
+def plan_lst_conversion(data_path: pathlib.Path, config: lstrs.Config) -> list[tuple[pathlib.Path, lstrs.LSTProbe]]:
+    """
+    Read the header of the lst files to convert, without parsing their events.
+    :param data_path: Lst file or folder containing the lst files.
+    :return: List of lst files with their probe.
+    """
+    paths = [data_path] if data_path.is_file() else get_lst_files(data_path)
+    return probe_lst_files(paths, config)
+
+
+def print_lst_plan(data_path: pathlib.Path, config: lstrs.Config):
+    """
+    Print the memory and time needed to convert the lst files, one line per file.
+    """
+    plan = plan_lst_conversion(data_path, config)
+
+    print(f"{'File':<50} {'Size':>10} {'Map':>11} {'Memory':>10} {'Time':>9}")
+    for lst_file, probe in plan:
+        print(
+            f"{lst_file.name:<50} {format_bytes(probe.file_size):>10} "
+            f"{f'{probe.max_x}x{probe.max_y}':>11} {format_bytes(probe.total_bytes):>10} "
+            f"{probe.file_size / PARSING_THROUGHPUT:>8.0f}s"
+        )
+        for name, dataset_bytes in sorted(probe.dataset_bytes.items()):
+            print(f"  {name:<48} {format_bytes(dataset_bytes):>34}")
+
+    if plan:
+        largest_file, largest_probe = max(plan, key=lambda item: item[1].total_bytes)
+        total_size = sum(probe.file_size for _, probe in plan)
+        print(
+            f"{len(plan)} files, {format_bytes(total_size)} to parse in about "
+            f"{total_size / PARSING_THROUGHPUT:.0f}s. Largest memory need: "
+            f"{format_bytes(largest_probe.total_bytes)} ({largest_file.name})"
+        )
+
+
+def format_bytes(size: int) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}" if unit != "B" else f"{size} {unit}"
+        size /= 1024
+    return f"{size:.1f} TiB"
@@ -0,0 +1,131 @@
+import functools
+import logging
+import logging.handlers
+import multiprocessing
+import pathlib
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+
+import lstrs
+
+from new_aglae_data_converter.config import parse_config
+from new_aglae_data_converter.lst.cache import ParseCache
+from new_aglae_data_converter.lst.manifest import Manifest
+from new_aglae_data_converter.lst.converter import convert_lst_file, get_lst_files
+from new_aglae_data_converter.lst.scheduler import MemoryScheduler, probe_lst_files
+from new_aglae_data_converter.lst.storage import StorageConfig
+
+logger = logging.getLogger(__name__)
+
+# Files submitted to the pool per worker, so the workers don't wait on the main process
+QUEUED_FILES_PER_WORKER = 2
+
+
+def convert_lst_files_in_pool(
+    data_path: pathlib.Path,
+    output_path: pathlib.Path,
+    config: lstrs.Config,
+    config_path: pathlib.Path,
+    jobs: int,
+    streaming: bool = False,
+    memory_budget: int | None = None,
+    cache: ParseCache | None = None,
+    manifest: Manifest | None = None,
+    storage: StorageConfig | None = None,
+) -> int:
+    """
+    Convert lst files in `jobs` worker processes, each one parsing and writing its own files.
+    A failing file is logged and doesn't stop the conversion of the others.
+    :param config: Parsed config, used to probe the files when a memory budget is given.
+    :param config_path: Path of `config`, parsed again by the workers.
+    :param cache: Cache of the parsed histograms, shared by the workers.
+    :param manifest: Manifest recording the conversions, skips the up to date files when resuming.
+    :param storage: HDF5 storage options of the datasets.
+    :return: Number of successfully processed files.
+    """
+    paths = [data_path] if data_path.is_file() else get_lst_files(data_path)
+    if manifest is not None:
+        paths = manifest.select(paths, config)
+    convert = functools.partial(
+        convert_lst_file_in_worker,
+        output_path=output_path,
+        config_path=config_path,
+        cache=cache,
+        manifest=manifest,
+        storage=storage,
+    )
+
+    # Forward the records logged by the workers to the handlers of this process
+    log_queue = multiprocessing.Queue()
+    listener = logging.handlers.QueueListener(log_queue, *logging.getLogger().handlers, respect_handler_level=True)
+    listener.start()
+    try:
+        with ProcessPoolExecutor(
+            max_workers=jobs, initializer=init_worker, initargs=(log_queue, logging.getLogger().level)
+        ) as executor:
+            if memory_budget is not None:
+                probes = probe_lst_files(paths, config)
+                scheduler = MemoryScheduler(memory_budget, max_workers=jobs)
+                results = scheduler.run(probes, convert, streaming=streaming, executor=executor)
+            else:
+                results = []
+                pending: set[Future] = set()
+                for lst_file in paths:
+                    if len(pending) >= jobs * QUEUED_FILES_PER_WORKER:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        results.extend(future.result() for future in done)
+                    pending.add(executor.submit(convert, lst_file, streaming))
+                results.extend(future.result() for future in wait(pending).done)
+    finally:
+        listener.stop()
+
+    failures = [(lst_file, error) for lst_file, error in results if error is not None]
+    for lst_file, error in failures:
+        logger.error("Couldn't convert %s: %s", lst_file, error)
+    processed_files_num = len(results) - len(failures)
+    logger.info("%s files processed, %s failed.", processed_files_num, len(failures))
+    return processed_files_num
+
+
+def init_worker(log_queue: multiprocessing.Queue, log_level: int):
+    root_logger = logging.getLogger()
+    root_logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+    root_logger.setLevel(log_level)
+
+
+@functools.cache
+def get_worker_config(config_path: pathlib.Path) -> lstrs.Config:
+    return parse_config(config_path)
+
+
+def convert_lst_file_in_worker(
+    lst_file: pathlib.Path,
+    streaming: bool,
+    output_path: pathlib.Path,
+    config_path: pathlib.Path,
+    cache: ParseCache | None = None,
+    manifest: Manifest | None = None,
+    storage: StorageConfig | None = None,
+) -> tuple[pathlib.Path, str | None]:
+    """
+    Convert a lst file in a worker process.
+    :return: The lst file and the error message if its conversion failed.
+    """
+    try:
+        config = get_worker_config(config_path)
+        convert_lst_file(
+            lst_file,
+            output_path,
+            config,
+            streaming,
+            progress_bar=False,
+            cache=cache,
+            manifest=manifest,
+            storage=storage,
+        )
+    except (KeyboardInterrupt, SystemExit):
+        raise
+    except BaseException as error:
+        # A panic in lstrs raises a PanicException, which isn't an Exception.
+        # Exceptions raised by lstrs can't always be pickled, send their message only
+        return lst_file, f"{type(error).__name__}: {error}"
+    return lst_file, None
@@ -0,0 +1,209 @@
+import contextlib
+import ctypes
+import logging
+import os
+import pathlib
+import sys
+import threading
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Any, Callable, Iterable
+
+import lstrs
+
+logger = logging.getLogger(__name__)
+
+# Map rows kept in memory by the streaming writer, see lstrs.parse_lst_to_hdf5
+STREAMING_BAND_ROWS = 4
+
+# Fraction of the available memory used when the budget is "auto"
+AUTO_BUDGET_RATIO = 0.8
+
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+def parse_memory_budget(value: str) -> int:
+    """
+    Parse a memory budget given as "auto" or as a size, see `parse_size`.
+    """
+    if value.strip().lower() == "auto":
+        available_memory = get_available_memory()
+        if available_memory is None:
+            raise ValueError(
+                f"Couldn't read the available memory on {sys.platform}, give the memory budget explicitly, e.g. '16G'."
+            )
+        return int(available_memory * AUTO_BUDGET_RATIO)
+    return parse_size(value)
+
+
+def parse_size(value: str) -> int:
+    """
+    Parse a number of bytes with an optional K, M, G or T suffix, e.g. "512M" or "16G".
+    """
+    value = value.strip().upper().removesuffix("IB").removesuffix("B")
+    unit = value[-1:] if value[-1:] in SIZE_UNITS else ""
+    number = value.removesuffix(unit) if unit else value
+    try:
+        size = int(float(number) * SIZE_UNITS[unit])
+    except ValueError:
+        raise ValueError(f"Invalid size: {value}")
+    if size <= 0:
+        raise ValueError("Size must be positive")
+    return size
+
+
+def get_available_memory() -> int | None:
+    """
+    Get the memory available to this process, taking the cgroup limit into account.
+    :return: Available memory in bytes, None if it couldn't be read.
+    """
+    if sys.platform == "win32":
+        candidates = [read_windows_available()]
+    else:
+        candidates = [read_meminfo_available(), read_cgroup_available()]
+
+    candidates = [candidate for candidate in candidates if candidate is not None]
+    return min(candidates) if candidates else None
+
+
+def read_meminfo_available() -> int | None:
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def read_windows_available() -> int | None:
+    class MEMORYSTATUSEX(ctypes.Structure):
+        _fields_ = [
+            ("dwLength", ctypes.c_ulong),
+            ("dwMemoryLoad", ctypes.c_ulong),
+            ("ullTotalPhys", ctypes.c_ulonglong),
+            ("ullAvailPhys", ctypes.c_ulonglong),
+            ("ullTotalPageFile", ctypes.c_ulonglong),
+            ("ullAvailPageFile", ctypes.c_ulonglong),
+            ("ullTotalVirtual", ctypes.c_ulonglong),
+            ("ullAvailVirtual", ctypes.c_ulonglong),
+            ("ullAvailExtendedVirtual", ctypes.c_ulonglong),
+        ]
+
+    status = MEMORYSTATUSEX()
+    status.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+    try:
+        if not ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return None
+    except (AttributeError, OSError):
+        return None
+    return status.ullAvailPhys or None
+
+
+def read_cgroup_available() -> int | None:
+    # cgroup v2, then v1
+    for limit_path, usage_path in (
+        ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current"),
+        ("/sys/fs/cgroup/memory/memory.limit_in_bytes", "/sys/fs/cgroup/memory/memory.usage_in_bytes"),
+    ):
+        try:
+            limit = pathlib.Path(limit_path).read_text().strip()
+            usage = pathlib.Path(usage_path).read_text().strip()
+        except OSError:
+            continue
+        if limit == "max" or int(limit) >= 1 << 60:
+            # No limit set
+            return None
+        return max(int(limit) - int(usage), 0)
+    return None
+
+
+def probe_lst_files(
+    lst_files: Iterable[pathlib.Path], config: lstrs.Config
+) -> list[tuple[pathlib.Path, lstrs.LSTProbe]]:
+    """
+    Read the header of the lst files. The files whose header can't be read are logged and left out.
+    :return: List of lst files with their probe.
+    """
+    probes = []
+    for lst_file in lst_files:
+        try:
+            probes.append((lst_file, lstrs.probe_lst(str(lst_file.absolute()), config)))
+        except Exception as error:
+            logger.error("Couldn't probe %s: %s", lst_file, error)
+    return probes
+
+
+def estimate_peak_memory(probe: lstrs.LSTProbe, streaming: bool) -> int:
+    """
+    Estimate the memory needed to convert a lst file from its header.
+    Dense parsing holds every histogram of the map, streaming only a band of rows.
+    """
+    if not streaming:
+        return probe.total_bytes
+    band_rows = min(STREAMING_BAND_ROWS + 1, max(probe.max_y, 1))
+    return probe.total_bytes * band_rows // max(probe.max_y, 1)
+
+
+class MemoryScheduler:
+    """
+    Run lst conversions concurrently, as long as their estimated memory fits in the budget.
+    Files needing more than the whole budget are converted afterwards with the streaming writer.
+    """
+
+    def __init__(self, memory_budget: int, max_workers: int | None = None):
+        self.memory_budget = memory_budget
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._used_memory = 0
+        self._condition = threading.Condition()
+
+    def run(
+        self,
+        jobs: list[tuple[pathlib.Path, lstrs.LSTProbe]],
+        convert: Callable[[pathlib.Path, bool], Any],
+        streaming: bool = False,
+        executor: Executor | None = None,
+    ) -> list[Any]:
+        """
+        Convert the lst files of `jobs`, largest first.
+        :param convert: Called with the lst file and whether the streaming writer must be used.
+        :param executor: Executor running `convert`, a thread pool of `max_workers` by default.
+        :return: Values returned by `convert`.
+        :raises Exception: First error raised by `convert`.
+        """
+        scheduled: list[tuple[pathlib.Path, int, bool]] = []
+        low_memory: list[tuple[pathlib.Path, int]] = []
+        for lst_file, probe in jobs:
+            footprint = estimate_peak_memory(probe, streaming)
+            if footprint > self.memory_budget and not streaming:
+                # Won't ever fit with dense parsing, use the streaming writer instead
+                logger.info("%s needs about %s bytes, converting it in low-memory mode.", lst_file, footprint)
+                low_memory.append((lst_file, estimate_peak_memory(probe, True)))
+            else:
+                scheduled.append((lst_file, min(footprint, self.memory_budget), streaming))
+        scheduled.sort(key=lambda job: job[1], reverse=True)
+        # Low-memory jobs run once the others are done, their estimate is only a lower bound
+        scheduled.extend((lst_file, self.memory_budget, True) for lst_file, _ in low_memory)
+
+        futures: list[Future] = []
+        with contextlib.ExitStack() as stack:
+            if executor is None:
+                executor = stack.enter_context(ThreadPoolExecutor(max_workers=self.max_workers))
+            for lst_file, footprint, use_streaming in scheduled:
+                self._reserve(footprint)
+                future = executor.submit(convert, lst_file, use_streaming)
+                future.add_done_callback(lambda _, footprint=footprint: self._release(footprint))
+                futures.append(future)
+
+            # Raise the first error, as a sequential conversion would
+            return [future.result() for future in futures]
+
+    def _reserve(self, footprint: int):
+        with self._condition:
+            self._condition.wait_for(lambda: self._used_memory + footprint <= self.memory_budget)
+            self._used_memory += footprint
+
+    def _release(self, footprint: int):
+        with self._condition:
+            self._used_memory -= footprint
+            self._condition.notify_all()
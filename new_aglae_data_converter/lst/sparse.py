@@ -0,0 +1,135 @@
+import logging
+from typing import Any
+
+import h5py
+import numpy as np
+
+from new_aglae_data_converter.lst.storage import convert_counts
+
+logger = logging.getLogger(__name__)
+
+# Value of the `layout` attribute of a sparse dataset group
+SPARSE_LAYOUT = "csr"
+
+# Entries of a sparse dataset read at once when scanning all of them
+READ_BLOCK_SIZE = 1 << 20
+
+
+def write_sparse_dataset(
+    group: h5py.Group,
+    name: str,
+    data: np.ndarray,
+    filter_kwargs: dict[str, Any] | None = None,
+    dtype: np.dtype | None = None,
+) -> h5py.Group:
+    """
+    Write a (y, x, channel) histogram as a group of CSR datasets, with a row per pixel:
+    - `indptr`: the entries of the pixel `y * x_size + x` are `indptr[pixel]:indptr[pixel + 1]`,
+    - `channel`: channel of every entry,
+    - `counts`: counts of every entry.
+    Only the non-empty channels are stored. The `shape` attribute holds the dense shape.
+    :param filter_kwargs: Compression keyword arguments of h5py.Group.create_dataset.
+    :param dtype: Type of the stored counts, the one of `data` if None, see `convert_counts`.
+    """
+    filter_kwargs = filter_kwargs or {}
+    shape = data.shape
+    pixels = data.reshape(-1, shape[-1])
+
+    pixel_indices, channels = np.nonzero(pixels)
+    indptr = np.zeros(pixels.shape[0] + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pixel_indices, minlength=pixels.shape[0]), out=indptr[1:])
+    channel_dtype = np.uint16 if shape[-1] <= np.iinfo(np.uint16).max + 1 else np.uint32
+
+    sparse_group = group.create_group(name)
+    sparse_group.attrs["layout"] = SPARSE_LAYOUT
+    sparse_group.attrs["shape"] = np.array(shape, dtype=np.int64)
+    for dataset_name, values in (
+        ("indptr", indptr),
+        ("channel", channels.astype(channel_dtype)),
+        ("counts", convert_counts(pixels[pixel_indices, channels], dtype or data.dtype)),
+    ):
+        kwargs = filter_kwargs if values.size else {}
+        sparse_group.create_dataset(dataset_name, data=values, **kwargs)
+
+    logger.debug("%s: %s non-empty channels out of %s", name, channels.size, pixels.size)
+    return sparse_group
+
+
+def is_sparse_dataset(item: h5py.Group | h5py.Dataset) -> bool:
+    return isinstance(item, h5py.Group) and item.attrs.get("layout") == SPARSE_LAYOUT
+
+
+class SparseDataset:
+    """
+    Reader of a dataset written by `write_sparse_dataset`.
+    Reading a spectrum only reads the entries of its pixel.
+    """
+
+    def __init__(self, group: h5py.Group):
+        if not is_sparse_dataset(group):
+            raise ValueError(f"{group.name} is not a sparse dataset")
+        self.group = group
+        self.shape: tuple[int, ...] = tuple(int(length) for length in group.attrs["shape"])
+        self.indptr = group["indptr"]
+        self.channel = group["channel"]
+        self.counts = group["counts"]
+
+    @property
+    def attrs(self) -> h5py.AttributeManager:
+        return self.group.attrs
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.counts.dtype
+
+    def spectrum(self, y: int, x: int) -> np.ndarray:
+        """
+        Get the spectrum of the pixel (y, x).
+        """
+        pixel = y * self.shape[1] + x
+        start, stop = self.indptr[pixel : pixel + 2]
+        spectrum = np.zeros(self.shape[-1], dtype=self.dtype)
+        if stop > start:
+            spectrum[self.channel[start:stop]] = self.counts[start:stop]
+        return spectrum
+
+    def channel_map(self, start: int, stop: int) -> np.ndarray:
+        """
+        Get the (y, x) map of the counts summed over the channels `start:stop`.
+        """
+        indptr = self.indptr[()]
+        counts = np.zeros(len(indptr) - 1, dtype=np.uint64)
+        for entries in self._iter_blocks():
+            channel = self.channel[entries]
+            selected = np.flatnonzero((channel >= start) & (channel < stop))
+            if selected.size == 0:
+                continue
+            pixels = np.searchsorted(indptr, selected + entries.start, side="right") - 1
+            block_counts = np.bincount(pixels, weights=self.counts[entries][selected], minlength=counts.size)
+            counts += block_counts.astype(np.uint64)
+        return counts.reshape(self.shape[:-1])
+
+    def to_dense(self) -> np.ndarray:
+        """
+        Get the dense (y, x, channel) array.
+        """
+        indptr = self.indptr[()]
+        dense = np.zeros((len(indptr) - 1, self.shape[-1]), dtype=self.dtype)
+        for entries in self._iter_blocks():
+            pixels = np.searchsorted(indptr, np.arange(entries.start, entries.stop), side="right") - 1
+            dense[pixels, self.channel[entries]] = self.counts[entries]
+        return dense.reshape(self.shape)
+
+    def _iter_blocks(self):
+        size = self.channel.shape[0]
+        for start in range(0, size, READ_BLOCK_SIZE):
+            yield slice(start, min(start + READ_BLOCK_SIZE, size))
+
+
+def read_dataset(item: h5py.Group | h5py.Dataset) -> np.ndarray:
+    """
+    Read a lst dataset as a dense array, whatever its layout.
+    """
+    if is_sparse_dataset(item):
+        return SparseDataset(item).to_dense()
+    return item[()]
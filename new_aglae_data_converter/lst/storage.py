@@ -0,0 +1,196 @@
+import dataclasses
+import logging
+import os
+from typing import Any
+
+import numpy as np
+
+from new_aglae_data_converter.lst.scheduler import parse_size
+
+try:
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
+
+logger = logging.getLogger(__name__)
+
+# Bytes of a default chunk, made of the full spectra of consecutive pixels of a row
+CHUNK_BYTES = 1024**2
+
+# Filters provided by hdf5plugin
+PLUGIN_FILTERS = ("lz4", "zstd", "blosc_lz4", "blosc_zstd")
+FILTERS = ("gzip", "lzf", *PLUGIN_FILTERS)
+
+LAYOUTS = ("dense", "sparse")
+
+OPTION_KEYS = {"layout", "dtype", "chunks", "compression", "level", "shuffle", "chunk_cache"}
+
+
+@dataclasses.dataclass(frozen=True)
+class StorageOptions:
+    """
+    HDF5 storage of a (y, x, channel) dataset.
+    :param layout: "dense" for a (y, x, channel) dataset, or "sparse" for a group of CSR
+        datasets holding the non-empty channels of every pixel, see `write_sparse_dataset`.
+    :param dtype: Integer type the counts are stored as. With "uint32", the type of the parsed
+        counts, they are written without a converted copy.
+    :param chunks: Chunk shape, None for the full axis, e.g. (1, 16, None).
+        By default a chunk holds the full spectra of consecutive pixels of a row,
+        so reading the spectrum of a pixel decompresses a single chunk.
+    :param compression: One of FILTERS, or None for uncompressed datasets.
+    :param level: Compression level, the filter default if None.
+    :param shuffle: Apply the byte shuffle filter before compressing.
+    :param chunk_cache: Size in bytes of the chunk cache used while writing, the HDF5 default if None.
+    """
+
+    layout: str = "dense"
+    dtype: str = "int32"
+    chunks: tuple[int | None, int | None, int | None] | None = None
+    compression: str | None = "gzip"
+    level: int | None = 4
+    shuffle: bool = False
+    chunk_cache: int | None = None
+
+    def get_chunks(self, shape: tuple[int, ...], itemsize: int) -> tuple[int, ...]:
+        if self.chunks is None:
+            channels = max(shape[-1], 1)
+            pixels = CHUNK_BYTES // (channels * itemsize)
+            return (1,) * (len(shape) - 2) + (min(max(pixels, 1), max(shape[-2], 1)), channels)
+        return tuple(max(min(size or length, length), 1) for size, length in zip(self.chunks, shape))
+
+    def get_dataset_kwargs(self, shape: tuple[int, ...], itemsize: int) -> dict[str, Any]:
+        """
+        Get the keyword arguments of h5py.Group.create_dataset for a dataset of `shape`.
+        """
+        kwargs: dict[str, Any] = {"chunks": self.get_chunks(shape, itemsize)}
+        if self.chunk_cache is not None:
+            kwargs["rdcc_nbytes"] = self.chunk_cache
+        kwargs.update(self.get_filter_kwargs())
+        return kwargs
+
+    def get_filter_kwargs(self) -> dict[str, Any]:
+        """
+        Get the compression keyword arguments of h5py.Group.create_dataset.
+        """
+        kwargs: dict[str, Any] = {}
+        if self.compression == "gzip":
+            kwargs.update(compression="gzip", compression_opts=self.level)
+        elif self.compression == "lzf":
+            kwargs["compression"] = "lzf"
+        elif self.compression in PLUGIN_FILTERS:
+            kwargs.update(get_plugin_filter(self.compression, self.level, self.shuffle))
+
+        # Blosc shuffles the bytes itself
+        if self.shuffle and not (self.compression or "").startswith("blosc"):
+            kwargs["shuffle"] = True
+        return kwargs
+
+
+@dataclasses.dataclass(frozen=True)
+class StorageConfig:
+    """
+    Storage options of the lst datasets, with overrides by dataset name.
+    :param threads: Number of threads compressing the gzip chunks, all the cores if None.
+    """
+
+    default: StorageOptions = StorageOptions()
+    datasets: dict[str, StorageOptions] = dataclasses.field(default_factory=dict)
+    threads: int | None = None
+
+    def get(self, name: str) -> StorageOptions:
+        return self.datasets.get(name, self.default)
+
+    def get_threads(self) -> int:
+        return self.threads or os.cpu_count() or 1
+
+
+def parse_storage_config(config: dict[str, Any]) -> StorageConfig:
+    """
+    Parse the `storage` section of the config file. Its options apply to every dataset,
+    and the ones under `datasets` override them for the datasets of that name.
+    `threads` is the number of threads compressing the datasets.
+    """
+    datasets_config = config.get("datasets") or {}
+    threads = config.get("threads")
+    if threads is not None and threads < 1:
+        raise ValueError("The number of compression threads must be positive")
+
+    default = parse_storage_options({key: value for key, value in config.items() if key not in ("datasets", "threads")})
+    datasets = {name: parse_storage_options(options, default) for name, options in datasets_config.items()}
+    return StorageConfig(default, datasets, threads)
+
+
+def parse_storage_options(config: dict[str, Any], base: StorageOptions = StorageOptions()) -> StorageOptions:
+    unknown_keys = set(config) - OPTION_KEYS
+    if unknown_keys:
+        raise ValueError(f"Unknown storage options: {', '.join(sorted(unknown_keys))}")
+
+    options: dict[str, Any] = {}
+    if "layout" in config:
+        if config["layout"] not in LAYOUTS:
+            raise ValueError(f"Unknown layout: {config['layout']}, expected one of {', '.join(LAYOUTS)}")
+        options["layout"] = config["layout"]
+    if "dtype" in config:
+        dtype = config["dtype"]
+        if dtype is None or np.dtype(dtype).kind not in "iu":
+            raise ValueError(f"Invalid dtype: {dtype}, expected an integer type")
+        options["dtype"] = dtype
+    if "chunks" in config:
+        chunks = config["chunks"]
+        if chunks is not None and (len(chunks) != 3 or any(size is not None and size < 1 for size in chunks)):
+            raise ValueError(f"Invalid chunk shape: {chunks}, expected [y, x, channel]")
+        options["chunks"] = tuple(chunks) if chunks is not None else None
+    if "compression" in config:
+        compression = config["compression"]
+        if compression is not None and compression not in FILTERS:
+            raise ValueError(f"Unknown compression: {compression}, expected one of {', '.join(FILTERS)}")
+        if compression in PLUGIN_FILTERS and hdf5plugin is None:
+            raise ValueError(f"The {compression} compression needs the hdf5plugin package")
+        options["compression"] = compression
+        # The level of another filter doesn't carry over
+        options["level"] = None
+    if "level" in config:
+        options["level"] = config["level"]
+    if "shuffle" in config:
+        options["shuffle"] = bool(config["shuffle"])
+    if "chunk_cache" in config:
+        chunk_cache = config["chunk_cache"]
+        options["chunk_cache"] = parse_size(str(chunk_cache)) if chunk_cache is not None else None
+
+    return dataclasses.replace(base, **options)
+
+
+def convert_counts(data: np.ndarray, dtype: np.dtype) -> np.ndarray:
+    """
+    Convert counts to the stored integer type. Counts out of its range are clipped to it,
+    so a type narrower than the parsed one saturates instead of wrapping around.
+    :return: `data` itself if it already has that type, a converted copy otherwise.
+    """
+    dtype = np.dtype(dtype)
+    if data.dtype == dtype:
+        return data
+    # Converted in a single pass into the copy, clipped only if some counts are out of range
+    converted = np.empty(data.shape, dtype=dtype)
+    source_info, target_info = np.iinfo(data.dtype), np.iinfo(dtype)
+    if data.size and (
+        (source_info.max > target_info.max and data.max() > target_info.max)
+        or (source_info.min < target_info.min and data.min() < target_info.min)
+    ):
+        np.clip(data, max(source_info.min, target_info.min), target_info.max, out=converted, casting="unsafe")
+    else:
+        np.copyto(converted, data, casting="unsafe")
+    return converted
+
+
+def get_plugin_filter(compression: str, level: int | None, shuffle: bool) -> dict[str, Any]:
+    """
+    Get the create_dataset keyword arguments of a hdf5plugin filter.
+    """
+    if compression == "lz4":
+        return dict(hdf5plugin.LZ4())
+    if compression == "zstd":
+        return dict(hdf5plugin.Zstd() if level is None else hdf5plugin.Zstd(clevel=level))
+
+    blosc_shuffle = hdf5plugin.Blosc.SHUFFLE if shuffle else hdf5plugin.Blosc.NOSHUFFLE
+    cname = compression.removeprefix("blosc_")
+    return dict(hdf5plugin.Blosc(cname=cname, clevel=5 if level is None else level, shuffle=blosc_shuffle))
@@ -44,16 +44,112 @@ if __name__ == "__main__":
         help="Path to config file for LST parsing.",
         required=False,
     )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Write the LST maps to HDF5 row by row while parsing, for maps too large for memory.",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=str,
+        help="Convert several LST files at once within this memory, e.g. '16G' or 'auto'. "
+        "Files too large for the budget are streamed.",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="Number of processes converting LST files (default: 1).",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="Parse the next LST file while the previous one is compressed and written.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=pathlib.Path,
+        help="Directory caching the parsed LST histograms, reused while the LST file and detector config don't change.",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=str,
+        default="20G",
+        help="Size of the LST cache directory, least recently used entries are evicted (default: 20G).",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip the LST files already converted with the same input, config and converter version.",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="Print the memory and time needed to convert the LST files of the data path, without converting them.",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and convert the files written to the data path once they stop changing.",
+    )
+    parser.add_argument(
+        "--settle-time",
+        type=float,
+        default=30.0,
+        help="Seconds a file must stay unchanged before being converted in watch mode (default: 30).",
+    )
     parser.add_argument("--log", default="INFO", help="Log level (default: INFO)")
 
     args = parser.parse_args()
+    if args.pipeline and (args.streaming or args.jobs > 1):
+        parser.error("--pipeline can't be combined with --streaming or --jobs")
+    if args.watch and args.output_path is None:
+        parser.error("--watch needs an --output-path")
 
     # Setup logger
     numeric_level = getattr(logging, args.log.upper(), None)
     logging.basicConfig(level=numeric_level)
 
-    if args.extraction_types and args.data_path:
+    if args.plan and args.data_path:
+        from converter import get_config
+        from lst.plan import print_lst_plan
+
+        print_lst_plan(args.data_path, get_config(args.config))
+    elif args.watch and args.extraction_types and args.data_path:
+        from converter import get_config, get_storage_config
+        from lst.cache import ParseCache
+        from lst.scheduler import parse_size
+        from watch import watch
+
+        ignored_options = [
+            option
+            for option, is_set in (
+                ("--memory-budget", args.memory_budget is not None),
+                ("--jobs", args.jobs > 1),
+                ("--pipeline", args.pipeline),
+            )
+            if is_set
+        ]
+        if ignored_options:
+            logger.warning(
+                "%s ignored in watch mode, the files are converted one at a time.", ", ".join(ignored_options)
+            )
+
+        watch(
+            extraction_types=tuple(ExtractionType[ext_type.upper()] for ext_type in args.extraction_types),
+            data_path=args.data_path,
+            output_path=args.output_path,
+            config=get_config(args.config),
+            settle_time=args.settle_time,
+            lst_streaming=args.streaming,
+            lst_cache=ParseCache(args.cache_dir, parse_size(args.cache_size)) if args.cache_dir else None,
+            lst_storage=get_storage_config(args.config),
+        )
+    elif args.extraction_types and args.data_path:
         from converter import convert
+        from lst.cache import ParseCache
+        from lst.scheduler import parse_memory_budget, parse_size
 
         logger.debug(f"Args: {args}")
         processed_files_cnt = convert(
@@ -61,6 +157,12 @@ if __name__ == "__main__":
             data_path=args.data_path,
             output_path=args.output_path,
             config_path=args.config,
+            lst_streaming=args.streaming,
+            lst_memory_budget=parse_memory_budget(args.memory_budget) if args.memory_budget else None,
+            lst_jobs=args.jobs,
+            lst_pipeline=args.pipeline,
+            lst_cache=ParseCache(args.cache_dir, parse_size(args.cache_size)) if args.cache_dir else None,
+            lst_resume=args.resume,
         )
         logger.debug("Processed %s files.", processed_files_cnt)
     else:
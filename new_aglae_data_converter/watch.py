@@ -0,0 +1,160 @@
+import logging
+import os
+import pathlib
+import time
+
+import lstrs
+from enums import ExtractionType
+from globals.converter import get_global_file_extensions, insert_global_files_in_hdf5
+from lst.cache import ParseCache
+from lst.converter import convert_lst_file
+from lst.manifest import Manifest
+from lst.storage import StorageConfig
+
+logger = logging.getLogger(__name__)
+
+
+class FolderWatcher:
+    """
+    Poll a folder for new or modified files, and report them once their size
+    and modification time haven't changed for `settle_time` seconds.
+    """
+
+    def __init__(self, folder: pathlib.Path, extensions: set[str], settle_time: float):
+        self.folder = folder
+        self.extensions = extensions
+        self.settle_time = settle_time
+        # Size and modification time of the files, with the time they were last seen changing
+        self._files: dict[pathlib.Path, tuple[tuple[int, int], float]] = {}
+        self._reported: dict[pathlib.Path, tuple[int, int]] = {}
+
+    def poll(self) -> tuple[list[pathlib.Path], set[pathlib.Path]]:
+        """
+        Scan the folder.
+        :return: Files that settled since the last call, and files still changing.
+        """
+        now = time.monotonic()
+        files: dict[pathlib.Path, tuple[tuple[int, int], float]] = {}
+        for path, signature in self._scan(self.folder):
+            previous = self._files.get(path)
+            changed_at = previous[1] if previous is not None and previous[0] == signature else now
+            files[path] = (signature, changed_at)
+        self._files = files
+
+        settled_files = []
+        changing_files = set()
+        for path, (signature, changed_at) in files.items():
+            if now - changed_at < self.settle_time:
+                changing_files.add(path)
+            elif self._reported.get(path) != signature:
+                settled_files.append(path)
+        return sorted(settled_files), changing_files
+
+    def mark_done(self, path: pathlib.Path):
+        """Don't report `path` again until it changes."""
+        signature, _ = self._files[path]
+        self._reported[path] = signature
+
+    def _scan(self, folder: pathlib.Path):
+        try:
+            entries = list(os.scandir(folder))
+        except OSError as error:
+            logger.warning("Couldn't scan %s: %s", folder, error)
+            return
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from self._scan(pathlib.Path(entry.path))
+            elif pathlib.Path(entry.name).suffix[1:] in self.extensions:
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                yield pathlib.Path(entry.path), (stat.st_size, stat.st_mtime_ns)
+
+
+def watch(
+    extraction_types: tuple[ExtractionType, ...],
+    data_path: pathlib.Path,
+    output_path: pathlib.Path,
+    config: lstrs.Config,
+    interval: float = 5.0,
+    settle_time: float = 30.0,
+    lst_streaming: bool = False,
+    lst_cache: ParseCache | None = None,
+    lst_storage: StorageConfig | None = None,
+):
+    """
+    Convert the data files of `data_path` as they are written, until interrupted.
+    LST files are converted once their EDF files stopped changing too, and converted
+    again when EDF files of theirs settle later. LST files already converted,
+    according to the manifest of `output_path`, are skipped.
+    :param interval: Seconds between two scans of `data_path`.
+    :param settle_time: Seconds a file must stay unchanged before being converted.
+    :param lst_storage: HDF5 storage options of the lst datasets.
+    """
+    global_extensions = set()
+    if ExtractionType.GLOBALS in extraction_types or ExtractionType.STANDARDS in extraction_types:
+        global_extensions = get_global_file_extensions(config)
+    lst_extensions = {"lst", "edf"} if ExtractionType.LST in extraction_types else set()
+    watcher = FolderWatcher(data_path, global_extensions | lst_extensions, settle_time)
+    manifest = Manifest(output_path, resume=True, storage=lst_storage)
+    # LST files converted or skipped so far
+    lst_files: set[pathlib.Path] = set()
+
+    def convert_lst(lst_file: pathlib.Path, force: bool = False):
+        try:
+            if force or manifest.select([lst_file], config):
+                convert_lst_file(
+                    lst_file,
+                    output_path,
+                    config,
+                    lst_streaming,
+                    cache=lst_cache,
+                    manifest=manifest,
+                    storage=lst_storage,
+                )
+        except KeyboardInterrupt:
+            raise
+        except BaseException as error:
+            # A panic in lstrs raises a PanicException, which isn't an Exception
+            logger.error("Couldn't convert %s: %s", lst_file, error)
+
+    logger.info("Watching %s, press Ctrl+C to stop.", data_path)
+    try:
+        while True:
+            settled_files, changing_files = watcher.poll()
+
+            global_files = [file for file in settled_files if file.suffix[1:] in global_extensions]
+            if global_files:
+                try:
+                    insert_global_files_in_hdf5(extraction_types, global_files, output_path)
+                except Exception as error:
+                    logger.error("Couldn't convert global files: %s", error)
+                for file in global_files:
+                    watcher.mark_done(file)
+
+            settled_lst_files = set()
+            for lst_file in (file for file in settled_files if file.suffix == ".lst"):
+                # EDF files of a map are in a folder named after the lst file
+                if any(lst_file.stem in file.parts for file in changing_files):
+                    continue
+                convert_lst(lst_file)
+                watcher.mark_done(lst_file)
+                settled_lst_files.add(lst_file)
+            lst_files.update(settled_lst_files)
+
+            # EDF files are written with their lst file. When they settle after it,
+            # the lst file was converted without them: convert it again.
+            edf_files = [file for file in settled_files if file.suffix == ".edf"]
+            for edf_file in edf_files:
+                watcher.mark_done(edf_file)
+            for lst_file in sorted(lst_files - settled_lst_files):
+                if any(lst_file.stem in file.parts for file in edf_files) and not any(
+                    lst_file.stem in file.parts for file in changing_files
+                ):
+                    logger.info("EDF files of %s changed, converting it again.", lst_file)
+                    convert_lst(lst_file, force=True)
+
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        logger.info("Stopped watching %s.", data_path)
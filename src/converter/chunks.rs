@@ -0,0 +1,458 @@
+use log::{debug, error};
+use rayon::prelude::*;
+
+use crate::converter::decoder::{EventDecoder, Hit, Hits, Position};
+use crate::converter::events::LstEvent;
+use crate::converter::histograms::HistogramSet;
+use crate::converter::progress::{Progress, PROGRESS_WORDS};
+
+/// Receiver of the hits decoded from the payload
+pub trait HitSink {
+    fn add_hit(&mut self, position: Position, hit: &Hit);
+
+    /// Called on every timer event, return false to stop the parsing
+    #[inline]
+    fn add_timer(&mut self) -> bool {
+        true
+    }
+}
+
+impl HitSink for HistogramSet {
+    #[inline]
+    fn add_hit(&mut self, position: Position, hit: &Hit) {
+        self.record(position.y as usize, position.x as usize, hit);
+    }
+}
+
+/// Lets a sink owned elsewhere be fed by several parsings
+impl<S: HitSink> HitSink for &mut S {
+    #[inline]
+    fn add_hit(&mut self, position: Position, hit: &Hit) {
+        (**self).add_hit(position, hit);
+    }
+
+    #[inline]
+    fn add_timer(&mut self) -> bool {
+        (**self).add_timer()
+    }
+}
+
+/// A hit read before the position was fully known in its chunk
+#[derive(Debug, Clone, Copy)]
+struct PendingHit {
+    hit: Hit,
+    x: Option<u16>,
+    y: Option<u16>,
+}
+
+/// Result of the parsing of a part of the [LISTDATA] payload
+pub struct ParsedChunk<S: HitSink> {
+    pub sink: S,
+    pub total_events: i32,
+    pub timer_events: u32,
+    /// Offset of the first word following the chunk, or of the event truncated by the end of the payload
+    pub end: usize,
+    /// Position at the end of the chunk, for the coordinates read in it
+    pub last_x: Option<u16>,
+    pub last_y: Option<u16>,
+    /// Hits read before both coordinates were known, resolved when merging
+    pending: Vec<PendingHit>,
+    /// Whether the parsing stopped on an event truncated by the end of the file
+    pub truncated: bool,
+}
+
+/// Parse the events of `payload` starting at `start` until the word starting at or after `end`
+/// If `start_position` is None, the position is unknown at the start of the chunk and the
+/// hits are kept pending until both coordinates are read.
+/// The parsed bytes and events are added to `progress` every `PROGRESS_WORDS` words,
+/// and the parsing stops there if it was cancelled.
+pub fn parse_chunk<S: HitSink>(
+    payload: &[u8],
+    start: usize,
+    end: usize,
+    start_position: Option<Position>,
+    decoder: &EventDecoder,
+    mut sink: S,
+    progress: &Progress,
+) -> ParsedChunk<S> {
+    let mut timer_events: u32 = 0;
+    let mut total_events = 0;
+
+    let mut hits: Hits = Default::default();
+    let mut position = start_position.unwrap_or(Position { x: 0, y: 0 });
+    let mut x_known = start_position.is_some();
+    let mut y_known = start_position.is_some();
+    let mut pending: Vec<PendingHit> = Vec::new();
+    let mut truncated = false;
+
+    let mut offset: usize = start;
+    let mut reported: usize = start;
+    let mut reported_events = 0;
+    let mut words: usize = 0;
+    // Read 4 bytes at a time
+    while offset < end && offset + 4 <= payload.len() {
+        words += 1;
+        if words % PROGRESS_WORDS == 0 {
+            progress.add((offset - reported) as u64, (total_events - reported_events) as u64);
+            reported = offset;
+            reported_events = total_events;
+            if progress.is_cancelled() {
+                debug!("Parsing cancelled at offset {}", offset);
+                break;
+            }
+        }
+
+        let event_start = offset;
+        let binary_value = u32::from_le_bytes(payload[offset..offset + 4].try_into().unwrap());
+        offset += 4;
+
+        match LstEvent::inspect(binary_value) {
+            Some(LstEvent::Timer) => {
+                timer_events += 1;
+                if !sink.add_timer() {
+                    debug!("Parsing stopped by the sink at offset {}", offset);
+                    break;
+                }
+            }
+            Some(LstEvent::Adc(has_dummy_word)) => {
+                total_events += 1;
+
+                if has_dummy_word {
+                    // Dummy word was inserted, skip 2 bytes
+                    offset += 2;
+                }
+
+                let adc_count = decoder.adc_count(binary_value);
+                let values_end = offset + adc_count * 2;
+                if values_end > payload.len() {
+                    // Reported by the callers, the end of a file still being written is expected
+                    debug!("Couldn't read ADC2 buffer size of {}: end of payload", adc_count);
+                    truncated = true;
+                    // The event isn't counted, it can be parsed again once the rest of it is written
+                    total_events -= 1;
+                    offset = event_start;
+                    break;
+                }
+
+                let nb_hits = decoder.decode(binary_value, &payload[offset..values_end], &mut position, &mut hits);
+                offset = values_end;
+
+                let (has_x, has_y) = decoder.position_adcs(binary_value);
+                x_known |= has_x;
+                y_known |= has_y;
+
+                for hit in &hits[..nb_hits] {
+                    if x_known && y_known {
+                        sink.add_hit(position, hit);
+                    } else {
+                        pending.push(PendingHit {
+                            hit: *hit,
+                            x: x_known.then_some(position.x),
+                            y: y_known.then_some(position.y),
+                        });
+                    }
+                }
+            }
+            _ => {
+                continue;
+            }
+        }
+    }
+
+    progress.add(
+        (offset.min(payload.len()) - reported.min(payload.len())) as u64,
+        (total_events - reported_events) as u64,
+    );
+
+    ParsedChunk {
+        sink,
+        total_events,
+        timer_events,
+        end: offset,
+        last_x: x_known.then_some(position.x),
+        last_y: y_known.then_some(position.y),
+        pending,
+        truncated,
+    }
+}
+
+/// Parse the whole payload on `threads` threads
+/// The payload is split at timer or synchron words, every chunk is parsed on a rayon pool
+/// and the per-chunk histograms are merged in order. A chunk start that turns out not to be
+/// a word boundary of the sequential stream is parsed again from the end of the previous chunk,
+/// so the result is identical to the sequential parsing.
+/// If `start_position` is None, the hits read before both coordinates are known are dropped.
+pub fn parse_payload(
+    payload: &[u8],
+    start_position: Option<Position>,
+    threads: usize,
+    decoder: &EventDecoder,
+    create_histograms: &(dyn Fn() -> HistogramSet + Sync),
+    progress: &Progress,
+) -> (HistogramSet, i32, u32) {
+    let starts = split_payload(payload, threads);
+    debug!("Payload split in {} chunks at {:?}", starts.len(), starts);
+
+    if starts.len() == 1 {
+        let chunk = parse_chunk(
+            payload,
+            0,
+            payload.len(),
+            start_position,
+            decoder,
+            create_histograms(),
+            progress,
+        );
+        if chunk.truncated {
+            error!("Couldn't read the last event at offset {}: end of file", chunk.end);
+        }
+        return (chunk.sink, chunk.total_events, chunk.timer_events);
+    }
+
+    let mut bounds: Vec<(usize, usize)> = Vec::new();
+    for (index, start) in starts.iter().enumerate() {
+        let end = starts.get(index + 1).copied().unwrap_or(payload.len());
+        bounds.push((*start, end));
+    }
+
+    let pool = rayon::ThreadPoolBuilder::new()
+        .num_threads(threads)
+        .build()
+        .expect("Couldn't build the parsing thread pool");
+    let chunks: Vec<ParsedChunk<HistogramSet>> = pool.install(|| {
+        bounds
+            .into_par_iter()
+            .map(|(start, end)| {
+                let start_position = if start == 0 { start_position } else { None };
+                parse_chunk(payload, start, end, start_position, decoder, create_histograms(), progress)
+            })
+            .collect()
+    });
+
+    return merge_chunks(payload, &starts, chunks, decoder, create_histograms, progress);
+}
+
+/// Merge the chunks in order, carrying the position across the chunk boundaries
+fn merge_chunks(
+    payload: &[u8],
+    starts: &[usize],
+    chunks: Vec<ParsedChunk<HistogramSet>>,
+    decoder: &EventDecoder,
+    create_histograms: &(dyn Fn() -> HistogramSet + Sync),
+    progress: &Progress,
+) -> (HistogramSet, i32, u32) {
+    let mut chunks = chunks.into_iter();
+    let first = chunks.next().expect("No chunk to merge");
+
+    let mut histograms = first.sink;
+    let mut total_events = first.total_events;
+    let mut timer_events = first.timer_events;
+    let mut previous_end = first.end;
+    let mut truncated = first.truncated;
+    let mut position = Position {
+        x: first.last_x.unwrap_or(0),
+        y: first.last_y.unwrap_or(0),
+    };
+
+    for (index, mut chunk) in chunks.enumerate() {
+        if truncated || progress.is_cancelled() {
+            // The sequential parsing stops on a truncated event
+            break;
+        }
+
+        let start = starts[index + 1];
+        if previous_end != start {
+            // The chunk start was not a word boundary: parse again from the real boundary
+            debug!("Chunk boundary {} moved to {}", start, previous_end);
+            let end = starts.get(index + 2).copied().unwrap_or(payload.len());
+            chunk = parse_chunk(payload, previous_end, end, None, decoder, create_histograms(), progress);
+        }
+
+        for pending in chunk.pending.iter() {
+            let pending_position = Position {
+                x: pending.x.unwrap_or(position.x),
+                y: pending.y.unwrap_or(position.y),
+            };
+            histograms.add_hit(pending_position, &pending.hit);
+        }
+        histograms.merge(chunk.sink);
+
+        total_events += chunk.total_events;
+        timer_events += chunk.timer_events;
+        previous_end = chunk.end;
+        truncated = chunk.truncated;
+        position = Position {
+            x: chunk.last_x.unwrap_or(position.x),
+            y: chunk.last_y.unwrap_or(position.y),
+        };
+    }
+
+    if truncated {
+        error!("Couldn't read the last event at offset {}: end of file", previous_end);
+    }
+
+    return (histograms, total_events, timer_events);
+}
+
+/// Split the payload in at most `nb_chunks` chunks
+/// Chunks start on a timer or a synchron word. Return the start offsets of the chunks.
+pub fn split_payload(payload: &[u8], nb_chunks: usize) -> Vec<usize> {
+    let mut starts: Vec<usize> = vec![0];
+
+    for index in 1..nb_chunks {
+        let target = payload.len() * index / nb_chunks;
+        // Words are aligned on 2 bytes from the start of the payload
+        let from = std::cmp::max(target - target % 2, starts[starts.len() - 1] + 2);
+        match find_resync_word(payload, from) {
+            Some(offset) => starts.push(offset),
+            None => break,
+        }
+    }
+
+    return starts;
+}
+
+/// Find the first timer or synchron word at or after `from`
+pub fn find_resync_word(payload: &[u8], from: usize) -> Option<usize> {
+    let mut offset = from;
+    while offset + 4 <= payload.len() {
+        let binary_value = u32::from_le_bytes(payload[offset..offset + 4].try_into().unwrap());
+        if let Some(LstEvent::Timer) | Some(LstEvent::Synchron) = LstEvent::inspect(binary_value) {
+            return Some(offset);
+        }
+        offset += 2;
+    }
+    return None;
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::converter::config::{ComputedDetector, Config, Detector};
+    use crate::converter::histograms::AccumulationMode;
+    use crate::converter::layout::DetectorLayout;
+    use std::collections::BTreeMap;
+
+    const TIMER: u32 = 0x40000000;
+
+    fn config() -> Config {
+        let mut detectors: BTreeMap<String, Detector> = BTreeMap::new();
+        for (name, adc, channels) in [("HE1", 1, 64), ("HE2", 2, 32)] {
+            detectors.insert(
+                name.to_string(),
+                Detector {
+                    adc,
+                    channels,
+                    file_extension: None,
+                },
+            );
+        }
+
+        let mut computed_detectors: BTreeMap<String, ComputedDetector> = BTreeMap::new();
+        computed_detectors.insert(
+            "HE12".to_string(),
+            ComputedDetector {
+                detectors: vec!["HE1".to_string(), "HE2".to_string()],
+                file_extension: None,
+            },
+        );
+
+        Config {
+            x: 256,
+            y: 512,
+            detectors,
+            computed_detectors,
+            adcs: vec![],
+            edf: None,
+        }
+    }
+
+    fn push_event(payload: &mut Vec<u8>, adcs: u32, values: &[u16]) {
+        let has_dummy_word = values.len() % 2 == 1;
+        let binary_value = if has_dummy_word { adcs | 0x80000000 } else { adcs };
+        payload.extend_from_slice(&binary_value.to_le_bytes());
+        if has_dummy_word {
+            payload.extend_from_slice(&[0, 0]);
+        }
+        for value in values {
+            payload.extend_from_slice(&value.to_le_bytes());
+        }
+    }
+
+    /// Raster scan of a 8x4 map, with y values that look like timer words once shifted
+    fn payload() -> Vec<u8> {
+        let mut payload: Vec<u8> = Vec::new();
+        for y in 0..4u16 {
+            push_event(&mut payload, 512, &[0x4000 | y]);
+            for x in 0..8u16 {
+                payload.extend_from_slice(&TIMER.to_le_bytes());
+                push_event(&mut payload, 256 | 1, &[x * 3 + y, x]);
+                push_event(&mut payload, 2, &[y * 8 + x]);
+                push_event(&mut payload, 256 | 512, &[x, 0x4000 | y]);
+                push_event(&mut payload, 1 | 2 | 256, &[x + 1, 40, x]);
+            }
+        }
+        payload
+    }
+
+    fn parse(payload: &[u8], threads: usize) -> (HistogramSet, i32, u32) {
+        let config = config();
+        let layout = DetectorLayout::new(&config, None);
+        let decoder = EventDecoder::new(&config, &layout, 8, 4);
+        let create_histograms = || HistogramSet::new(AccumulationMode::Dense, &layout, 4, 8);
+        let progress = Progress::default();
+
+        parse_payload(payload, Some(Position { x: 0, y: 0 }), threads, &decoder, &create_histograms, &progress)
+    }
+
+    #[test]
+    fn test_split_payload_on_resync_words() {
+        let payload = payload();
+        let starts = split_payload(&payload, 4);
+
+        assert_eq!(starts[0], 0);
+        assert!(starts.len() > 1);
+        for start in &starts[1..] {
+            let binary_value = u32::from_le_bytes(payload[*start..*start + 4].try_into().unwrap());
+            assert!(binary_value >> 16 == 0x4000 || binary_value == 0xFFFFFFFF);
+        }
+    }
+
+    #[test]
+    fn test_progress_counts_the_whole_payload() {
+        let payload = payload();
+        let config = config();
+        let layout = DetectorLayout::new(&config, None);
+        let decoder = EventDecoder::new(&config, &layout, 8, 4);
+        let histograms = HistogramSet::new(AccumulationMode::Dense, &layout, 4, 8);
+        let progress = Progress::default();
+
+        let chunk = parse_chunk(&payload, 0, payload.len(), None, &decoder, histograms, &progress);
+
+        assert_eq!(progress.parsed_bytes(), payload.len() as u64);
+        assert_eq!(progress.events(), chunk.total_events as u64);
+        assert!(!progress.is_cancelled());
+    }
+
+    #[test]
+    fn test_parallel_matches_sequential() {
+        let payload = payload();
+        let (sequential, total_events, timer_events) = parse(&payload, 1);
+        assert_eq!(total_events, 4 + 4 * 8 * 4);
+        assert_eq!(timer_events, 4 * 8);
+
+        for threads in [2, 3, 5, 16] {
+            let (parallel, parallel_total_events, parallel_timer_events) = parse(&payload, threads);
+
+            assert_eq!(parallel_total_events, total_events);
+            assert_eq!(parallel_timer_events, timer_events);
+            assert_eq!(sequential.histograms.len(), 3);
+            for (histogram, parallel_histogram) in sequential.histograms.iter().zip(parallel.histograms.into_iter()) {
+                assert_eq!(histogram.clone().into_dataset(), parallel_histogram.into_dataset());
+            }
+            for (stats, parallel_stats) in sequential.stats.iter().zip(parallel.stats.iter()) {
+                assert_eq!(stats.to_stats(), parallel_stats.to_stats());
+            }
+        }
+    }
+}
@@ -1,9 +1,6 @@
-use crate::converter::Array3;
 use pyo3::prelude::*;
 use std::collections::BTreeMap;
 
-use crate::converter::models::LSTDataset;
-
 #[pyclass]
 #[derive(Debug, Clone)]
 pub struct Detector {
@@ -107,47 +104,6 @@ impl Config {
         return None;
     }
 
-    pub fn create_big_dataset(&self, max_x: i64, max_y: i64) -> LSTDataset {
-        let total_max_channels = self
-            .detectors
-            .iter()
-            .fold(0, |acc, (_, detector)| acc + detector.channels);
-        Array3::zeros((max_y as usize, max_x as usize, total_max_channels as usize))
-    }
-
-    pub fn get_floor_for_detector_name(&self, detector_name: &String) -> u32 {
-        let mut floor: u32 = 0;
-        for (name, detector) in self.detectors.iter() {
-            if name == detector_name {
-                return floor;
-            }
-            floor += detector.channels;
-        }
-        return 0;
-    }
-
-    /// Get the detector name and the floor for a given ADC
-    /// If no detector is found, None is returned
-    pub fn get_detector_and_floor_for_adc(&self, adc: u32) -> Option<(&String, &Detector, u32)> {
-        let mut floor: u32 = 0;
-        for (name, detector) in self.detectors.iter() {
-            if detector.adc == adc {
-                return Some((name, detector, floor));
-            }
-            floor += detector.channels;
-        }
-        return None;
-    }
-
-    pub fn adc_exists(&self, adc: u32) -> bool {
-        for (_, detector) in self.detectors.iter() {
-            if detector.adc == adc {
-                return true;
-            }
-        }
-        return false;
-    }
-
     /// Get the maximum number of channels for a computed detector
     /// If no detectors are found, 0 is returned
     pub fn get_max_channels_for_computed_detector(&self, computed_detector_name: &String) -> u32 {
@@ -311,52 +267,4 @@ mod tests {
 
         assert_eq!(default.adcs, &[1, 2, 4, 8, 16, 32, 64, 256, 512, 1024]);
     }
-
-    #[test]
-    fn test_adc_exists() {
-        let default = default_config();
-
-        let mut adc = default.adc_exists(1);
-        assert_eq!(adc, true);
-
-        adc = default.adc_exists(2);
-        assert_eq!(adc, true);
-
-        adc = default.adc_exists(16);
-        assert_eq!(adc, true);
-
-        adc = default.adc_exists(1024);
-        assert_eq!(adc, true);
-
-        adc = default.adc_exists(12);
-        assert_eq!(adc, false);
-
-        adc = default.adc_exists(88);
-        assert_eq!(adc, false)
-    }
-
-    #[test]
-    fn test_create_big_dataset() {
-        let default = default_config();
-        let dataset = default.create_big_dataset(40, 60);
-
-        assert_eq!(dataset.shape(), &[60, 40, 18944])
-    }
-
-    #[test]
-    fn test_get_floor_for_detector_name() {
-        let default = default_config();
-
-        let mut floor: u32 = 0;
-        for (index, (name, _detector)) in default.detectors.iter().enumerate() {
-            let new_floor = default.get_floor_for_detector_name(name);
-            if index == 0 {
-                assert_eq!(new_floor, 0);
-            } else {
-                let (_name, previous_detector) = default.detectors.iter().nth(index - 1).unwrap();
-                assert_eq!(new_floor, floor + previous_detector.channels);
-            }
-            floor = new_floor;
-        }
-    }
 }
@@ -0,0 +1,231 @@
+use crate::converter::config::Config;
+use crate::converter::layout::DetectorLayout;
+
+/// Number of ADC bits in an event word
+pub const ADC_BITS: usize = 16;
+
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub struct Position {
+    pub x: u16,
+    pub y: u16,
+}
+
+/// A channel hit by an event on a detector slot of the layout
+#[derive(Debug, Clone, Copy, Default, PartialEq, Eq)]
+pub struct Hit {
+    pub slot: usize,
+    pub channel: u32,
+    /// The value was above the last channel of the detector
+    pub clamped: bool,
+}
+
+/// Stack-allocated scratch space for the hits of one event
+pub type Hits = [Hit; ADC_BITS];
+
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+enum AdcRole {
+    Ignored,
+    X,
+    Y,
+    Detector { slot: usize, max_channel: u32 },
+}
+
+/// ADC event decoder compiled once from the config and the detector layout
+///
+/// Every ADC bit of an event word is resolved through a lookup table, and the
+/// position masks are computed once, so decoding an event does not allocate.
+#[derive(Debug, Clone)]
+pub struct EventDecoder {
+    roles: [AdcRole; ADC_BITS],
+    x_mask: u16,
+    y_mask: u16,
+    /// ADC bits of the x and y positions in an event word
+    x_adc: u32,
+    y_adc: u32,
+}
+
+impl EventDecoder {
+    pub fn new(config: &Config, layout: &DetectorLayout, max_x: i64, max_y: i64) -> EventDecoder {
+        let mut roles = [AdcRole::Ignored; ADC_BITS];
+        let mut x_adc: u32 = 0;
+        let mut y_adc: u32 = 0;
+
+        for (bit, role) in roles.iter_mut().enumerate() {
+            let adc: u32 = 1 << bit;
+            if adc == config.x {
+                *role = AdcRole::X;
+                x_adc = adc;
+            } else if adc == config.y {
+                *role = AdcRole::Y;
+                y_adc = adc;
+            } else if let Some((slot, detector_slot)) = layout.get_slot_for_adc(adc) {
+                *role = AdcRole::Detector {
+                    slot,
+                    max_channel: detector_slot.channels - 1,
+                };
+            }
+        }
+
+        EventDecoder {
+            roles,
+            x_mask: position_mask(max_x),
+            y_mask: position_mask(max_y),
+            x_adc,
+            y_adc,
+        }
+    }
+
+    /// Whether an event word carries the x and the y positions
+    #[inline]
+    pub fn position_adcs(&self, binary_value: u32) -> (bool, bool) {
+        ((binary_value & self.x_adc) != 0, (binary_value & self.y_adc) != 0)
+    }
+
+    /// Number of 16 bits ADC values following an event word
+    #[inline]
+    pub fn adc_count(&self, binary_value: u32) -> usize {
+        (binary_value & 0xFFFF).count_ones() as usize
+    }
+
+    /// Decode the ADC values of an event
+    /// The position is updated in place and the detector hits are written in `hits`.
+    /// Return the number of hits.
+    #[inline]
+    pub fn decode(&self, binary_value: u32, values: &[u8], position: &mut Position, hits: &mut Hits) -> usize {
+        let mut adc_mask = binary_value & 0xFFFF;
+        let mut nb_hits = 0;
+
+        for value in values.chunks_exact(2) {
+            // ADC values are ordered by increasing ADC bit
+            let bit = adc_mask.trailing_zeros() as usize;
+            adc_mask &= adc_mask - 1;
+
+            let int_value = u16::from_le_bytes([value[0], value[1]]);
+            match self.roles[bit] {
+                AdcRole::X => position.x = int_value & self.x_mask,
+                AdcRole::Y => position.y = int_value & self.y_mask,
+                AdcRole::Detector { slot, max_channel } => {
+                    if int_value > 0 {
+                        let channel = u32::from(int_value);
+                        hits[nb_hits] = Hit {
+                            slot,
+                            channel: std::cmp::min(channel, max_channel),
+                            clamped: channel > max_channel,
+                        };
+                        nb_hits += 1;
+                    }
+                }
+                AdcRole::Ignored => {}
+            }
+        }
+
+        return nb_hits;
+    }
+}
+
+/// Mask used to handle position values up to `max`
+fn position_mask(max: i64) -> u16 {
+    ((1 << ((max as f64).log2().ceil() as u16 + 1)) - 1) as u16
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::converter::config::Detector;
+    use std::collections::BTreeMap;
+
+    fn decoder() -> EventDecoder {
+        let mut detectors: BTreeMap<String, Detector> = BTreeMap::new();
+        for (name, adc, channels) in [("HE1", 1, 2048), ("HE4", 8, 2048), ("RBS", 64, 512)] {
+            detectors.insert(
+                name.to_string(),
+                Detector {
+                    adc,
+                    channels,
+                    file_extension: None,
+                },
+            );
+        }
+        let config = Config {
+            x: 256,
+            y: 512,
+            detectors,
+            computed_detectors: BTreeMap::new(),
+            adcs: vec![],
+            edf: None,
+        };
+        let layout = DetectorLayout::new(&config, None);
+
+        EventDecoder::new(&config, &layout, 100, 50)
+    }
+
+    fn values(values: &[u16]) -> Vec<u8> {
+        values.iter().flat_map(|value| value.to_le_bytes()).collect()
+    }
+
+    #[test]
+    fn test_position_mask() {
+        assert_eq!(position_mask(100), 0xFF);
+        assert_eq!(position_mask(50), 0x7F);
+        assert_eq!(position_mask(256), 0x1FF);
+    }
+
+    #[test]
+    fn test_adc_count() {
+        let decoder = decoder();
+
+        assert_eq!(decoder.adc_count(2147484424), 3);
+        assert_eq!(decoder.adc_count(2147487520), 5);
+    }
+
+    #[test]
+    fn test_position_adcs() {
+        let decoder = decoder();
+
+        assert_eq!(decoder.position_adcs(2147484424), (true, true));
+        assert_eq!(decoder.position_adcs(0b100001000), (true, false));
+        assert_eq!(decoder.position_adcs(0b1000), (false, false));
+    }
+
+    #[test]
+    fn test_decode() {
+        let decoder = decoder();
+        let mut position = Position { x: 0, y: 0 };
+        let mut hits: Hits = Default::default();
+
+        // ADC 8 (HE4), 256 (x) and 512 (y)
+        let nb_hits = decoder.decode(2147484424, &values(&[1200, 0x1F0A, 42]), &mut position, &mut hits);
+
+        assert_eq!(position, Position { x: 0x0A, y: 42 });
+        assert_eq!(nb_hits, 1);
+        assert_eq!(
+            hits[0],
+            Hit {
+                slot: 1,
+                channel: 1200,
+                clamped: false
+            }
+        );
+    }
+
+    #[test]
+    fn test_decode_clamps_channel_and_skips_zero() {
+        let decoder = decoder();
+        let mut position = Position { x: 3, y: 4 };
+        let mut hits: Hits = Default::default();
+
+        // ADC 1 (HE1), 2 (unknown) and 64 (RBS)
+        let nb_hits = decoder.decode(0b1000011, &values(&[0, 12, 4000]), &mut position, &mut hits);
+
+        assert_eq!(position, Position { x: 3, y: 4 });
+        assert_eq!(nb_hits, 1);
+        assert_eq!(
+            hits[0],
+            Hit {
+                slot: 2,
+                channel: 511,
+                clamped: true
+            }
+        );
+    }
+}
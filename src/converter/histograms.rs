@@ -0,0 +1,446 @@
+use ndarray::Array3;
+
+use crate::converter::decoder::Hit;
+use crate::converter::layout::DetectorLayout;
+use crate::converter::models::LSTDataset;
+use crate::converter::stats::RunningStats;
+
+/// Storage strategy used to accumulate the events while parsing a LST file
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub enum AccumulationMode {
+    /// One dense (y, x, channel) cube, fast but sized by map area × channels
+    Dense,
+    /// Only the channels that received counts are stored, sized by the number of events
+    Sparse,
+}
+
+impl AccumulationMode {
+    pub fn parse(mode: &str) -> Option<AccumulationMode> {
+        match mode {
+            "dense" => Some(AccumulationMode::Dense),
+            "sparse" => Some(AccumulationMode::Sparse),
+            _ => None,
+        }
+    }
+}
+
+/// Per-pixel sorted (channel, count) runs
+/// Memory scales with the number of distinct (pixel, channel) hits instead of
+/// map area × channels.
+#[derive(Debug, Clone)]
+pub struct SparseHistogram {
+    shape: (usize, usize, usize),
+    runs: Vec<Vec<(u32, u32)>>,
+}
+
+impl SparseHistogram {
+    pub fn new(max_y: usize, max_x: usize, channels: usize) -> SparseHistogram {
+        SparseHistogram {
+            shape: (max_y, max_x, channels),
+            runs: vec![Vec::new(); max_y * max_x],
+        }
+    }
+
+    #[inline]
+    pub fn increment(&mut self, y: usize, x: usize, channel: usize) {
+        let (max_y, max_x, channels) = self.shape;
+        if y >= max_y || x >= max_x || channel >= channels {
+            panic!("Index out of bounds: {:?} for shape {:?}", (y, x, channel), self.shape);
+        }
+
+        let run = &mut self.runs[y * max_x + x];
+        match run.binary_search_by_key(&(channel as u32), |&(channel, _)| channel) {
+            Ok(index) => run[index].1 += 1,
+            Err(index) => run.insert(index, (channel as u32, 1)),
+        }
+    }
+
+    /// Add the counts of another histogram of the same shape
+    pub fn merge(&mut self, other: SparseHistogram) {
+        for (run, other_run) in self.runs.iter_mut().zip(other.runs.into_iter()) {
+            if other_run.is_empty() {
+                continue;
+            }
+            if run.is_empty() {
+                *run = other_run;
+                continue;
+            }
+
+            let mut merged: Vec<(u32, u32)> = Vec::with_capacity(run.len() + other_run.len());
+            let (mut i, mut j) = (0, 0);
+            while i < run.len() && j < other_run.len() {
+                let (channel, count) = run[i];
+                let (other_channel, other_count) = other_run[j];
+                if channel == other_channel {
+                    merged.push((channel, count + other_count));
+                    i += 1;
+                    j += 1;
+                } else if channel < other_channel {
+                    merged.push((channel, count));
+                    i += 1;
+                } else {
+                    merged.push((other_channel, other_count));
+                    j += 1;
+                }
+            }
+            merged.extend_from_slice(&run[i..]);
+            merged.extend_from_slice(&other_run[j..]);
+            *run = merged;
+        }
+    }
+
+    /// Materialize the histogram as a dense dataset
+    pub fn to_dense(&self) -> LSTDataset {
+        let (max_y, max_x, channels) = self.shape;
+        let mut dataset: LSTDataset = Array3::zeros((max_y, max_x, channels));
+
+        for (pixel, run) in self.runs.iter().enumerate() {
+            for &(channel, count) in run {
+                dataset[[pixel / max_x, pixel % max_x, channel as usize]] = count;
+            }
+        }
+
+        return dataset;
+    }
+}
+
+/// Events accumulator for a parsed LST file, indexed by (y, x, channel)
+#[derive(Debug, Clone)]
+pub enum Histogram {
+    Dense(LSTDataset),
+    Sparse(SparseHistogram),
+}
+
+impl Histogram {
+    pub fn new(mode: AccumulationMode, max_y: usize, max_x: usize, channels: usize) -> Histogram {
+        match mode {
+            AccumulationMode::Dense => Histogram::Dense(Array3::zeros((max_y, max_x, channels))),
+            AccumulationMode::Sparse => Histogram::Sparse(SparseHistogram::new(max_y, max_x, channels)),
+        }
+    }
+
+    pub fn shape(&self) -> (usize, usize, usize) {
+        match self {
+            Histogram::Dense(dataset) => dataset.dim(),
+            Histogram::Sparse(sparse) => sparse.shape,
+        }
+    }
+
+    #[inline]
+    pub fn increment(&mut self, y: usize, x: usize, channel: usize) {
+        match self {
+            Histogram::Dense(dataset) => dataset[[y, x, channel]] += 1,
+            Histogram::Sparse(sparse) => sparse.increment(y, x, channel),
+        }
+    }
+
+    /// Add the counts of another histogram of the same mode and shape
+    pub fn merge(&mut self, other: Histogram) {
+        match (self, other) {
+            (Histogram::Dense(dataset), Histogram::Dense(other)) => *dataset += &other,
+            (Histogram::Sparse(sparse), Histogram::Sparse(other)) => sparse.merge(other),
+            _ => panic!("Can't merge histograms of different modes"),
+        }
+    }
+
+    /// Move the histogram into a dense dataset, without copy for the dense engine
+    pub fn into_dataset(self) -> LSTDataset {
+        match self {
+            Histogram::Dense(dataset) => dataset,
+            Histogram::Sparse(sparse) => sparse.to_dense(),
+        }
+    }
+}
+
+/// Rectangular region of the map, `x1` and `y1` excluded
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub struct PixelRoi {
+    pub x0: usize,
+    pub y0: usize,
+    pub x1: usize,
+    pub y1: usize,
+}
+
+impl PixelRoi {
+    /// The region clipped to a map of `max_x` by `max_y` pixels, None if nothing is left
+    pub fn clip(&self, max_x: usize, max_y: usize) -> Option<PixelRoi> {
+        let roi = PixelRoi {
+            x0: self.x0,
+            y0: self.y0,
+            x1: self.x1.min(max_x),
+            y1: self.y1.min(max_y),
+        };
+        (roi.x0 < roi.x1 && roi.y0 < roi.y1).then_some(roi)
+    }
+
+    pub fn width(&self) -> usize {
+        self.x1 - self.x0
+    }
+
+    pub fn height(&self) -> usize {
+        self.y1 - self.y0
+    }
+}
+
+/// The histograms of a detector layout: the detector slots followed by the computed detectors
+/// Every histogram has its running statistics, so no pass over the data is needed after parsing.
+#[derive(Debug, Clone)]
+pub struct HistogramSet {
+    pub histograms: Vec<Histogram>,
+    pub stats: Vec<RunningStats>,
+    /// Computed detector histograms fed by every slot
+    targets: Vec<Vec<usize>>,
+    /// Map region covered by the histograms, events outside of it are skipped
+    roi: PixelRoi,
+}
+
+impl HistogramSet {
+    pub fn new(mode: AccumulationMode, layout: &DetectorLayout, max_y: usize, max_x: usize) -> HistogramSet {
+        let roi = PixelRoi {
+            x0: 0,
+            y0: 0,
+            x1: max_x,
+            y1: max_y,
+        };
+        HistogramSet::with_roi(mode, layout, roi)
+    }
+
+    /// Histograms of a region of the map only, sized by the region
+    pub fn with_roi(mode: AccumulationMode, layout: &DetectorLayout, roi: PixelRoi) -> HistogramSet {
+        let channels = layout.histogram_channels();
+        let (height, width) = (roi.height(), roi.width());
+
+        HistogramSet {
+            histograms: channels
+                .iter()
+                .map(|&channels| Histogram::new(mode, height, width, channels as usize))
+                .collect(),
+            stats: channels.iter().map(|_| RunningStats::new(height * width)).collect(),
+            targets: layout.targets.clone(),
+            roi,
+        }
+    }
+
+    /// Count an event on its slot and on the computed detectors the slot feeds
+    /// `y` and `x` are map coordinates, the event is skipped outside of the region of interest.
+    #[inline]
+    pub fn record(&mut self, y: usize, x: usize, hit: &Hit) {
+        let roi = self.roi;
+        if x < roi.x0 || x >= roi.x1 || y < roi.y0 || y >= roi.y1 {
+            return;
+        }
+        let (y, x) = (y - roi.y0, x - roi.x0);
+
+        let pixel = y * roi.width() + x;
+        self.histograms[hit.slot].increment(y, x, hit.channel as usize);
+        self.stats[hit.slot].record(pixel, hit.channel, hit.clamped);
+        for &target in self.targets[hit.slot].iter() {
+            self.histograms[target].increment(y, x, hit.channel as usize);
+            self.stats[target].record(pixel, hit.channel, hit.clamped);
+        }
+    }
+
+    /// Add the counts of another set built from the same layout
+    pub fn merge(&mut self, other: HistogramSet) {
+        for (histogram, other_histogram) in self.histograms.iter_mut().zip(other.histograms.into_iter()) {
+            histogram.merge(other_histogram);
+        }
+        for (stats, other_stats) in self.stats.iter_mut().zip(other.stats.iter()) {
+            stats.merge(other_stats);
+        }
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::converter::config::{ComputedDetector, Config, Detector};
+    use std::collections::BTreeMap;
+
+    fn fill(histogram: &mut Histogram) {
+        histogram.increment(0, 0, 1);
+        histogram.increment(0, 0, 1);
+        histogram.increment(1, 2, 5);
+        histogram.increment(1, 2, 0);
+        histogram.increment(2, 1, 3);
+    }
+
+    #[test]
+    fn test_accumulation_mode_parse() {
+        assert_eq!(AccumulationMode::parse("dense"), Some(AccumulationMode::Dense));
+        assert_eq!(AccumulationMode::parse("sparse"), Some(AccumulationMode::Sparse));
+        assert_eq!(AccumulationMode::parse("other"), None);
+    }
+
+    #[test]
+    fn test_sparse_runs_are_sorted() {
+        let mut sparse = SparseHistogram::new(2, 2, 8);
+        sparse.increment(1, 1, 6);
+        sparse.increment(1, 1, 2);
+        sparse.increment(1, 1, 6);
+        sparse.increment(1, 1, 4);
+
+        assert_eq!(sparse.runs[3], vec![(2, 1), (4, 1), (6, 2)]);
+    }
+
+    #[test]
+    fn test_sparse_matches_dense() {
+        let mut dense = Histogram::new(AccumulationMode::Dense, 3, 3, 6);
+        let mut sparse = Histogram::new(AccumulationMode::Sparse, 3, 3, 6);
+        fill(&mut dense);
+        fill(&mut sparse);
+
+        assert_eq!(dense.shape(), sparse.shape());
+        let dense_dataset = dense.into_dataset();
+        assert_eq!(dense_dataset, sparse.into_dataset());
+        assert_eq!(dense_dataset[[0, 0, 1]], 2);
+        assert_eq!(dense_dataset[[1, 2, 5]], 1);
+    }
+
+    #[test]
+    fn test_merge() {
+        let mut dense = Histogram::new(AccumulationMode::Dense, 3, 3, 6);
+        let mut sparse = Histogram::new(AccumulationMode::Sparse, 3, 3, 6);
+        fill(&mut dense);
+        fill(&mut sparse);
+
+        let mut other_dense = Histogram::new(AccumulationMode::Dense, 3, 3, 6);
+        let mut other_sparse = Histogram::new(AccumulationMode::Sparse, 3, 3, 6);
+        other_dense.increment(0, 0, 1);
+        other_dense.increment(0, 0, 4);
+        other_sparse.increment(0, 0, 1);
+        other_sparse.increment(0, 0, 4);
+
+        dense.merge(other_dense);
+        sparse.merge(other_sparse);
+
+        let dense_dataset = dense.into_dataset();
+        assert_eq!(dense_dataset[[0, 0, 1]], 3);
+        assert_eq!(dense_dataset[[0, 0, 4]], 1);
+        assert_eq!(dense_dataset, sparse.into_dataset());
+    }
+
+    #[test]
+    fn test_histogram_set_feeds_computed_detectors() {
+        let mut detectors: BTreeMap<String, Detector> = BTreeMap::new();
+        for (name, adc, channels) in [("HE1", 1, 4), ("HE2", 2, 6), ("RBS", 64, 8)] {
+            detectors.insert(
+                name.to_string(),
+                Detector {
+                    adc,
+                    channels,
+                    file_extension: None,
+                },
+            );
+        }
+        let mut computed_detectors: BTreeMap<String, ComputedDetector> = BTreeMap::new();
+        computed_detectors.insert(
+            "HE12".to_string(),
+            ComputedDetector {
+                detectors: vec!["HE1".to_string(), "HE2".to_string()],
+                file_extension: None,
+            },
+        );
+        let config = Config {
+            x: 256,
+            y: 512,
+            detectors,
+            computed_detectors,
+            adcs: vec![],
+            edf: None,
+        };
+        let layout = DetectorLayout::new(&config, None);
+
+        let hit = |slot, channel| Hit {
+            slot,
+            channel,
+            clamped: false,
+        };
+        let mut set = HistogramSet::new(AccumulationMode::Dense, &layout, 2, 2);
+        set.record(0, 1, &hit(0, 3));
+        set.record(0, 1, &hit(1, 3));
+        set.record(1, 0, &hit(1, 5));
+        set.record(1, 1, &hit(2, 7));
+
+        let mut other = HistogramSet::new(AccumulationMode::Dense, &layout, 2, 2);
+        other.record(1, 1, &hit(0, 0));
+        set.merge(other);
+
+        let stats: Vec<u64> = set.stats.iter().map(|stats| stats.events).collect();
+        assert_eq!(stats, [2, 2, 1, 4]);
+        assert_eq!(set.stats[3].pixels(), 3);
+        assert_eq!(set.stats[3].max_channel, Some(5));
+
+        let datasets: Vec<LSTDataset> = set.histograms.into_iter().map(|h| h.into_dataset()).collect();
+        let computed = &datasets[3];
+        assert_eq!(computed.shape(), &[2, 2, 6]);
+        assert_eq!(computed[[0, 1, 3]], 2);
+        assert_eq!(computed[[1, 0, 5]], 1);
+        assert_eq!(computed[[1, 1, 0]], 1);
+        assert_eq!(computed.iter().sum::<u32>(), 4);
+        assert_eq!(datasets[2][[1, 1, 7]], 1);
+    }
+
+    #[test]
+    fn test_histogram_set_roi() {
+        let mut detectors: BTreeMap<String, Detector> = BTreeMap::new();
+        detectors.insert(
+            "HE1".to_string(),
+            Detector {
+                adc: 1,
+                channels: 4,
+                file_extension: None,
+            },
+        );
+        let config = Config {
+            x: 256,
+            y: 512,
+            detectors,
+            computed_detectors: BTreeMap::new(),
+            adcs: vec![],
+            edf: None,
+        };
+        let layout = DetectorLayout::new(&config, None);
+        let roi = PixelRoi {
+            x0: 2,
+            y0: 1,
+            x1: 10,
+            y1: 3,
+        }
+        .clip(4, 5)
+        .unwrap();
+        assert_eq!((roi.width(), roi.height()), (2, 2));
+
+        let hit = Hit {
+            slot: 0,
+            channel: 3,
+            clamped: false,
+        };
+        let mut set = HistogramSet::with_roi(AccumulationMode::Dense, &layout, roi);
+        set.record(1, 2, &hit);
+        set.record(2, 3, &hit);
+        set.record(0, 2, &hit);
+        set.record(1, 1, &hit);
+        set.record(3, 3, &hit);
+
+        assert_eq!(set.stats[0].events, 2);
+        let dataset = set.histograms.remove(0).into_dataset();
+        assert_eq!(dataset.shape(), &[2, 2, 4]);
+        assert_eq!(dataset[[0, 0, 3]], 1);
+        assert_eq!(dataset[[1, 1, 3]], 1);
+        let outside = PixelRoi {
+            x0: 4,
+            y0: 0,
+            x1: 6,
+            y1: 1,
+        };
+        assert!(outside.clip(4, 5).is_none());
+    }
+
+    #[test]
+    fn test_empty_histogram() {
+        let dataset = Histogram::new(AccumulationMode::Sparse, 2, 2, 4).into_dataset();
+        assert_eq!(dataset, Histogram::new(AccumulationMode::Dense, 2, 2, 4).into_dataset());
+        assert_eq!(dataset.iter().sum::<u32>(), 0);
+    }
+}
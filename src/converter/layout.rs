@@ -0,0 +1,222 @@
+use log::{debug, warn};
+
+use crate::converter::config::Config;
+
+/// A detector that can actually receive events, with its own histogram
+#[derive(Debug, Clone)]
+pub struct DetectorSlot {
+    pub name: String,
+    pub adc: u32,
+    pub channels: u32,
+}
+
+/// A computed detector summing the events of several detector slots
+#[derive(Debug, Clone)]
+pub struct ComputedSlot {
+    pub name: String,
+    /// Source detectors in config order, with their slot
+    pub sources: Vec<(String, usize)>,
+    pub channels: u32,
+}
+
+/// Detectors layout compiled once from the config before parsing
+///
+/// Only the detectors that can be reached by an ADC event get a slot:
+/// - the ADC must be one of the 16 bits of an event word,
+/// - the ADC must not be used by the x or y position,
+/// - when several detectors share an ADC, only the first one (by name) is hit.
+///
+/// Computed detectors with at least 2 reachable sources are accumulated while
+/// parsing: their histograms follow the slot ones, and `targets` gives for every
+/// slot the histograms of the computed detectors it feeds.
+#[derive(Debug, Clone)]
+pub struct DetectorLayout {
+    pub slots: Vec<DetectorSlot>,
+    pub computed: Vec<ComputedSlot>,
+    pub targets: Vec<Vec<usize>>,
+}
+
+impl DetectorLayout {
+    /// Compile the layout for the given config
+    /// If `selection` is given, only these detectors are kept.
+    pub fn new(config: &Config, selection: Option<&Vec<String>>) -> DetectorLayout {
+        let mut slots: Vec<DetectorSlot> = Vec::new();
+
+        for (name, detector) in config.detectors.iter() {
+            if !detector.adc.is_power_of_two() || detector.adc > 0x8000 {
+                warn!("Detector {} can't be reached: ADC {} is not an ADC bit", name, detector.adc);
+                continue;
+            }
+            if detector.adc == config.x || detector.adc == config.y {
+                warn!("Detector {} can't be reached: ADC {} is a position ADC", name, detector.adc);
+                continue;
+            }
+            if let Some((first_name, _)) = config.get_detector_name_from_adc(detector.adc) {
+                if first_name != name {
+                    warn!(
+                        "Detector {} can't be reached: ADC {} is already used by {}",
+                        name, detector.adc, first_name
+                    );
+                    continue;
+                }
+            }
+            if let Some(selection) = selection {
+                if !selection.contains(name) {
+                    continue;
+                }
+            }
+
+            slots.push(DetectorSlot {
+                name: name.to_string(),
+                adc: detector.adc,
+                channels: detector.channels,
+            });
+        }
+
+        if let Some(selection) = selection {
+            for name in selection {
+                if !slots.iter().any(|slot| &slot.name == name) {
+                    warn!("Selected detector {} is unknown or can't be reached", name);
+                }
+            }
+        }
+
+        let mut computed: Vec<ComputedSlot> = Vec::new();
+        let mut targets: Vec<Vec<usize>> = vec![Vec::new(); slots.len()];
+
+        for (name, computed_detector) in config.computed_detectors.iter() {
+            let sources: Vec<(String, usize)> = computed_detector
+                .detectors
+                .iter()
+                .filter_map(|source| {
+                    let slot = slots.iter().position(|slot| &slot.name == source)?;
+                    Some((source.to_string(), slot))
+                })
+                .collect();
+
+            if sources.len() < 2 {
+                debug!("Computed detector {} skipped: less than 2 detectors can be reached", name);
+                continue;
+            }
+
+            let histogram = slots.len() + computed.len();
+            for (_, slot) in sources.iter() {
+                targets[*slot].push(histogram);
+            }
+            computed.push(ComputedSlot {
+                name: name.to_string(),
+                sources,
+                channels: config.get_max_channels_for_computed_detector(name),
+            });
+        }
+
+        return DetectorLayout {
+            slots,
+            computed,
+            targets,
+        };
+    }
+
+    /// Number of channels of every histogram, the detector slots followed by the computed detectors
+    pub fn histogram_channels(&self) -> Vec<u32> {
+        self.slots
+            .iter()
+            .map(|slot| slot.channels)
+            .chain(self.computed.iter().map(|computed| computed.channels))
+            .collect()
+    }
+
+    /// Get the slot index and the slot receiving the events of an ADC
+    pub fn get_slot_for_adc(&self, adc: u32) -> Option<(usize, &DetectorSlot)> {
+        return self.slots.iter().enumerate().find(|(_, slot)| slot.adc == adc);
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::converter::config::{ComputedDetector, Detector};
+    use std::collections::BTreeMap;
+
+    fn config() -> Config {
+        let mut detectors: BTreeMap<String, Detector> = BTreeMap::new();
+        for (name, adc, channels) in [
+            ("HE1", 1, 2048),
+            ("HE2", 2, 2048),
+            ("RBS", 64, 512),
+            ("RBS_135", 64, 4096),
+            ("POS", 256, 1024),
+            ("WRONG", 3, 1024),
+        ] {
+            detectors.insert(
+                name.to_string(),
+                Detector {
+                    adc,
+                    channels,
+                    file_extension: None,
+                },
+            );
+        }
+
+        Config {
+            x: 256,
+            y: 512,
+            detectors,
+            computed_detectors: BTreeMap::new(),
+            adcs: vec![],
+            edf: None,
+        }
+    }
+
+    #[test]
+    fn test_layout_keeps_reachable_detectors() {
+        let layout = DetectorLayout::new(&config(), None);
+        let names: Vec<&str> = layout.slots.iter().map(|slot| slot.name.as_str()).collect();
+
+        assert_eq!(names, ["HE1", "HE2", "RBS"]);
+    }
+
+    #[test]
+    fn test_layout_selection() {
+        let selection = vec!["HE2".to_string(), "RBS_135".to_string()];
+        let layout = DetectorLayout::new(&config(), Some(&selection));
+        let names: Vec<&str> = layout.slots.iter().map(|slot| slot.name.as_str()).collect();
+
+        assert_eq!(names, ["HE2"]);
+    }
+
+    #[test]
+    fn test_layout_computed_targets() {
+        let mut config = config();
+        for (name, sources) in [("HE12", vec!["HE1", "HE2"]), ("HE1RBS135", vec!["HE1", "RBS_135"])] {
+            config.computed_detectors.insert(
+                name.to_string(),
+                ComputedDetector {
+                    detectors: sources.iter().map(|source| source.to_string()).collect(),
+                    file_extension: None,
+                },
+            );
+        }
+        let layout = DetectorLayout::new(&config, None);
+
+        // RBS_135 can't be reached, so HE1RBS135 has a single source
+        assert_eq!(layout.computed.len(), 1);
+        assert_eq!(layout.computed[0].name, "HE12");
+        assert_eq!(layout.computed[0].sources, [("HE1".to_string(), 0), ("HE2".to_string(), 1)]);
+        assert_eq!(layout.computed[0].channels, 2048);
+        assert_eq!(layout.targets, [vec![3], vec![3], vec![]]);
+        assert_eq!(layout.histogram_channels(), [2048, 2048, 512, 2048]);
+    }
+
+    #[test]
+    fn test_get_slot_for_adc() {
+        let layout = DetectorLayout::new(&config(), None);
+
+        let (index, slot) = layout.get_slot_for_adc(64).unwrap();
+        assert_eq!(index, 2);
+        assert_eq!(slot.name, "RBS");
+        assert_eq!(slot.channels, 512);
+        assert!(layout.get_slot_for_adc(256).is_none());
+        assert!(layout.get_slot_for_adc(4).is_none());
+    }
+}
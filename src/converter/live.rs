@@ -0,0 +1,290 @@
+use log::{debug, info};
+use pyo3::prelude::*;
+use std::{
+    fs::File,
+    io::{Cursor, Read, Seek, SeekFrom},
+    path::{Path, PathBuf},
+};
+
+use crate::converter::chunks::parse_chunk;
+use crate::converter::config::Config;
+use crate::converter::decoder::{EventDecoder, Position};
+use crate::converter::histograms::{AccumulationMode, HistogramSet};
+use crate::converter::layout::DetectorLayout;
+use crate::converter::models::{ExpInfo, MapSize, ParsingResult, PyParsingResult};
+use crate::converter::progress::Progress;
+
+use super::{build_parsing_result, get_attributes, read_header};
+
+/// Longest header read while waiting for the [LISTDATA] keyword
+const MAX_HEADER_SIZE: u64 = 1 << 20;
+
+/// Parsing state of a LST file, once its header is written
+struct StreamState {
+    map_size: MapSize,
+    exp_info: Option<ExpInfo>,
+    timer_reduce: u32,
+    decoder: EventDecoder,
+    histograms: HistogramSet,
+    /// Offset in the file of the first event not parsed yet
+    offset: u64,
+    position: Position,
+    total_events: u64,
+    timer_events: u32,
+}
+
+/// Incremental parser of a LST file that is still being written
+///
+/// Every poll only reads the bytes appended since the previous one. An event
+/// cut by the end of the file is parsed again at the next poll, once complete.
+pub struct LiveParser {
+    path: PathBuf,
+    config: Config,
+    layout: DetectorLayout,
+    mode: AccumulationMode,
+    state: Option<StreamState>,
+}
+
+impl LiveParser {
+    pub fn new(path: &Path, config: Config, mode: AccumulationMode, selection: Option<Vec<String>>) -> LiveParser {
+        let layout = DetectorLayout::new(&config, selection.as_ref());
+        debug!("Detector layout: {:?}", layout);
+
+        LiveParser {
+            path: path.to_path_buf(),
+            config,
+            layout,
+            mode,
+            state: None,
+        }
+    }
+
+    /// Parse the events appended to the file since the last poll
+    /// Return the number of new events, 0 while the header isn't fully written.
+    pub fn poll(&mut self) -> Result<u64, String> {
+        let mut file = File::open(&self.path).map_err(|err| err.to_string())?;
+
+        if self.state.is_none() {
+            match self.read_state(&mut file)? {
+                Some(state) => self.state = Some(state),
+                None => return Ok(0),
+            }
+        }
+        let state = self.state.as_mut().unwrap();
+
+        let mut payload: Vec<u8> = Vec::new();
+        file.seek(SeekFrom::Start(state.offset)).map_err(|err| err.to_string())?;
+        file.read_to_end(&mut payload).map_err(|err| err.to_string())?;
+
+        let progress = Progress::default();
+        let chunk = parse_chunk(
+            &payload,
+            0,
+            payload.len(),
+            Some(state.position),
+            &state.decoder,
+            &mut state.histograms,
+            &progress,
+        );
+
+        state.offset += chunk.end as u64;
+        state.position = Position {
+            x: chunk.last_x.unwrap_or(state.position.x),
+            y: chunk.last_y.unwrap_or(state.position.y),
+        };
+        state.total_events += chunk.total_events as u64;
+        state.timer_events += chunk.timer_events;
+        debug!("{} new events, parsed up to offset {}", chunk.total_events, state.offset);
+
+        Ok(chunk.total_events as u64)
+    }
+
+    /// Read the header once the [LISTDATA] keyword line is complete
+    fn read_state(&self, file: &mut File) -> Result<Option<StreamState>, String> {
+        let mut header: Vec<u8> = Vec::new();
+        file.by_ref()
+            .take(MAX_HEADER_SIZE)
+            .read_to_end(&mut header)
+            .map_err(|err| err.to_string())?;
+
+        let keyword = b"[LISTDATA]";
+        let keyword_line_end = header
+            .windows(keyword.len())
+            .position(|window| window == keyword)
+            .and_then(|start| header[start..].iter().position(|&byte| byte == b'\n'));
+        if keyword_line_end.is_none() {
+            if header.len() as u64 == MAX_HEADER_SIZE {
+                return Err("Couldn't find [LISTDATA] in the header".to_string());
+            }
+            return Ok(None);
+        }
+
+        let mut reader = Cursor::new(&header[..]);
+        let (map_size, exp_info, timer_reduce) = read_header(&mut reader)?;
+        let offset = reader.position();
+        info!("Header of {:?} read, events start at {}", self.path, offset);
+
+        let max_x = map_size.get_max_x();
+        let max_y = map_size.get_max_y();
+        Ok(Some(StreamState {
+            decoder: EventDecoder::new(&self.config, &self.layout, max_x, max_y),
+            histograms: HistogramSet::new(self.mode, &self.layout, max_y as usize, max_x as usize),
+            map_size,
+            exp_info,
+            timer_reduce,
+            offset,
+            position: Position { x: 0, y: 0 },
+            total_events: 0,
+            timer_events: 0,
+        }))
+    }
+
+    /// Copy of the histograms parsed so far, None until the header is written
+    pub fn snapshot(&self) -> Option<ParsingResult> {
+        self.state.as_ref().map(|state| {
+            let attributes = get_attributes(&state.map_size, &state.exp_info, state.timer_reduce, state.timer_events);
+            build_parsing_result(&self.layout, state.histograms.clone(), attributes, &state.exp_info)
+        })
+    }
+}
+
+/// Parse a LST file while it is being acquired
+///
+/// Args:
+///    file_path (str): Path to the LST file
+///    config (Config): Configuration for the conversion
+///    mode (str): Accumulation engine, "dense" (default) or "sparse"
+///    detectors (list[str] | None): Only parse these detectors. All the reachable
+///        detectors are parsed if None.
+#[pyclass(name = "LstStream")]
+pub struct LstStream {
+    parser: LiveParser,
+}
+
+#[pymethods]
+impl LstStream {
+    #[new]
+    #[pyo3(signature = (file_path, config, mode = "dense", detectors = None))]
+    fn py_new(file_path: String, config: Config, mode: &str, detectors: Option<Vec<String>>) -> PyResult<Self> {
+        let mode = AccumulationMode::parse(mode).ok_or_else(|| {
+            PyErr::new::<pyo3::exceptions::PyValueError, _>(format!("Unknown accumulation mode: {}", mode))
+        })?;
+        Ok(LstStream {
+            parser: LiveParser::new(Path::new(&file_path), config, mode, detectors),
+        })
+    }
+
+    /// Parse the events written since the last call, without holding the GIL
+    /// Return the number of new events.
+    fn poll(&mut self, py: Python) -> PyResult<u64> {
+        let parser = &mut self.parser;
+        py.allow_threads(|| parser.poll())
+            .map_err(|err| PyErr::new::<pyo3::exceptions::PyException, _>(err))
+    }
+
+    /// Copy of the datasets parsed so far, None until the header is written
+    fn snapshot(&self, py: Python) -> PyResult<Option<Py<PyParsingResult>>> {
+        let parser = &self.parser;
+        match py.allow_threads(|| parser.snapshot()) {
+            Some(parsing_result) => Ok(Some(Py::new(py, parsing_result.into_py_result(py)?)?)),
+            None => Ok(None),
+        }
+    }
+
+    /// Offset in the file of the first event not parsed yet
+    #[getter]
+    fn parsed_bytes(&self) -> u64 {
+        self.parser.state.as_ref().map_or(0, |state| state.offset)
+    }
+
+    #[getter]
+    fn events(&self) -> u64 {
+        self.parser.state.as_ref().map_or(0, |state| state.total_events)
+    }
+
+    #[getter]
+    fn timer_events(&self) -> u32 {
+        self.parser.state.as_ref().map_or(0, |state| state.timer_events)
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::converter::config::Detector;
+    use std::{collections::BTreeMap, io::Write};
+
+    fn config() -> Config {
+        let mut detectors: BTreeMap<String, Detector> = BTreeMap::new();
+        detectors.insert(
+            "HE1".to_string(),
+            Detector {
+                adc: 1,
+                channels: 64,
+                file_extension: None,
+            },
+        );
+        Config {
+            x: 256,
+            y: 512,
+            detectors,
+            computed_detectors: BTreeMap::new(),
+            adcs: vec![],
+            edf: None,
+        }
+    }
+
+    /// Events on a 4x2 map, the value of HE1 is x + y + 1
+    fn payload() -> Vec<u8> {
+        let mut payload: Vec<u8> = Vec::new();
+        for y in 0..2u16 {
+            for x in 0..4u16 {
+                // X, Y and HE1 values, with a dummy word
+                payload.extend_from_slice(&(0x80000000u32 | 256 | 512 | 1).to_le_bytes());
+                payload.extend_from_slice(&[0, 0]);
+                for value in [x + y + 1, x, y] {
+                    payload.extend_from_slice(&value.to_le_bytes());
+                }
+                payload.extend_from_slice(&0x40000000u32.to_le_bytes());
+            }
+        }
+        payload
+    }
+
+    #[test]
+    fn test_live_parser_resumes_on_appended_bytes() {
+        let header = "[MPA4A] 0.0.1\r\ncmline0=Map size:200,100,50,50,100\r\n[LISTDATA]\r\n";
+        let payload = payload();
+        let mut file = tempfile::NamedTempFile::new().unwrap();
+        let mut parser = LiveParser::new(file.path(), config(), AccumulationMode::Dense, None);
+
+        // The header isn't complete yet
+        file.write_all(&header.as_bytes()[..20]).unwrap();
+        assert_eq!(parser.poll().unwrap(), 0);
+        assert!(parser.snapshot().is_none());
+
+        // Cut in the middle of the third event
+        file.write_all(&header.as_bytes()[20..]).unwrap();
+        file.write_all(&payload[..2 * 16 + 7]).unwrap();
+        assert_eq!(parser.poll().unwrap(), 2);
+        assert_eq!(parser.poll().unwrap(), 0);
+
+        file.write_all(&payload[2 * 16 + 7..]).unwrap();
+        assert_eq!(parser.poll().unwrap(), 6);
+
+        let state = parser.state.as_ref().unwrap();
+        assert_eq!(state.offset, (header.len() + payload.len()) as u64);
+        assert_eq!(state.timer_events, 8);
+
+        let result = parser.snapshot().unwrap();
+        let data = &result.datasets[0].data;
+        assert_eq!(data.dim(), (2, 4, 64));
+        for y in 0..2 {
+            for x in 0..4 {
+                assert_eq!(data[[y, x, x + y + 1]], 1);
+            }
+        }
+        assert_eq!(data.sum(), 8);
+        assert_eq!(result.stats["HE1"].events, 8);
+    }
+}
@@ -1,58 +1,131 @@
 use indicatif::{ProgressBar, ProgressStyle};
-use log::{debug, error, info};
-use ndarray::{s, Array3};
+use log::{debug, error, info, warn};
+#[cfg(unix)]
+use memmap2::Advice;
+use memmap2::Mmap;
 use std::{
     collections::HashMap,
     fs::File,
-    io::{BufRead, BufReader, Read, Seek, SeekFrom},
+    io::{BufRead, BufReader, Cursor, Seek},
     path,
     result::Result,
-    sync::mpsc,
+    sync::atomic::{AtomicBool, Ordering},
     thread,
+    time::{Duration, Instant},
 };
 
 pub mod config;
-use config::{Config, Detector};
+use config::Config;
 
 pub mod models;
-use models::{ExpInfo, LSTDataset, MapSize};
+use models::{DetectorStats, ExpInfo, LSTProbe, MapSize};
+
+mod chunks;
+use chunks::{find_resync_word, parse_chunk, parse_payload};
+
+mod decoder;
+use decoder::{EventDecoder, Position};
 
 mod events;
 use events::LstEvent;
 
+pub mod histograms;
+use histograms::{AccumulationMode, HistogramSet, PixelRoi};
+
+pub mod layout;
+use layout::{ComputedSlot, DetectorLayout};
+
+pub mod live;
+
 mod helpers;
-use helpers::{add_data_to_ndarray, format_milliseconds, get_adcnum};
+use helpers::format_milliseconds;
+
+pub mod progress;
+use progress::{Progress, ProgressOptions, ProgressUpdate};
+
+mod stats;
+use stats::RunningStats;
+
+mod streaming;
+use streaming::RowBandWriter;
+
+pub mod window;
+use window::{ParsingWindow, TimeWindow};
+
+pub mod writer;
+use writer::{write_parsing_result, WriterOptions};
 
 use crate::converter::models::LSTData;
 
 use self::models::ParsingResult;
 
-#[derive(Debug, Clone, Copy)]
-struct Position {
-    x: u16,
-    y: u16,
+/// A LST file mapped in memory, with its parsed header
+struct LstFile {
+    mmap: Mmap,
+    file_size: u64,
+    data_offset: usize,
+    map_size: MapSize,
+    exp_info: Option<ExpInfo>,
+    timer_reduce: u32,
 }
 
-pub fn parse_lst(file_path: &path::Path, config: Config) -> Result<ParsingResult, &'static str> {
-    info!("File to parse: {:?}", file_path);
-    info!("Config used: {:?}", config);
-
-    let file = File::open(file_path).expect("Error opening file");
-    // Get the total size of the file
-    let file_size = file.metadata().unwrap().len();
+impl LstFile {
+    fn open(file_path: &path::Path) -> Result<LstFile, &'static str> {
+        let file = File::open(file_path).map_err(|_| "Error opening file")?;
+        // Get the total size of the file
+        let file_size = file.metadata().map_err(|_| "Error reading file metadata")?.len();
+
+        // Safety: the file is only read and must not be truncated while it is parsed
+        let mmap = unsafe { Mmap::map(&file) }.map_err(|_| "Error mapping file")?;
+        #[cfg(unix)]
+        {
+            if let Err(err) = mmap.advise(Advice::Sequential) {
+                debug!("Couldn't advise sequential reads: {}", err);
+            }
+        }
 
-    let mut reader = BufReader::new(file);
+        let mut header_reader = Cursor::new(&mmap[..]);
+        let (map_size, exp_info, timer_reduce) = read_header(&mut header_reader)?;
+        let data_offset = header_reader.position() as usize;
+        debug!("Map size: {:?}", map_size);
+        debug!("[LISTDATA] offset: {}", data_offset);
+        if let Some(exp_info) = exp_info.clone() {
+            debug!("Exp info: {:?}", exp_info);
+        }
 
-    let (map_size, exp_info, timer_reduce) = read_header(&mut reader).unwrap();
-    debug!("Map size: {:?}", map_size);
-    if let Some(exp_info) = exp_info.clone() {
-        debug!("Exp info: {:?}", exp_info);
+        Ok(LstFile {
+            mmap,
+            file_size,
+            data_offset,
+            map_size,
+            exp_info,
+            timer_reduce,
+        })
     }
 
-    let max_x = map_size.get_max_x();
-    let max_y = map_size.get_max_y();
+    /// The [LISTDATA] events
+    fn payload(&self) -> &[u8] {
+        &self.mmap[self.data_offset..]
+    }
+}
 
-    let pb = ProgressBar::new(file_size);
+/// Delay between two polls of the parsing progress
+const PROGRESS_POLL: Duration = Duration::from_millis(50);
+
+/// Run `parse` on the current thread while its progress is reported from another one
+/// The progress is polled, so the parsing threads only update a few atomic counters.
+fn run_with_progress<T>(lst_file: &LstFile, options: ProgressOptions, parse: impl FnOnce(&Progress) -> T) -> T {
+    let ProgressOptions {
+        progress_bar,
+        mut callback,
+        interval,
+        cancel,
+    } = options;
+
+    let pb = match progress_bar {
+        true => ProgressBar::new(lst_file.file_size),
+        false => ProgressBar::hidden(),
+    };
     pb.set_style(
         ProgressStyle::with_template(
             "{spinner:.green}  [{elapsed_precise}] [{wide_bar:.cyan/blue}] {bytes}/{total_bytes}",
@@ -60,285 +133,487 @@ pub fn parse_lst(file_path: &path::Path, config: Config) -> Result<ParsingResult
         .unwrap()
         .progress_chars("#>-"),
     );
+    pb.set_position(lst_file.data_offset as u64);
+
+    let progress = Progress::new(cancel);
+    let done = AtomicBool::new(false);
+
+    thread::scope(|scope| {
+        let (progress, done, pb) = (&progress, &done, &pb);
+        scope.spawn(move || {
+            let start = Instant::now();
+            let mut last_report: Option<Instant> = None;
+
+            loop {
+                let finished = done.load(Ordering::Acquire);
+                let parsed_bytes = lst_file.data_offset as u64 + progress.parsed_bytes();
+                pb.set_position(parsed_bytes);
+
+                let report_due = last_report.map_or(true, |last_report| last_report.elapsed() >= interval);
+                if let Some(report) = callback.as_mut().filter(|_| finished || report_due) {
+                    last_report = Some(Instant::now());
+                    let events = progress.events();
+                    let update = ProgressUpdate {
+                        parsed_bytes,
+                        total_bytes: lst_file.file_size,
+                        events,
+                        events_per_second: events as f64 / start.elapsed().as_secs_f64().max(1e-3),
+                    };
+                    if let Err(err) = report(update) {
+                        error!("Progress callback failed, cancelling the parsing: {}", err);
+                        progress.cancel();
+                        callback = None;
+                    }
+                }
 
-    let (tx, rx) = mpsc::channel();
-
-    let config_thread = config.clone();
-    let mut dataset = config_thread.create_big_dataset(max_x, max_y);
-    debug!("Dataset created: {:?}", dataset.shape());
+                if finished {
+                    break;
+                }
+                thread::sleep(PROGRESS_POLL.min(interval));
+            }
+        });
 
-    // Launch thread to parse the file
-    let handle_dataset = thread::spawn(move || -> Result<(LSTDataset, i32, u32), &str> {
-        let mut timer_events: u32 = 0;
-        let mut total_events = 0;
+        let result = parse(progress);
+        done.store(true, Ordering::Release);
+        result
+    })
+}
 
-        let mut buffer = [0; 4];
-        let mut position: Position = Position { x: 0, y: 0 };
+/// Attributes of the data group
+fn get_attributes(
+    map_size: &MapSize,
+    exp_info: &Option<ExpInfo>,
+    timer_reduce: u32,
+    timer_events: u32,
+) -> HashMap<String, String> {
+    let mut attributes: HashMap<String, String> = HashMap::new();
 
-        #[allow(unused_assignments)] // False positive (I think)
-        let mut binary_value: u32 = 0;
+    // Add acquisition time to attributes
+    let acquisition_time = format_milliseconds(timer_events * timer_reduce);
+    info!("Acquisition time: {}", acquisition_time);
+    attributes.insert("acquisition_time".to_string(), acquisition_time);
+    attributes.insert("map_size_width".to_string(), map_size.width.to_string());
+    attributes.insert("map_size_height".to_string(), map_size.height.to_string());
+    attributes.insert("pen_size".to_string(), map_size.pen_size.to_string());
+    attributes.insert("pixel_size_width".to_string(), map_size.pixel_size_width.to_string());
+    attributes.insert("pixel_size_height".to_string(), map_size.pixel_size_height.to_string());
+
+    // Add the data from the ExpInfo to the attributes
+    if let Some(exp_info) = exp_info.clone() {
+        attributes.insert("particle".to_string(), exp_info.particle);
+        attributes.insert("beam_energy".to_string(), exp_info.beam_energy);
+        debug!("ExpInfo metadata added");
+    }
 
-        // Read 4 bytes at a time
-        loop {
-            if let Err(_err) = reader.read_exact(&mut buffer) {
-                break;
-            }
+    return attributes;
+}
 
-            binary_value = u32::from_le_bytes(buffer);
-            match LstEvent::inspect(binary_value) {
-                Some(LstEvent::Timer) => {
-                    timer_events += 1;
+/// Attributes of a detector dataset
+fn get_detector_attributes(name: &str, exp_info: &Option<ExpInfo>) -> HashMap<String, String> {
+    let mut attributes = HashMap::new();
 
-                    let current_position = reader.seek(SeekFrom::Current(0)).expect("Couldn't read position");
-                    if let Err(err) = tx.send(current_position) {
-                        error!("Couldn't send position: {}", err);
-                    }
-                }
-                Some(LstEvent::Adc(has_dummy_word)) => {
-                    total_events += 1;
-
-                    if has_dummy_word {
-                        // Dummy word was inserted, read 2 bytes
-                        if let Err(err) = reader.seek(SeekFrom::Current(2)) {
-                            error!("Couldn't seek: {}", err);
-                        }
-                    }
+    if let Some(exp_info) = exp_info {
+        if let Some(filter) = exp_info.get_filter_for_detector(name) {
+            attributes.insert("filter".to_string(), filter);
+        }
+    }
 
-                    let adcnum = get_adcnum(binary_value);
-                    let mut adc_buffer = vec![0; adcnum.len() * 2 as usize];
-                    if let Err(err) = reader.read_exact(&mut adc_buffer) {
-                        error!("Couldn't read ADC2 buffer size of {}: {}", adcnum.len(), err);
-                        continue;
-                    }
+    return attributes;
+}
 
-                    let channels = match get_channels_from_buffer(
-                        adcnum,
-                        &adc_buffer,
-                        &config_thread,
-                        &mut position,
-                        max_x,
-                        max_y,
-                    ) {
-                        Ok(channels) => channels,
-                        Err(_err) => {
-                            error!("Couldn't get channels from buffer");
-                            continue;
-                        }
-                    };
+/// Attributes of a computed detector dataset, from the detectors it is composed of
+fn get_computed_attributes(used_detectors: &[String], exp_info: &Option<ExpInfo>) -> HashMap<String, String> {
+    let mut attributes = HashMap::new();
 
-                    for (_name, channel_result) in channels.iter() {
-                        dataset[[position.y as usize, position.x as usize, *channel_result as usize]] += 1;
-                    }
-                }
-                _ => {
-                    continue;
-                }
+    if let Some(exp_info) = exp_info {
+        for detector_name in used_detectors {
+            if let Some(filter) = exp_info.get_filter_for_detector(detector_name) {
+                let key = format!("{}_filter", detector_name.to_lowercase());
+                attributes.insert(key, filter);
             }
         }
+    }
 
-        return Ok((dataset, total_events, timer_events));
-    });
+    return attributes;
+}
+
+/// Statistics of every histogram of the layout, by detector and computed detector name
+fn get_stats(layout: &DetectorLayout, running_stats: &[RunningStats]) -> HashMap<String, DetectorStats> {
+    let names = layout
+        .slots
+        .iter()
+        .map(|slot| &slot.name)
+        .chain(layout.computed.iter().map(|computed| &computed.name));
+
+    names
+        .zip(running_stats.iter())
+        .map(|(name, stats)| (name.to_string(), stats.to_stats()))
+        .collect()
+}
+
+/// Source detectors of a computed detector that received events
+fn get_used_detectors(computed: &ComputedSlot, stats: &HashMap<String, DetectorStats>) -> Vec<String> {
+    computed
+        .sources
+        .iter()
+        .filter(|(source, _)| stats[source].events > 0)
+        .map(|(source, _)| source.to_string())
+        .collect()
+}
+
+fn log_stats(stats: &HashMap<String, DetectorStats>) {
+    let nb_events: HashMap<&String, u64> = stats.iter().map(|(name, stats)| (name, stats.events)).collect();
+    info!("Nb events: {:?}", nb_events);
+    for (name, stats) in stats.iter() {
+        if stats.clamped > 0 {
+            warn!("{}: {} events above the last channel", name, stats.clamped);
+        }
+    }
+    debug!("Detector stats: {:?}", stats);
+}
 
-    for position in rx {
-        pb.set_position(position);
+pub fn parse_lst(
+    file_path: &path::Path,
+    config: Config,
+    mode: AccumulationMode,
+    selection: Option<Vec<String>>,
+    threads: usize,
+    progress_options: ProgressOptions,
+    window: ParsingWindow,
+) -> Result<ParsingResult, &'static str> {
+    info!("File to parse: {:?}", file_path);
+    info!("Config used: {:?}", config);
+    info!("Accumulation mode: {:?}", mode);
+    info!("Parsing threads: {}", threads);
+    if window.pixel_roi.is_some() || window.time_window.is_some() || window.byte_range.is_some() {
+        info!("Parsing window: {:?}", window);
     }
 
-    let (dataset, total_events, timer_events) = match handle_dataset.join().expect("Error getting dataset thread") {
-        Ok(dataset) => dataset,
-        Err(_err) => {
-            error!("Error parsing the file");
-            return Err("Error parsing the file");
+    let layout = DetectorLayout::new(&config, selection.as_ref());
+    debug!("Detector layout: {:?}", layout);
+
+    let lst_file = LstFile::open(file_path)?;
+    let map_size = &lst_file.map_size;
+    let exp_info = &lst_file.exp_info;
+
+    let max_x = map_size.get_max_x();
+    let max_y = map_size.get_max_y();
+
+    let full_map = PixelRoi {
+        x0: 0,
+        y0: 0,
+        x1: max_x as usize,
+        y1: max_y as usize,
+    };
+    let roi = match window.pixel_roi {
+        Some(roi) => roi
+            .clip(max_x as usize, max_y as usize)
+            .ok_or("The pixel region of interest is outside of the map")?,
+        None => full_map,
+    };
+    let time_window = match window.time_window {
+        Some(_) if lst_file.timer_reduce == 0 => return Err("The time window needs the timerreduce of the header"),
+        Some((start, end)) => {
+            let timer_reduce = lst_file.timer_reduce as u64;
+            Some(((start / timer_reduce) as u32, (end / timer_reduce) as u32))
         }
+        None => None,
     };
 
-    let mut nb_events: HashMap<String, u32> = HashMap::new();
+    let decoder = EventDecoder::new(&config, &layout, max_x, max_y);
+    let create_histograms = || HistogramSet::with_roi(mode, &layout, roi);
+
+    let (payload, start_position) = get_payload_range(&lst_file, window.byte_range)?;
+    let (parsed, cancelled) = run_with_progress(&lst_file, progress_options, |progress| {
+        let parsed = match time_window {
+            // Timer events are counted from the start of the payload, the parsing is sequential
+            Some((start_timer, end_timer)) => {
+                let sink = TimeWindow::new(create_histograms(), start_timer, end_timer);
+                let chunk = parse_chunk(payload, 0, payload.len(), start_position, &decoder, sink, progress);
+                let timer_events = chunk.sink.timer_events();
+                (chunk.sink.sink, chunk.total_events, timer_events)
+            }
+            None => parse_payload(payload, start_position, threads, &decoder, &create_histograms, progress),
+        };
+        (parsed, progress.is_cancelled())
+    });
+    let (histogram_set, total_events, timer_events) = parsed;
+    if cancelled {
+        info!("Parsing of {:?} cancelled", file_path);
+        return Err("Parsing cancelled");
+    }
 
+    let mut attributes = get_attributes(map_size, exp_info, lst_file.timer_reduce, timer_events);
+    attributes.extend(window.attributes());
+    let parsing_result = build_parsing_result(&layout, histogram_set, attributes, exp_info);
+
+    log_stats(&parsing_result.stats);
+    info!("Total events: {total_events}");
+
+    Ok(parsing_result)
+}
+
+/// The events between the `byte_range` file offsets, and the position at their start
+/// A range starting after the first event starts on the next timer or synchron word,
+/// the position is unknown there.
+fn get_payload_range(
+    lst_file: &LstFile,
+    byte_range: Option<(u64, u64)>,
+) -> Result<(&[u8], Option<Position>), &'static str> {
+    let payload = lst_file.payload();
+    let (start, end) = match byte_range {
+        Some(byte_range) => byte_range,
+        None => return Ok((payload, Some(Position { x: 0, y: 0 }))),
+    };
+
+    let data_offset = lst_file.data_offset as u64;
+    let start = start.saturating_sub(data_offset) as usize;
+    let end = (end.saturating_sub(data_offset) as usize).min(payload.len());
+    if start >= end {
+        return Err("The byte range doesn't contain any event");
+    }
+    if start == 0 {
+        return Ok((&payload[..end], Some(Position { x: 0, y: 0 })));
+    }
+
+    // Words are aligned on 2 bytes from the start of the payload
+    let start = find_resync_word(&payload[..end], start - start % 2).ok_or("No timer word in the byte range")?;
+    debug!("Byte range starts at the payload offset {}", start);
+    Ok((&payload[start..end], None))
+}
+
+/// Move the non-empty histograms into the datasets of a parsing result
+fn build_parsing_result(
+    layout: &DetectorLayout,
+    histogram_set: HistogramSet,
+    attributes: HashMap<String, String>,
+    exp_info: &Option<ExpInfo>,
+) -> ParsingResult {
+    let stats = get_stats(layout, &histogram_set.stats);
     let mut parsing_result = ParsingResult {
         datasets: vec![],
         computed_datasets: vec![],
-        attributes: HashMap::new(),
+        attributes,
+        stats: HashMap::new(),
     };
 
-    // Add acquisition time to attributes
-    let acquisition_time = format_milliseconds(timer_events * timer_reduce);
-    parsing_result.add_attr("acquisition_time".to_string(), acquisition_time.to_owned());
-    parsing_result.add_attr("map_size_width".to_string(), map_size.width.to_string().to_owned());
-    parsing_result.add_attr("map_size_height".to_string(), map_size.height.to_string().to_owned());
-    parsing_result.add_attr("pen_size".to_string(), map_size.pen_size.to_string().to_owned());
-    parsing_result.add_attr(
-        "pixel_size_width".to_string(),
-        map_size.pixel_size_width.to_string().to_owned(),
-    );
-    parsing_result.add_attr(
-        "pixel_size_height".to_string(),
-        map_size.pixel_size_height.to_string().to_owned(),
-    );
+    let mut histograms = histogram_set.histograms.into_iter();
 
-    for (name, detector) in config.detectors.iter() {
-        let slice_dset = get_slice_from_detector(name, detector, &dataset, &config);
-
-        let nb_events_in_detector = slice_dset.iter().sum();
-        nb_events.insert(name.to_string(), nb_events_in_detector);
+    for (slot, histogram) in layout.slots.iter().zip(histograms.by_ref()) {
+        let name = &slot.name;
+        if stats[name].events == 0 {
+            continue;
+        }
 
-        if nb_events_in_detector > 0 {
-            let mut attributes = HashMap::new();
+        // Move the histogram out, the detector dataset is not copied
+        let data = LSTData {
+            name: name.to_string(),
+            attributes: get_detector_attributes(name, exp_info),
+            data: histogram.into_dataset(),
+        };
+        parsing_result.datasets.push(data);
+    }
 
-            if let Some(exp_info) = exp_info.clone() {
-                if let Some(filter) = exp_info.get_filter_for_detector(name) {
-                    attributes.insert("filter".to_string(), filter);
-                }
-            }
+    // The computed detector histograms follow the slot ones
+    for (computed, histogram) in layout.computed.iter().zip(histograms) {
+        let used_detectors = get_used_detectors(computed, &stats);
 
+        // If the computed detector has events and is composed from at least 2 detectors
+        if stats[&computed.name].events > 0 && used_detectors.len() > 1 {
             let data = LSTData {
-                name: name.to_string(),
-                attributes,
-                data: slice_dset,
+                name: used_detectors.join("+"),
+                attributes: get_computed_attributes(&used_detectors, exp_info),
+                data: histogram.into_dataset(),
             };
-            parsing_result.datasets.push(data);
+            parsing_result.computed_datasets.push(data);
         }
     }
 
-    for (name, detector) in config.computed_detectors.iter() {
-        let (computed_dataset, used_detectors) =
-            generate_computed_dataset(&name, &detector.detectors, &config, &map_size, &parsing_result);
+    parsing_result.stats = stats;
+    parsing_result
+}
 
-        let nb_events_in_detector: u32 = computed_dataset.iter().sum();
-        nb_events.insert(name.to_string(), nb_events_in_detector);
+/// Parse a LST file and write the histograms to the "data" group of a new HDF5 file
+///
+/// The datasets never go through Python: they are written from the parsed histograms,
+/// or streamed while parsing if `options.streaming` is set.
+/// A failed or cancelled conversion removes the output file.
+pub fn parse_lst_to_hdf5(
+    file_path: &path::Path,
+    config: Config,
+    selection: Option<Vec<String>>,
+    output_path: &path::Path,
+    options: WriterOptions,
+    progress_options: ProgressOptions,
+) -> Result<HashMap<String, DetectorStats>, String> {
+    if options.streaming {
+        return stream_lst_to_hdf5(
+            file_path,
+            config,
+            selection,
+            output_path,
+            options.band_rows,
+            progress_options,
+        );
+    }
 
-        // If the computed detector has events and is composed from at least 2 detectors
-        if nb_events_in_detector > 0 && used_detectors.len() > 1 {
-            let dset_name = used_detectors.join("+");
-            let mut attributes = HashMap::new();
-
-            if let Some(exp_info) = exp_info.clone() {
-                for detector_name in used_detectors {
-                    if let Some(filter) = exp_info.get_filter_for_detector(&detector_name) {
-                        let key = format!("{}_filter", detector_name.to_lowercase());
-                        attributes.insert(key, filter);
-                    }
-                }
-            }
+    let mode = AccumulationMode::parse(&options.mode)
+        .ok_or_else(|| format!("Unknown accumulation mode: {}", options.mode))?;
+    let threads = match options.threads {
+        0 => thread::available_parallelism().map_or(1, |threads| threads.get()),
+        threads => threads,
+    };
 
-            let data = LSTData {
-                name: dset_name.to_string(),
-                attributes,
-                data: computed_dataset,
-            };
-            parsing_result.computed_datasets.push(data);
+    let parsing_result = parse_lst(
+        file_path,
+        config,
+        mode,
+        selection,
+        threads,
+        progress_options,
+        ParsingWindow::default(),
+    )?;
+
+    info!("Writing {:?}", output_path);
+    let written = hdf5::File::create(output_path).and_then(|file| {
+        let group = file.create_group("data")?;
+        write_parsing_result(&group, &parsing_result)
+    });
+    if let Err(err) = written {
+        error!("Couldn't write {:?}: {}", output_path, err);
+        if output_path.exists() {
+            if let Err(err) = std::fs::remove_file(output_path) {
+                error!("Couldn't remove {:?}: {}", output_path, err);
+            }
         }
+        return Err(err.to_string());
     }
 
-    // Add the data from the ExpInfo to the parsing_result attributes
-    if let Some(exp_info) = exp_info {
-        parsing_result.add_attr("particle".to_string(), exp_info.particle);
-        parsing_result.add_attr("beam_energy".to_string(), exp_info.beam_energy);
-        debug!("ExpInfo metadata added");
-    }
+    Ok(parsing_result.stats)
+}
 
-    info!("Acquisition time: {}", acquisition_time);
-    info!("Nb events: {:?}", nb_events);
-    info!("Total events: {total_events}");
+/// Parse a LST file and stream the histograms to the "data" group of a new HDF5 file
+///
+/// Map rows are written as soon as the parser moved `band_rows` rows past them,
+/// so only a band of rows is held in memory instead of the full (y, x, channel) cubes.
+/// The parsing is sequential, the rows must be seen in acquisition order.
+fn stream_lst_to_hdf5(
+    file_path: &path::Path,
+    config: Config,
+    selection: Option<Vec<String>>,
+    output_path: &path::Path,
+    band_rows: usize,
+    progress_options: ProgressOptions,
+) -> Result<HashMap<String, DetectorStats>, String> {
+    info!("File to parse: {:?}", file_path);
+    info!("Config used: {:?}", config);
+    info!("Output file: {:?}", output_path);
 
-    Ok(parsing_result)
-}
+    let layout = DetectorLayout::new(&config, selection.as_ref());
+    debug!("Detector layout: {:?}", layout);
 
-/// For a given computed detector, get the used detectors and generate the dataset
-fn generate_computed_dataset(
-    name: &String,
-    detectors: &Vec<String>,
-    config: &Config,
-    map_size: &MapSize,
-    parsing_result: &ParsingResult,
-) -> (LSTDataset, Vec<String>) {
-    let max_channels = config.get_max_channels_for_computed_detector(name);
-
-    let mut computed_dataset: LSTDataset = Array3::zeros((
-        map_size.get_max_y() as usize,
-        map_size.get_max_x() as usize,
-        max_channels as usize,
-    ));
-    let mut used_detectors: Vec<String> = Vec::new();
-
-    for detector in detectors {
-        let dset = match parsing_result.get_dataset(detector) {
-            Some(dset) => dset,
-            None => {
-                error!("Couldn't get dataset {} for computed detector {}", detector, name);
-                continue;
-            }
-        };
+    let lst_file = LstFile::open(file_path)?;
+    let max_x = lst_file.map_size.get_max_x();
+    let max_y = lst_file.map_size.get_max_y();
+
+    let file = hdf5::File::create(output_path).map_err(|err| err.to_string())?;
+    let group = file.create_group("data").map_err(|err| err.to_string())?;
+    let writer = RowBandWriter::new(group, &layout, max_x as usize, max_y as usize, band_rows);
 
-        used_detectors.push(detector.to_string());
-        add_data_to_ndarray(&mut computed_dataset, &dset.data);
+    let decoder = EventDecoder::new(&config, &layout, max_x, max_y);
+    let payload = lst_file.payload();
+    let (chunk, cancelled) = run_with_progress(&lst_file, progress_options, |progress| {
+        let start_position = Some(Position { x: 0, y: 0 });
+        let chunk = parse_chunk(payload, 0, payload.len(), start_position, &decoder, writer, progress);
+        (chunk, progress.is_cancelled())
+    });
+    if chunk.truncated {
+        error!("Couldn't read the last event at offset {}: end of file", chunk.end);
+    }
+    if cancelled {
+        info!("Parsing of {:?} cancelled, removing {:?}", file_path, output_path);
+        // Close the file before removing it
+        drop(chunk);
+        drop(file);
+        if let Err(err) = std::fs::remove_file(output_path) {
+            error!("Couldn't remove {:?}: {}", output_path, err);
+        }
+        return Err("Parsing cancelled".to_string());
     }
 
-    debug!("{} dataset shape: {:?}", name, computed_dataset.shape());
+    let attributes = get_attributes(
+        &lst_file.map_size,
+        &lst_file.exp_info,
+        lst_file.timer_reduce,
+        chunk.timer_events,
+    );
+    let stats = chunk
+        .sink
+        .finish(&attributes, &lst_file.exp_info)
+        .map_err(|err| err.to_string())?;
 
-    return (computed_dataset, used_detectors);
-}
+    log_stats(&stats);
+    info!("Total events: {}", chunk.total_events);
 
-fn get_slice_from_detector(name: &String, detector: &Detector, dataset: &LSTDataset, config: &Config) -> LSTDataset {
-    let floor = config.get_floor_for_detector_name(name) as usize;
-    let offset = floor + detector.channels as usize;
-    return dataset.slice(s![.., .., floor..offset]).to_owned();
+    Ok(stats)
 }
 
-fn get_channels_from_buffer(
-    adcnum: Vec<u32>,
-    buffer: &[u8],
+/// Read the header of a LST file and estimate the memory needed by the dense datasets
+pub fn probe_lst(
+    file_path: &path::Path,
     config: &Config,
-    position: &mut Position,
-    max_x: i64,
-    max_y: i64,
-) -> Result<HashMap<String, u32>, &'static str> {
-    let mut channels: HashMap<String, u32> = HashMap::new();
-    #[allow(unused_assignments)] // False positive
-    let mut adc_buffer = [0; 2];
-
-    for (i, adc) in adcnum.iter().enumerate() {
-        let adc_buffer_result = buffer[i * 2..i * 2 + 2].try_into();
-        adc_buffer = match adc_buffer_result {
-            Ok(adc_buffer) => adc_buffer,
-            Err(_err) => {
-                return Err("Couldn't convert buffer to adc_buffer");
-            }
-        };
+    selection: Option<Vec<String>>,
+) -> Result<LSTProbe, &'static str> {
+    let file = File::open(file_path).map_err(|_| "Error opening file")?;
+    let file_size = file.metadata().map_err(|_| "Error reading file metadata")?.len();
 
-        let int_value = u16::from_le_bytes(adc_buffer);
-
-        if *adc == config.x {
-            // Calculate the mask to handle values up to max_x
-            let mask = ((1 << ((max_x as f64).log2().ceil() as u16 + 1)) - 1) as u16;
-            // Apply mask to the value
-            position.x = int_value & mask;
-        } else if *adc == config.y {
-            // Calculate the mask to handle values up to max_y
-            let mask = ((1 << ((max_y as f64).log2().ceil() as u16 + 1)) - 1) as u16;
-            // Apply mask to the value
-            position.y = int_value & mask;
-        } else {
-            if let Some((name, detector, floor)) = config.get_detector_and_floor_for_adc(*adc) {
-                if int_value > 0 {
-                    let channel = std::cmp::min(u32::from(int_value), detector.channels - (1 as u32));
-                    channels.insert(name.to_string(), channel + floor);
-                }
-            }
-        }
-    }
+    let mut reader = BufReader::new(file);
+    let (map_size, exp_info, timer_reduce) = read_header(&mut reader)?;
+    let data_offset = reader.stream_position().map_err(|_| "Error reading file")?;
 
-    return Ok(channels);
+    let max_x = map_size.get_max_x();
+    let max_y = map_size.get_max_y();
+    let layout = DetectorLayout::new(config, selection.as_ref());
+    let names = layout
+        .slots
+        .iter()
+        .map(|slot| &slot.name)
+        .chain(layout.computed.iter().map(|computed| &computed.name));
+    let dataset_bytes = names
+        .zip(layout.histogram_channels())
+        .map(|(name, channels)| {
+            let bytes = max_x.max(0) as u64 * max_y.max(0) as u64 * channels as u64 * 4;
+            (name.to_string(), bytes)
+        })
+        .collect();
+
+    Ok(LSTProbe {
+        file_size,
+        data_offset,
+        map_size_width: map_size.width,
+        map_size_height: map_size.height,
+        pixel_size_width: map_size.pixel_size_width,
+        pixel_size_height: map_size.pixel_size_height,
+        pen_size: map_size.pen_size,
+        max_x,
+        max_y,
+        timer_reduce,
+        particle: exp_info.as_ref().map(|exp_info| exp_info.particle.to_string()),
+        beam_energy: exp_info.as_ref().map(|exp_info| exp_info.beam_energy.to_string()),
+        dataset_bytes,
+    })
 }
 
 /// Read the LST header up to the [LISTDATA] keyword
 /// Return a MapSize and an optional ExpInfo
-fn read_header(reader: &mut BufReader<File>) -> Result<(MapSize, Option<ExpInfo>, u32), &'static str> {
+fn read_header<R: BufRead>(reader: &mut R) -> Result<(MapSize, Option<ExpInfo>, u32), &'static str> {
     let mut map_size: Option<MapSize> = None;
     let mut exp_info: Option<ExpInfo> = None;
     let mut timer_reduce: u32 = 0;
 
     loop {
         let mut line = String::new();
-        let bytes_read = reader.read_line(&mut line).expect("Couldn't read line");
+        let bytes_read = reader.read_line(&mut line).map_err(|_| "Couldn't read header")?;
         let content = line.trim();
 
         if content.contains("Map size") {
@@ -367,3 +642,69 @@ fn read_header(reader: &mut BufReader<File>) -> Result<(MapSize, Option<ExpInfo>
 
     return Err("Couldn't read header");
 }
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::converter::config::{ComputedDetector, Detector};
+    use std::{collections::BTreeMap, io::Write};
+
+    #[test]
+    fn test_probe_lst() {
+        let mut detectors: BTreeMap<String, Detector> = BTreeMap::new();
+        for (name, adc, channels) in [("HE1", 1, 2048), ("HE2", 2, 1024)] {
+            detectors.insert(
+                name.to_string(),
+                Detector {
+                    adc,
+                    channels,
+                    file_extension: None,
+                },
+            );
+        }
+        let mut computed_detectors: BTreeMap<String, ComputedDetector> = BTreeMap::new();
+        computed_detectors.insert(
+            "HE12".to_string(),
+            ComputedDetector {
+                detectors: vec!["HE1".to_string(), "HE2".to_string()],
+                file_extension: None,
+            },
+        );
+        let config = Config {
+            x: 256,
+            y: 512,
+            detectors,
+            computed_detectors,
+            adcs: vec![],
+            edf: None,
+        };
+
+        let header = "[MPA4A] 0.0.1\r\ncmline0=Map size:1000,500,50,50,100\r\n\
+                      cmline1=Exp.Info:proton,3000,Be,Al,Cu,Mylar,Ag\r\ntimerreduce=10\r\n[LISTDATA]\r\n";
+        let mut file = tempfile::NamedTempFile::new().unwrap();
+        file.write_all(header.as_bytes()).unwrap();
+        file.write_all(&[0xFF; 64]).unwrap();
+
+        let probe = probe_lst(file.path(), &config, None).unwrap();
+
+        assert_eq!(probe.file_size, header.len() as u64 + 64);
+        assert_eq!(probe.data_offset, header.len() as u64);
+        assert_eq!((probe.max_x, probe.max_y), (20, 10));
+        assert_eq!(probe.timer_reduce, 10);
+        assert_eq!(probe.particle.as_deref(), Some("proton"));
+        assert_eq!(probe.dataset_bytes["HE1"], 20 * 10 * 2048 * 4);
+        assert_eq!(probe.dataset_bytes["HE2"], 20 * 10 * 1024 * 4);
+        assert_eq!(probe.dataset_bytes["HE12"], 20 * 10 * 2048 * 4);
+    }
+
+    #[test]
+    fn test_open_invalid_lst_file() {
+        let directory = tempfile::tempdir().unwrap();
+        assert_eq!(LstFile::open(&directory.path().join("missing.lst")).err(), Some("Error opening file"));
+
+        // No map size in the header
+        let mut file = tempfile::NamedTempFile::new().unwrap();
+        file.write_all(b"[MPA4A] 0.0.1\r\n[LISTDATA]\r\n").unwrap();
+        assert_eq!(LstFile::open(file.path()).err(), Some("Couldn't read header"));
+    }
+}
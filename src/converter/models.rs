@@ -1,5 +1,5 @@
 use ndarray::Array3;
-use numpy::PyArray3;
+use numpy::{IntoPyArray, PyArray3};
 use pyo3::{prelude::*, PyResult, Python};
 use std::collections::HashMap;
 
@@ -96,50 +96,163 @@ impl ExpInfo {
 
 pub type LSTDataset = Array3<u32>;
 
-#[pyclass]
 #[derive(Debug, Clone)]
 pub struct LSTData {
-    #[pyo3(get, set)]
     pub name: String,
-    #[pyo3(get, set)]
     pub attributes: HashMap<String, String>,
     pub data: LSTDataset,
 }
 
-#[pymethods]
 impl LSTData {
+    /// Hand the dataset over to NumPy, the array memory is moved, not copied
+    pub fn into_py_data(self, py: Python) -> PyResult<Py<PyLSTData>> {
+        let data = self.data.into_pyarray(py).to_owned();
+        Py::new(
+            py,
+            PyLSTData {
+                name: self.name,
+                attributes: self.attributes,
+                data,
+            },
+        )
+    }
+}
+
+/// Header of a LST file and the memory needed to parse it, read without parsing the events
+#[pyclass(name = "LSTProbe")]
+#[derive(Debug, Clone)]
+pub struct LSTProbe {
+    #[pyo3(get)]
+    pub file_size: u64,
+    /// Offset of the first event, after the [LISTDATA] keyword
+    #[pyo3(get)]
+    pub data_offset: u64,
+    #[pyo3(get)]
+    pub map_size_width: u32,
+    #[pyo3(get)]
+    pub map_size_height: u32,
+    #[pyo3(get)]
+    pub pixel_size_width: u32,
+    #[pyo3(get)]
+    pub pixel_size_height: u32,
+    #[pyo3(get)]
+    pub pen_size: u32,
+    /// Number of map pixels along x and y
+    #[pyo3(get)]
+    pub max_x: i64,
+    #[pyo3(get)]
+    pub max_y: i64,
+    #[pyo3(get)]
+    pub timer_reduce: u32,
+    #[pyo3(get)]
+    pub particle: Option<String>,
+    #[pyo3(get)]
+    pub beam_energy: Option<String>,
+    /// Size in bytes of the dense dataset of every detector and computed detector
+    #[pyo3(get)]
+    pub dataset_bytes: HashMap<String, u64>,
+}
+
+#[pymethods]
+impl LSTProbe {
+    /// Size in bytes of all the dense datasets
     #[getter]
-    fn get_data(&self) -> PyResult<Py<PyArray3<u32>>> {
-        Python::with_gil(|py| {
-            let data = self.data.clone();
-            let array = PyArray3::from_array(py, &data);
-            return Ok(array.to_owned());
-        })
+    fn total_bytes(&self) -> u64 {
+        self.dataset_bytes.values().sum()
+    }
+
+    fn __repr__(&self) -> String {
+        format!(
+            "LSTProbe(file_size={}, map={}x{}, datasets={:?})",
+            self.file_size, self.max_x, self.max_y, self.dataset_bytes
+        )
     }
 }
 
+/// Statistics of a detector collected while parsing
 #[pyclass]
+#[derive(Debug, Clone, PartialEq, Eq)]
+pub struct DetectorStats {
+    /// Number of counted events
+    #[pyo3(get)]
+    pub events: u64,
+    /// Highest channel that received an event
+    #[pyo3(get)]
+    pub max_channel: Option<u32>,
+    /// Number of map pixels that received at least one event
+    #[pyo3(get)]
+    pub pixels: u64,
+    /// Number of events above the last channel, counted in the last channel
+    #[pyo3(get)]
+    pub clamped: u64,
+}
+
+#[pymethods]
+impl DetectorStats {
+    fn __repr__(&self) -> String {
+        format!(
+            "DetectorStats(events={}, max_channel={:?}, pixels={}, clamped={})",
+            self.events, self.max_channel, self.pixels, self.clamped
+        )
+    }
+}
+
 #[derive(Debug, Clone)]
 pub struct ParsingResult {
-    #[pyo3(get, set)]
     pub datasets: Vec<LSTData>,
-    #[pyo3(get, set)]
     pub computed_datasets: Vec<LSTData>,
-    #[pyo3(get, set)]
     pub attributes: HashMap<String, String>,
+    /// Statistics of every detector and computed detector, by config name
+    pub stats: HashMap<String, DetectorStats>,
 }
 
 impl ParsingResult {
-    pub fn get_dataset(&self, name: &str) -> Option<&LSTData> {
-        for dataset in &self.datasets {
-            if dataset.name == name {
-                return Some(dataset);
-            }
-        }
-        return None;
-    }
+    /// Convert the result to its Python class, without copying the datasets
+    pub fn into_py_result(self, py: Python) -> PyResult<PyParsingResult> {
+        let datasets = self
+            .datasets
+            .into_iter()
+            .map(|dataset| dataset.into_py_data(py))
+            .collect::<PyResult<Vec<Py<PyLSTData>>>>()?;
+        let computed_datasets = self
+            .computed_datasets
+            .into_iter()
+            .map(|dataset| dataset.into_py_data(py))
+            .collect::<PyResult<Vec<Py<PyLSTData>>>>()?;
 
-    pub fn add_attr(&mut self, key: String, value: String) {
-        self.attributes.insert(key, value);
+        Ok(PyParsingResult {
+            datasets,
+            computed_datasets,
+            attributes: self.attributes,
+            stats: self.stats,
+        })
     }
 }
+
+/// LSTData exposed to Python
+/// The NumPy array owns the parsed data, accessing it does not copy anything.
+#[pyclass(name = "LSTData")]
+#[derive(Debug)]
+pub struct PyLSTData {
+    #[pyo3(get, set)]
+    pub name: String,
+    #[pyo3(get, set)]
+    pub attributes: HashMap<String, String>,
+    #[pyo3(get)]
+    pub data: Py<PyArray3<u32>>,
+}
+
+/// ParsingResult exposed to Python
+/// The datasets are shared references, accessing them does not copy anything.
+#[pyclass(name = "ParsingResult")]
+#[derive(Debug)]
+pub struct PyParsingResult {
+    #[pyo3(get, set)]
+    pub datasets: Vec<Py<PyLSTData>>,
+    #[pyo3(get, set)]
+    pub computed_datasets: Vec<Py<PyLSTData>>,
+    #[pyo3(get, set)]
+    pub attributes: HashMap<String, String>,
+    #[pyo3(get)]
+    pub stats: HashMap<String, DetectorStats>,
+}
@@ -0,0 +1,117 @@
+use pyo3::prelude::*;
+use std::{
+    sync::{
+        atomic::{AtomicBool, AtomicU64, Ordering},
+        Arc,
+    },
+    time::Duration,
+};
+
+/// Number of words parsed between two progress updates and cancellation checks
+pub const PROGRESS_WORDS: usize = 1 << 16;
+
+/// Parsing progress shared between the parsing threads and the reporter
+#[derive(Debug, Default)]
+pub struct Progress {
+    parsed_bytes: AtomicU64,
+    events: AtomicU64,
+    cancel: Arc<AtomicBool>,
+}
+
+impl Progress {
+    pub fn new(cancel: Arc<AtomicBool>) -> Progress {
+        Progress {
+            parsed_bytes: AtomicU64::new(0),
+            events: AtomicU64::new(0),
+            cancel,
+        }
+    }
+
+    #[inline]
+    pub fn add(&self, parsed_bytes: u64, events: u64) {
+        self.parsed_bytes.fetch_add(parsed_bytes, Ordering::Relaxed);
+        self.events.fetch_add(events, Ordering::Relaxed);
+    }
+
+    pub fn parsed_bytes(&self) -> u64 {
+        self.parsed_bytes.load(Ordering::Relaxed)
+    }
+
+    pub fn events(&self) -> u64 {
+        self.events.load(Ordering::Relaxed)
+    }
+
+    #[inline]
+    pub fn is_cancelled(&self) -> bool {
+        self.cancel.load(Ordering::Relaxed)
+    }
+
+    pub fn cancel(&self) {
+        self.cancel.store(true, Ordering::Relaxed);
+    }
+}
+
+/// A progress report sent to the progress callback
+#[derive(Debug, Clone, Copy)]
+pub struct ProgressUpdate {
+    pub parsed_bytes: u64,
+    pub total_bytes: u64,
+    pub events: u64,
+    pub events_per_second: f64,
+}
+
+/// Called with the progress of the parsing, an error cancels the parsing
+pub type ProgressCallback = Box<dyn FnMut(ProgressUpdate) -> Result<(), String> + Send>;
+
+/// How the progress of a parsing is reported
+pub struct ProgressOptions {
+    /// Draw a progress bar on the terminal
+    pub progress_bar: bool,
+    pub callback: Option<ProgressCallback>,
+    /// Minimum delay between two calls of the callback
+    pub interval: Duration,
+    /// The parsing stops once this flag is set
+    pub cancel: Arc<AtomicBool>,
+}
+
+impl Default for ProgressOptions {
+    fn default() -> Self {
+        ProgressOptions {
+            progress_bar: true,
+            callback: None,
+            interval: Duration::from_millis(500),
+            cancel: Arc::new(AtomicBool::new(false)),
+        }
+    }
+}
+
+/// Token to cancel a parsing running in another thread
+#[pyclass]
+#[derive(Debug, Clone, Default)]
+pub struct CancelToken {
+    flag: Arc<AtomicBool>,
+}
+
+impl CancelToken {
+    pub fn flag(&self) -> Arc<AtomicBool> {
+        self.flag.clone()
+    }
+}
+
+#[pymethods]
+impl CancelToken {
+    #[new]
+    fn py_new() -> Self {
+        CancelToken::default()
+    }
+
+    /// Stop the parsing using this token
+    fn cancel(&self) {
+        self.flag.store(true, Ordering::Relaxed);
+    }
+
+    #[getter]
+    fn cancelled(&self) -> bool {
+        self.flag.load(Ordering::Relaxed)
+    }
+}
@@ -0,0 +1,80 @@
+use crate::converter::models::DetectorStats;
+
+/// Statistics of a detector histogram, updated for every counted event
+#[derive(Debug, Clone)]
+pub struct RunningStats {
+    pub events: u64,
+    pub max_channel: Option<u32>,
+    pub clamped: u64,
+    /// One bit per map pixel that received an event
+    pixels: Vec<u64>,
+}
+
+impl RunningStats {
+    pub fn new(nb_pixels: usize) -> RunningStats {
+        RunningStats {
+            events: 0,
+            max_channel: None,
+            clamped: 0,
+            pixels: vec![0; (nb_pixels + 63) / 64],
+        }
+    }
+
+    #[inline]
+    pub fn record(&mut self, pixel: usize, channel: u32, clamped: bool) {
+        self.events += 1;
+        self.max_channel = Some(self.max_channel.map_or(channel, |max_channel| max_channel.max(channel)));
+        self.clamped += clamped as u64;
+        self.pixels[pixel / 64] |= 1 << (pixel % 64);
+    }
+
+    /// Add the statistics of another part of the same map
+    pub fn merge(&mut self, other: &RunningStats) {
+        self.events += other.events;
+        self.max_channel = self.max_channel.max(other.max_channel);
+        self.clamped += other.clamped;
+        for (pixels, other_pixels) in self.pixels.iter_mut().zip(other.pixels.iter()) {
+            *pixels |= other_pixels;
+        }
+    }
+
+    /// Number of pixels that received at least one event
+    pub fn pixels(&self) -> u64 {
+        self.pixels.iter().map(|pixels| pixels.count_ones() as u64).sum()
+    }
+
+    pub fn to_stats(&self) -> DetectorStats {
+        DetectorStats {
+            events: self.events,
+            max_channel: self.max_channel,
+            pixels: self.pixels(),
+            clamped: self.clamped,
+        }
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_running_stats() {
+        let mut stats = RunningStats::new(130);
+        assert_eq!(stats.to_stats().max_channel, None);
+
+        stats.record(0, 12, false);
+        stats.record(0, 3, false);
+        stats.record(129, 511, true);
+
+        let mut other = RunningStats::new(130);
+        other.record(64, 40, false);
+        other.record(129, 2, false);
+        stats.merge(&other);
+
+        let stats = stats.to_stats();
+        assert_eq!(stats.events, 5);
+        assert_eq!(stats.max_channel, Some(511));
+        assert_eq!(stats.pixels, 3);
+        assert_eq!(stats.clamped, 1);
+    }
+}
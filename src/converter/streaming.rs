@@ -0,0 +1,375 @@
+use log::{debug, error, warn};
+use ndarray::{s, Array2, Array3, ArrayView2, Axis};
+use std::collections::{BTreeMap, HashMap};
+
+use crate::converter::chunks::HitSink;
+use crate::converter::decoder::{Hit, Position};
+use crate::converter::layout::DetectorLayout;
+use crate::converter::models::{DetectorStats, ExpInfo};
+use crate::converter::stats::RunningStats;
+use crate::converter::writer::{create_dataset, to_stored_count, write_attr};
+use crate::converter::{get_computed_attributes, get_detector_attributes, get_stats, get_used_detectors};
+
+/// Counts of one map row for every histogram of the layout, (x, channel) indexed
+type Row = Vec<Option<Array2<u32>>>;
+
+/// A dataset of the output file, only created once a row with events is written
+struct StreamedDataset {
+    name: String,
+    channels: usize,
+    dataset: Option<hdf5::Dataset>,
+    /// Converted counts of the row being written, allocated with the dataset
+    row: Array3<i32>,
+    stats: RunningStats,
+}
+
+impl StreamedDataset {
+    fn new(name: String, channels: usize, nb_pixels: usize) -> StreamedDataset {
+        StreamedDataset {
+            name,
+            channels,
+            dataset: None,
+            row: Array3::zeros((0, 0, 0)),
+            stats: RunningStats::new(nb_pixels),
+        }
+    }
+}
+
+/// Writes the detector histograms to a HDF5 group while the events are parsed
+///
+/// Events of a LST map are acquired row after row. The counts of the open rows
+/// are kept in memory, and a row is written once the parser is `band_rows` rows
+/// past it. The rare events coming back to a written row are kept aside and
+/// added to the file when the writer is finished.
+///
+/// Computed detectors are accumulated with their sources and written under a
+/// temporary name until the detectors they are actually composed of are known.
+pub struct RowBandWriter {
+    group: hdf5::Group,
+    layout: DetectorLayout,
+    max_x: usize,
+    max_y: usize,
+    band_rows: usize,
+    /// Datasets of the detector slots followed by the ones of the computed detectors
+    datasets: Vec<StreamedDataset>,
+    open_rows: BTreeMap<usize, Row>,
+    /// Rows before this one were written to the file
+    flushed_rows: usize,
+    /// Counts received for rows already written, by row and (histogram, x, channel)
+    late_hits: BTreeMap<usize, HashMap<(usize, usize, usize), u32>>,
+    /// Events with a position out of the map, skipped
+    skipped_hits: u64,
+    /// First error raised while writing, returned by `finish`
+    error: Option<hdf5::Error>,
+}
+
+impl RowBandWriter {
+    pub fn new(
+        group: hdf5::Group,
+        layout: &DetectorLayout,
+        max_x: usize,
+        max_y: usize,
+        band_rows: usize,
+    ) -> RowBandWriter {
+        let datasets = layout
+            .slots
+            .iter()
+            .map(|slot| StreamedDataset::new(slot.name.to_string(), slot.channels as usize, max_y * max_x))
+            .chain(layout.computed.iter().map(|computed| {
+                let name = format!("__computed_{}", computed.name);
+                StreamedDataset::new(name, computed.channels as usize, max_y * max_x)
+            }))
+            .collect();
+
+        RowBandWriter {
+            group,
+            layout: layout.clone(),
+            max_x,
+            max_y,
+            band_rows: band_rows.max(1),
+            datasets,
+            open_rows: BTreeMap::new(),
+            flushed_rows: 0,
+            late_hits: BTreeMap::new(),
+            skipped_hits: 0,
+            error: None,
+        }
+    }
+
+    /// Write the open rows before `until`
+    fn flush_rows(&mut self, until: usize) {
+        let remaining = self.open_rows.split_off(&until);
+        let rows = std::mem::replace(&mut self.open_rows, remaining);
+        for (y, row) in rows {
+            self.write_row(y, &row, false);
+        }
+        self.flushed_rows = until;
+    }
+
+    fn write_row(&mut self, y: usize, row: &Row, accumulate: bool) {
+        if self.error.is_some() {
+            return;
+        }
+        if let Err(err) = self.try_write_row(y, row, accumulate) {
+            error!("Couldn't write row {}: {}", y, err);
+            self.error = Some(err);
+        }
+    }
+
+    fn try_write_row(&mut self, y: usize, row: &Row, accumulate: bool) -> hdf5::Result<()> {
+        let shape = (self.max_y, self.max_x);
+
+        for (histogram, counts) in row.iter().enumerate() {
+            if let Some(counts) = counts {
+                write_counts(&self.group, &mut self.datasets[histogram], shape, y, counts.view(), accumulate)?;
+            }
+        }
+
+        Ok(())
+    }
+
+    /// Count an event of a row still in memory
+    #[inline]
+    fn increment(&mut self, histogram: usize, y: usize, x: usize, channel: usize) {
+        let nb_histograms = self.datasets.len();
+        let (max_x, channels) = (self.max_x, self.datasets[histogram].channels);
+        let row = self.open_rows.entry(y).or_insert_with(|| vec![None; nb_histograms]);
+        row[histogram].get_or_insert_with(|| Array2::zeros((max_x, channels)))[[x, channel]] += 1;
+    }
+
+    /// Write the remaining rows and the attributes, and name the computed datasets
+    /// Return the statistics of every detector.
+    pub fn finish(
+        mut self,
+        attributes: &HashMap<String, String>,
+        exp_info: &Option<ExpInfo>,
+    ) -> hdf5::Result<HashMap<String, DetectorStats>> {
+        self.flush_rows(usize::MAX);
+        if self.skipped_hits > 0 {
+            warn!("Events out of the map skipped: {}", self.skipped_hits);
+        }
+
+        let late_hits = std::mem::take(&mut self.late_hits);
+        debug!("Rows written again for late events: {}", late_hits.len());
+        for (y, hits) in late_hits {
+            let mut row: Row = vec![None; self.datasets.len()];
+            for ((histogram, x, channel), count) in hits {
+                let channels = self.datasets[histogram].channels;
+                row[histogram].get_or_insert_with(|| Array2::zeros((self.max_x, channels)))[[x, channel]] += count;
+            }
+            self.write_row(y, &row, true);
+        }
+
+        if let Some(err) = self.error.take() {
+            return Err(err);
+        }
+
+        for (key, value) in attributes {
+            write_attr(&self.group, key, value)?;
+        }
+
+        let running_stats: Vec<RunningStats> = self.datasets.iter().map(|output| output.stats.clone()).collect();
+        let stats = get_stats(&self.layout, &running_stats);
+        let nb_slots = self.layout.slots.len();
+
+        for detector in self.datasets[..nb_slots].iter() {
+            if let Some(dataset) = &detector.dataset {
+                for (key, value) in get_detector_attributes(&detector.name, exp_info) {
+                    write_attr(dataset, &key, &value)?;
+                }
+            }
+        }
+
+        for (computed, output) in self.layout.computed.iter().zip(self.datasets[nb_slots..].iter()) {
+            let dataset = match &output.dataset {
+                Some(dataset) => dataset,
+                None => continue,
+            };
+
+            let used_detectors = get_used_detectors(computed, &stats);
+
+            // If the computed detector is composed from at least 2 detectors
+            if used_detectors.len() > 1 {
+                self.group.relink(&output.name, &used_detectors.join("+"))?;
+                for (key, value) in get_computed_attributes(&used_detectors, exp_info) {
+                    write_attr(dataset, &key, &value)?;
+                }
+            } else {
+                self.group.unlink(&output.name)?;
+            }
+        }
+
+        Ok(stats)
+    }
+}
+
+impl HitSink for RowBandWriter {
+    #[inline]
+    fn add_hit(&mut self, position: Position, hit: &Hit) {
+        let (y, x, channel) = (position.y as usize, position.x as usize, hit.channel as usize);
+        if y >= self.max_y || x >= self.max_x {
+            // Skipped like the dense histograms do
+            self.skipped_hits += 1;
+            return;
+        }
+
+        for index in 0..=self.layout.targets[hit.slot].len() {
+            // The slot itself, then the computed detectors it feeds
+            let histogram = if index == 0 { hit.slot } else { self.layout.targets[hit.slot][index - 1] };
+            self.datasets[histogram].stats.record(y * self.max_x + x, hit.channel, hit.clamped);
+
+            if y < self.flushed_rows {
+                *self
+                    .late_hits
+                    .entry(y)
+                    .or_default()
+                    .entry((histogram, x, channel))
+                    .or_insert(0) += 1;
+            } else {
+                self.increment(histogram, y, x, channel);
+            }
+        }
+
+        // The rows far enough behind the current one are complete
+        if y >= self.flushed_rows + self.band_rows {
+            self.flush_rows(y + 1 - self.band_rows);
+        }
+    }
+}
+
+/// Write the counts of a map row, adding them to the stored ones if `accumulate`
+fn write_counts(
+    group: &hdf5::Group,
+    output: &mut StreamedDataset,
+    shape: (usize, usize),
+    y: usize,
+    counts: ArrayView2<u32>,
+    accumulate: bool,
+) -> hdf5::Result<()> {
+    if output.dataset.is_none() {
+        output.dataset = Some(create_dataset(group, &output.name, shape, output.channels)?);
+        output.row = Array3::zeros((1, shape.1, output.channels));
+    }
+    let dataset = output.dataset.as_ref().unwrap();
+
+    let row = &mut output.row;
+    row.index_axis_mut(Axis(0), 0)
+        .zip_mut_with(&counts, |stored, &count| *stored = to_stored_count(count));
+    if accumulate {
+        let stored: Array3<i32> = dataset.read_slice(s![y..y + 1, .., ..])?;
+        row.zip_mut_with(&stored, |count, stored| *count = count.saturating_add(*stored));
+    }
+    dataset.write_slice(&*row, s![y..y + 1, .., ..])
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::converter::config::{ComputedDetector, Detector};
+    use crate::converter::config::Config;
+    use crate::converter::histograms::{AccumulationMode, HistogramSet};
+    use hdf5::types::VarLenUnicode;
+
+    fn config() -> Config {
+        let mut detectors: BTreeMap<String, Detector> = BTreeMap::new();
+        for (name, adc, channels) in [("HE1", 1, 8), ("HE2", 2, 4), ("RBS", 64, 6)] {
+            detectors.insert(
+                name.to_string(),
+                Detector {
+                    adc,
+                    channels,
+                    file_extension: None,
+                },
+            );
+        }
+        let mut computed_detectors: BTreeMap<String, ComputedDetector> = BTreeMap::new();
+        computed_detectors.insert(
+            "HE12".to_string(),
+            ComputedDetector {
+                detectors: vec!["HE1".to_string(), "HE2".to_string()],
+                file_extension: None,
+            },
+        );
+        computed_detectors.insert(
+            "HE1RBS".to_string(),
+            ComputedDetector {
+                detectors: vec!["HE1".to_string(), "RBS".to_string()],
+                file_extension: None,
+            },
+        );
+
+        Config {
+            x: 256,
+            y: 512,
+            detectors,
+            computed_detectors,
+            adcs: vec![],
+            edf: None,
+        }
+    }
+
+    #[test]
+    fn test_row_band_writer_matches_histograms() {
+        let config = config();
+        let layout = DetectorLayout::new(&config, None);
+        let (max_y, max_x) = (6, 5);
+
+        // Rows in acquisition order, with a late event on row 0, events out of the map and none on RBS
+        let hits: Vec<(u16, u16, usize, u32)> = vec![
+            (0, 0, 0, 1),
+            (1, 0, 1, 3),
+            (2, 1, 0, 7),
+            (3, 4, 0, 2),
+            (6, 0, 0, 1),
+            (3, 5, 1, 2),
+            (4, 2, 1, 0),
+            (0, 1, 1, 2),
+            (5, 3, 0, 7),
+            (5, 3, 0, 7),
+        ];
+
+        let directory = tempfile::tempdir().unwrap();
+        let file = hdf5::File::create(directory.path().join("out.hdf5")).unwrap();
+        let group = file.create_group("data").unwrap();
+        let mut writer = RowBandWriter::new(group.clone(), &layout, max_x, max_y, 2);
+        let mut histograms = HistogramSet::new(AccumulationMode::Dense, &layout, max_y, max_x);
+
+        for &(y, x, slot, channel) in hits.iter() {
+            let position = Position { x, y };
+            let hit = Hit {
+                slot,
+                channel,
+                clamped: false,
+            };
+            writer.add_hit(position, &hit);
+            histograms.add_hit(position, &hit);
+        }
+
+        let mut attributes = HashMap::new();
+        attributes.insert("pen_size".to_string(), "500".to_string());
+        let stats = writer.finish(&attributes, &None).unwrap();
+
+        assert_eq!(stats["HE1"].events, 5);
+        assert_eq!(stats["HE2"].events, 3);
+        assert_eq!(stats["RBS"].events, 0);
+        assert_eq!(stats["HE12"].events, 8);
+        assert_eq!(stats["HE1RBS"].events, 5);
+        assert_eq!(stats["HE12"], histograms.stats[3].to_stats());
+
+        // HE1RBS is left out, only one of its sources has events
+        let names = ["HE1", "HE2", "RBS", "HE1+HE2"];
+        for (name, histogram) in names.iter().zip(histograms.histograms.into_iter()) {
+            match group.dataset(name) {
+                Ok(dataset) => {
+                    let stored: Array3<i32> = dataset.read().unwrap();
+                    assert_eq!(stored, histogram.into_dataset().mapv(|count| count as i32));
+                }
+                Err(_) => assert_eq!(*name, "RBS"),
+            }
+        }
+        assert_eq!(group.member_names().unwrap(), ["HE1", "HE1+HE2", "HE2"]);
+
+        let pen_size: VarLenUnicode = group.attr("pen_size").unwrap().read_scalar().unwrap();
+        assert_eq!(pen_size.as_str(), "500");
+    }
+}
@@ -0,0 +1,107 @@
+use std::collections::HashMap;
+
+use crate::converter::chunks::HitSink;
+use crate::converter::decoder::{Hit, Position};
+use crate::converter::histograms::PixelRoi;
+
+/// Part of a LST file to parse, everything is parsed by default
+#[derive(Debug, Clone, Copy, Default)]
+pub struct ParsingWindow {
+    /// Only keep the events of this map region, the histograms are sized by the region
+    pub pixel_roi: Option<PixelRoi>,
+    /// Only keep the events between these times in milliseconds, from the start of the parsed bytes
+    pub time_window: Option<(u64, u64)>,
+    /// Only parse the events between these file offsets
+    pub byte_range: Option<(u64, u64)>,
+}
+
+impl ParsingWindow {
+    /// Attributes describing the window, to tell partial datasets apart
+    pub fn attributes(&self) -> HashMap<String, String> {
+        let mut attributes = HashMap::new();
+        if let Some(roi) = self.pixel_roi {
+            let value = format!("{},{},{},{}", roi.x0, roi.y0, roi.x1, roi.y1);
+            attributes.insert("pixel_roi".to_string(), value);
+        }
+        if let Some((start, end)) = self.time_window {
+            attributes.insert("time_window".to_string(), format!("{},{}", start, end));
+        }
+        if let Some((start, end)) = self.byte_range {
+            attributes.insert("byte_range".to_string(), format!("{},{}", start, end));
+        }
+        attributes
+    }
+}
+
+/// Forward the hits received between two timer events and stop the parsing after the last one
+pub struct TimeWindow<S: HitSink> {
+    pub sink: S,
+    timer_events: u32,
+    start_timer: u32,
+    end_timer: u32,
+}
+
+impl<S: HitSink> TimeWindow<S> {
+    /// Keep the hits received after `start_timer` timer events and before `end_timer` ones
+    pub fn new(sink: S, start_timer: u32, end_timer: u32) -> TimeWindow<S> {
+        TimeWindow {
+            sink,
+            timer_events: 0,
+            start_timer,
+            end_timer,
+        }
+    }
+
+    /// Number of timer events inside the window
+    pub fn timer_events(&self) -> u32 {
+        self.timer_events.min(self.end_timer).saturating_sub(self.start_timer)
+    }
+}
+
+impl<S: HitSink> HitSink for TimeWindow<S> {
+    #[inline]
+    fn add_hit(&mut self, position: Position, hit: &Hit) {
+        if self.timer_events >= self.start_timer {
+            self.sink.add_hit(position, hit);
+        }
+    }
+
+    #[inline]
+    fn add_timer(&mut self) -> bool {
+        self.timer_events += 1;
+        self.timer_events < self.end_timer
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[derive(Default)]
+    struct Counter {
+        hits: usize,
+    }
+
+    impl HitSink for Counter {
+        fn add_hit(&mut self, _position: Position, _hit: &Hit) {
+            self.hits += 1;
+        }
+    }
+
+    #[test]
+    fn test_time_window() {
+        let mut window = TimeWindow::new(Counter::default(), 2, 4);
+        let position = Position { x: 0, y: 0 };
+        let hit = Hit::default();
+
+        let mut running = true;
+        while running {
+            window.add_hit(position, &hit);
+            running = window.add_timer();
+        }
+
+        // Hits after the second and the third timer events
+        assert_eq!(window.sink.hits, 2);
+        assert_eq!(window.timer_events(), 2);
+    }
+}
@@ -0,0 +1,179 @@
+use hdf5::types::VarLenUnicode;
+use log::debug;
+use ndarray::{s, Array3, Axis};
+use pyo3::prelude::*;
+use std::str::FromStr;
+
+use crate::converter::models::{LSTData, ParsingResult};
+
+/// Number of counts in a HDF5 chunk (1 MiB of i32)
+const CHUNK_COUNTS: usize = 1 << 18;
+
+/// How `parse_lst_to_hdf5` parses and writes a LST file
+///
+/// Args:
+///    streaming (bool): Write the map rows while parsing, so the memory used
+///        doesn't grow with the map size. The parsing is sequential (default: False)
+///    band_rows (int): Number of map rows kept in memory when streaming (default: 4)
+///    mode (str): Accumulation engine when not streaming, "dense" (default) or "sparse"
+///    threads (int): Number of parsing threads when not streaming (default: 1). Use 0
+///        for one thread per available core.
+#[pyclass]
+#[derive(Debug, Clone)]
+pub struct WriterOptions {
+    #[pyo3(get, set)]
+    pub streaming: bool,
+    #[pyo3(get, set)]
+    pub band_rows: usize,
+    #[pyo3(get, set)]
+    pub mode: String,
+    #[pyo3(get, set)]
+    pub threads: usize,
+}
+
+impl Default for WriterOptions {
+    fn default() -> Self {
+        WriterOptions {
+            streaming: false,
+            band_rows: 4,
+            mode: "dense".to_string(),
+            threads: 1,
+        }
+    }
+}
+
+#[pymethods]
+impl WriterOptions {
+    #[new]
+    #[pyo3(signature = (streaming = false, band_rows = 4, mode = "dense".to_string(), threads = 1))]
+    fn py_new(streaming: bool, band_rows: usize, mode: String, threads: usize) -> Self {
+        WriterOptions {
+            streaming,
+            band_rows,
+            mode,
+            threads,
+        }
+    }
+
+    fn __repr__(&self) -> String {
+        format!(
+            "WriterOptions(streaming={}, band_rows={}, mode={:?}, threads={})",
+            self.streaming, self.band_rows, self.mode, self.threads
+        )
+    }
+}
+
+/// Write the datasets and attributes of a parsing result to a HDF5 group
+/// The layout is the one written by `write_lst_hdf5` on the Python side.
+pub fn write_parsing_result(group: &hdf5::Group, parsing_result: &ParsingResult) -> hdf5::Result<()> {
+    for (key, value) in parsing_result.attributes.iter() {
+        write_attr(group, key, value)?;
+    }
+
+    for dataset in parsing_result.datasets.iter().chain(parsing_result.computed_datasets.iter()) {
+        write_dataset(group, dataset)?;
+    }
+
+    Ok(())
+}
+
+/// Write a detector dataset and its attributes
+fn write_dataset(group: &hdf5::Group, dataset: &LSTData) -> hdf5::Result<()> {
+    let (max_y, max_x, channels) = dataset.data.dim();
+    debug!("{}: {:?}", dataset.name, dataset.data.dim());
+
+    let output = create_dataset(group, &dataset.name, (max_y, max_x), channels)?;
+    // Converted a map row at a time into the same buffer, chunks don't span several rows
+    let mut row = Array3::<i32>::zeros((1, max_x, channels));
+    for (y, counts) in dataset.data.outer_iter().enumerate() {
+        row.index_axis_mut(Axis(0), 0)
+            .zip_mut_with(&counts, |stored, &count| *stored = to_stored_count(count));
+        output.write_slice(&row, s![y..y + 1, .., ..])?;
+    }
+
+    for (key, value) in dataset.attributes.iter() {
+        write_attr(&output, key, value)?;
+    }
+
+    Ok(())
+}
+
+/// Convert a count to the stored type, saturating like `convert_counts` on the Python side
+pub fn to_stored_count(count: u32) -> i32 {
+    count.min(i32::MAX as u32) as i32
+}
+
+/// Create a gzip compressed (y, x, channel) dataset chunked by map row
+pub fn create_dataset(
+    group: &hdf5::Group,
+    name: &str,
+    shape: (usize, usize),
+    channels: usize,
+) -> hdf5::Result<hdf5::Dataset> {
+    let (max_y, max_x) = shape;
+    let chunk_x = (CHUNK_COUNTS / channels.max(1)).clamp(1, max_x.max(1));
+
+    group
+        .new_dataset::<i32>()
+        .shape((max_y, max_x, channels))
+        .chunk((1, chunk_x, channels.max(1)))
+        .deflate(4)
+        .create(name)
+}
+
+/// Write a string attribute, stored as a variable length UTF-8 string like h5py does
+pub fn write_attr(location: &hdf5::Location, key: &str, value: &str) -> hdf5::Result<()> {
+    let value = VarLenUnicode::from_str(value).map_err(|err| hdf5::Error::from(err.to_string()))?;
+    location
+        .new_attr::<VarLenUnicode>()
+        .shape(())
+        .create(key)?
+        .write_scalar(&value)
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use std::collections::HashMap;
+
+    #[test]
+    fn test_write_parsing_result() {
+        let mut data = Array3::<u32>::zeros((3, 4, 5));
+        data[[1, 2, 3]] = 7;
+        data[[2, 0, 4]] = 1;
+
+        let mut attributes = HashMap::new();
+        attributes.insert("beam_energy".to_string(), "3000".to_string());
+        let parsing_result = ParsingResult {
+            datasets: vec![LSTData {
+                name: "HE1".to_string(),
+                attributes: attributes.clone(),
+                data: data.clone(),
+            }],
+            computed_datasets: vec![],
+            attributes,
+            stats: HashMap::new(),
+        };
+
+        let directory = tempfile::tempdir().unwrap();
+        let file = hdf5::File::create(directory.path().join("out.hdf5")).unwrap();
+        let group = file.create_group("data").unwrap();
+        write_parsing_result(&group, &parsing_result).unwrap();
+
+        let dataset = group.dataset("HE1").unwrap();
+        let stored: Array3<i32> = dataset.read().unwrap();
+        assert_eq!(stored, data.mapv(|count| count as i32));
+
+        let beam_energy: VarLenUnicode = dataset.attr("beam_energy").unwrap().read_scalar().unwrap();
+        assert_eq!(beam_energy.as_str(), "3000");
+        let beam_energy: VarLenUnicode = group.attr("beam_energy").unwrap().read_scalar().unwrap();
+        assert_eq!(beam_energy.as_str(), "3000");
+    }
+
+    #[test]
+    fn test_to_stored_count() {
+        assert_eq!(to_stored_count(7), 7);
+        assert_eq!(to_stored_count(i32::MAX as u32), i32::MAX);
+        assert_eq!(to_stored_count(u32::MAX), i32::MAX);
+    }
+}
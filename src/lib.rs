@@ -1,8 +1,15 @@
 use pyo3::{prelude::*, types::PyModule, wrap_pyfunction, Py, PyResult, Python};
-use std::path;
+use std::{collections::HashMap, path, thread, time::Duration};
 
 mod converter;
-use converter::{config::Config, models::ParsingResult};
+use converter::{
+    config::Config,
+    histograms::{AccumulationMode, PixelRoi},
+    models::{DetectorStats, LSTProbe, PyParsingResult},
+    progress::{CancelToken, ProgressCallback, ProgressOptions, ProgressUpdate},
+    window::ParsingWindow,
+    writer::WriterOptions,
+};
 
 /// Parse a LST file and write the result to a new file with the same name
 ///
@@ -10,20 +17,245 @@ use converter::{config::Config, models::ParsingResult};
 ///    file_path (str): Path to the LST file
 ///    output (str): Path to the output file
 ///    config (Config): Configuration for the conversion
+///    mode (str): Accumulation engine, "dense" (default) or "sparse". The sparse
+///        engine only stores the channels that received counts.
+///    detectors (list[str] | None): Only parse these detectors. All the reachable
+///        detectors are parsed if None.
+///    threads (int): Number of threads used to parse the file (default: 1). Use 0
+///        for one thread per available core. Each thread holds its own histograms.
+///    progress (Callable[[int, int, int, float], None] | None): Called with the parsed
+///        bytes, the file size, the number of events and the events per second,
+///        at most once every `progress_interval` seconds and once at the end.
+///        An exception raised by the callback cancels the parsing.
+///    progress_interval (float): Minimum delay in seconds between two progress calls
+///    cancel (CancelToken | None): Cancel the parsing from another thread
+///    progress_bar (bool): Draw a progress bar on the terminal (default: True)
+///    pixel_roi (tuple[int, int, int, int] | None): Only keep the pixels from (x0, y0)
+///        included to (x1, y1) excluded. The datasets are sized by the region.
+///    time_window (tuple[int, int] | None): Only keep the events between these times
+///        in milliseconds from the start of the parsed bytes. The parsing is sequential
+///        and stops at the end of the window.
+///    byte_range (tuple[int, int] | None): Only parse the events between these file
+///        offsets. A range starting after the first event starts on the next timer word.
+///
+/// The GIL is released during the parsing, several files can be parsed
+/// concurrently from Python threads.
 ///
 /// Returns:
 ///   None
 ///
 /// Raises:
-///  PyException: If the conversion fails
+///  ValueError: If the mode or the progress interval is invalid
+///  PyException: If the conversion fails or is cancelled
 #[pyfunction]
-#[pyo3(signature = (file_path, config), text_signature = "(file_path, config)")]
-fn parse_lst(file_path: String, config: Config) -> PyResult<Py<ParsingResult>> {
+#[pyo3(
+    signature = (
+        file_path,
+        config,
+        mode = "dense",
+        detectors = None,
+        threads = 1,
+        progress = None,
+        progress_interval = 0.5,
+        cancel = None,
+        progress_bar = true,
+        pixel_roi = None,
+        time_window = None,
+        byte_range = None,
+    ),
+    text_signature = "(file_path, config, mode=\"dense\", detectors=None, threads=1, progress=None, \
+                      progress_interval=0.5, cancel=None, progress_bar=True, pixel_roi=None, time_window=None, \
+                      byte_range=None)"
+)]
+fn parse_lst(
+    py: Python,
+    file_path: String,
+    config: Config,
+    mode: &str,
+    detectors: Option<Vec<String>>,
+    threads: usize,
+    progress: Option<PyObject>,
+    progress_interval: f64,
+    cancel: Option<CancelToken>,
+    progress_bar: bool,
+    pixel_roi: Option<(usize, usize, usize, usize)>,
+    time_window: Option<(u64, u64)>,
+    byte_range: Option<(u64, u64)>,
+) -> PyResult<Py<PyParsingResult>> {
     let filepath = path::Path::new(&file_path);
+    let mode = match AccumulationMode::parse(mode) {
+        Some(mode) => mode,
+        None => {
+            return Err(PyErr::new::<pyo3::exceptions::PyValueError, _>(format!(
+                "Unknown accumulation mode: {}",
+                mode
+            )))
+        }
+    };
+
+    let threads = match threads {
+        0 => thread::available_parallelism().map_or(1, |threads| threads.get()),
+        threads => threads,
+    };
+
+    for (start, end) in [time_window, byte_range].into_iter().flatten() {
+        if start >= end {
+            return Err(PyErr::new::<pyo3::exceptions::PyValueError, _>(format!(
+                "Empty range: ({}, {})",
+                start, end
+            )));
+        }
+    }
+    let pixel_roi = match pixel_roi {
+        Some((x0, y0, x1, y1)) if x0 >= x1 || y0 >= y1 => {
+            return Err(PyErr::new::<pyo3::exceptions::PyValueError, _>(format!(
+                "Empty pixel region: ({}, {}, {}, {})",
+                x0, y0, x1, y1
+            )))
+        }
+        Some((x0, y0, x1, y1)) => Some(PixelRoi { x0, y0, x1, y1 }),
+        None => None,
+    };
+    let window = ParsingWindow {
+        pixel_roi,
+        time_window,
+        byte_range,
+    };
 
-    Python::with_gil(|py| match converter::parse_lst(filepath, config) {
-        Ok(parsing_result) => Py::new(py, parsing_result),
+    let progress_options = get_progress_options(progress, progress_interval, cancel, progress_bar)?;
+
+    // The GIL is released while parsing so other Python threads can run,
+    // it is only held to hand the datasets over to NumPy and to report the progress
+    let parsed =
+        py.allow_threads(|| converter::parse_lst(filepath, config, mode, detectors, threads, progress_options, window));
+    match parsed {
+        Ok(parsing_result) => Py::new(py, parsing_result.into_py_result(py)?),
         Err(err) => Err(PyErr::new::<pyo3::exceptions::PyException, _>(err)),
+    }
+}
+
+/// Parse a LST file and write the histograms to a new HDF5 file
+///
+/// The datasets are written from Rust, they are never handed over to NumPy.
+/// Datasets and attributes are the same as the ones written from `parse_lst`.
+///
+/// Args:
+///    file_path (str): Path to the LST file
+///    config (Config): Configuration for the conversion
+///    output_path (str): Path to the HDF5 file to create
+///    options (WriterOptions | None): Parsing and writing options, the whole file is
+///        parsed in dense mode before writing if None. With `streaming`, map rows are
+///        written as soon as the parser moved `band_rows` rows past them, so the
+///        memory used doesn't grow with the map size.
+///    detectors (list[str] | None): Only parse these detectors. All the reachable
+///        detectors are parsed if None.
+///    progress (Callable[[int, int, int, float], None] | None): Called with the parsed
+///        bytes, the file size, the number of events and the events per second,
+///        at most once every `progress_interval` seconds and once at the end.
+///        An exception raised by the callback cancels the parsing.
+///    progress_interval (float): Minimum delay in seconds between two progress calls
+///    cancel (CancelToken | None): Cancel the parsing from another thread
+///    progress_bar (bool): Draw a progress bar on the terminal (default: True)
+///
+/// Returns:
+///   dict[str, DetectorStats]: Statistics of every detector and computed detector
+///
+/// Raises:
+///  ValueError: If the progress interval is invalid
+///  PyException: If the conversion fails or is cancelled. A failed or cancelled
+///      conversion removes the output file.
+#[pyfunction]
+#[pyo3(
+    signature = (
+        file_path,
+        config,
+        output_path,
+        options = None,
+        detectors = None,
+        progress = None,
+        progress_interval = 0.5,
+        cancel = None,
+        progress_bar = true,
+    ),
+    text_signature = "(file_path, config, output_path, options=None, detectors=None, progress=None, \
+                      progress_interval=0.5, cancel=None, progress_bar=True)"
+)]
+fn parse_lst_to_hdf5(
+    py: Python,
+    file_path: String,
+    config: Config,
+    output_path: String,
+    options: Option<WriterOptions>,
+    detectors: Option<Vec<String>>,
+    progress: Option<PyObject>,
+    progress_interval: f64,
+    cancel: Option<CancelToken>,
+    progress_bar: bool,
+) -> PyResult<HashMap<String, DetectorStats>> {
+    let filepath = path::Path::new(&file_path);
+    let output_path = path::Path::new(&output_path);
+    let options = options.unwrap_or_default();
+    let progress_options = get_progress_options(progress, progress_interval, cancel, progress_bar)?;
+
+    py.allow_threads(|| {
+        converter::parse_lst_to_hdf5(filepath, config, detectors, output_path, options, progress_options)
+    })
+    .map_err(|err| PyErr::new::<pyo3::exceptions::PyException, _>(err))
+}
+
+/// Read the header of a LST file without parsing its events
+///
+/// Args:
+///    file_path (str): Path to the LST file
+///    config (Config): Configuration for the conversion
+///    detectors (list[str] | None): Only estimate these detectors. All the reachable
+///        detectors are estimated if None.
+///
+/// Returns:
+///   LSTProbe: Header fields, file size, [LISTDATA] offset and the size in bytes
+///       of the dense dataset of every detector and computed detector
+///
+/// Raises:
+///  PyException: If the file can't be read or has no map size
+#[pyfunction]
+#[pyo3(
+    signature = (file_path, config, detectors = None),
+    text_signature = "(file_path, config, detectors=None)"
+)]
+fn probe_lst(file_path: String, config: Config, detectors: Option<Vec<String>>) -> PyResult<LSTProbe> {
+    converter::probe_lst(path::Path::new(&file_path), &config, detectors)
+        .map_err(|err| PyErr::new::<pyo3::exceptions::PyException, _>(err))
+}
+
+/// Build the progress options from the Python arguments
+/// The callback takes the GIL from the progress thread, the parsing threads never wait for it.
+fn get_progress_options(
+    progress: Option<PyObject>,
+    progress_interval: f64,
+    cancel: Option<CancelToken>,
+    progress_bar: bool,
+) -> PyResult<ProgressOptions> {
+    if !progress_interval.is_finite() || progress_interval < 0.0 {
+        return Err(PyErr::new::<pyo3::exceptions::PyValueError, _>(format!(
+            "Invalid progress interval: {}",
+            progress_interval
+        )));
+    }
+
+    let callback = progress.map(|progress| -> ProgressCallback {
+        Box::new(move |update: ProgressUpdate| {
+            Python::with_gil(|py| {
+                let args = (update.parsed_bytes, update.total_bytes, update.events, update.events_per_second);
+                progress.call1(py, args).map(|_| ()).map_err(|err| err.to_string())
+            })
+        })
+    });
+
+    Ok(ProgressOptions {
+        progress_bar,
+        callback,
+        interval: Duration::from_secs_f64(progress_interval),
+        cancel: cancel.unwrap_or_default().flag(),
     })
 }
 
@@ -31,12 +263,20 @@ fn parse_lst(file_path: String, config: Config) -> PyResult<Py<ParsingResult>> {
 fn lstrs(_py: Python, m: &PyModule) -> PyResult<()> {
     pyo3_log::init();
 
+    m.add("__version__", env!("CARGO_PKG_VERSION"))?;
     m.add_function(wrap_pyfunction!(parse_lst, m)?)?;
+    m.add_function(wrap_pyfunction!(parse_lst_to_hdf5, m)?)?;
+    m.add_function(wrap_pyfunction!(probe_lst, m)?)?;
     m.add_class::<converter::config::Detector>()?;
     m.add_class::<converter::config::ComputedDetector>()?;
     m.add_class::<converter::config::Config>()?;
-    m.add_class::<converter::models::LSTData>()?;
-    m.add_class::<converter::models::ParsingResult>()?;
+    m.add_class::<converter::models::PyLSTData>()?;
+    m.add_class::<converter::models::PyParsingResult>()?;
+    m.add_class::<converter::models::DetectorStats>()?;
+    m.add_class::<converter::models::LSTProbe>()?;
+    m.add_class::<converter::progress::CancelToken>()?;
+    m.add_class::<converter::live::LstStream>()?;
+    m.add_class::<converter::writer::WriterOptions>()?;
     m.add_class::<converter::config::EDFConfig>()?;
     m.add_class::<converter::config::EDFFileConfig>()?;
 
@@ -0,0 +1,88 @@
+import threading
+import unittest
+
+from new_aglae_data_converter.lst.pipeline import PipelineQueue
+
+# Seconds to wait for a thread that must or mustn't be blocked
+TIMEOUT = 1
+
+
+class PipelineQueueTest(unittest.TestCase):
+    def reserve_in_thread(self, queue: PipelineQueue, size: int) -> threading.Event:
+        reserved = threading.Event()
+
+        def reserve():
+            if queue.reserve(size):
+                reserved.set()
+
+        threading.Thread(target=reserve, daemon=True).start()
+        return reserved
+
+    def test_items_are_got_in_order(self):
+        queue = PipelineQueue(2)
+        for item in ("first", "second"):
+            self.assertTrue(queue.reserve(1))
+            queue.put(item, 1)
+        queue.finish()
+
+        self.assertEqual(queue.get(), ("first", 1))
+        self.assertEqual(queue.get(), ("second", 1))
+        self.assertIsNone(queue.get())
+
+    def test_reserve_waits_for_a_free_slot(self):
+        queue = PipelineQueue(1)
+        self.assertTrue(queue.reserve())
+
+        # The slot of an item being built is taken until the item is got
+        reserved = self.reserve_in_thread(queue, 0)
+        self.assertFalse(reserved.wait(TIMEOUT))
+        queue.put("item")
+        self.assertFalse(reserved.wait(TIMEOUT))
+        queue.get()
+        self.assertTrue(reserved.wait(TIMEOUT))
+
+    def test_reserve_waits_for_released_memory(self):
+        queue = PipelineQueue(2, max_bytes=10)
+        self.assertTrue(queue.reserve(6))
+        queue.put("item", 6)
+        queue.get()
+
+        # The memory of the item being written is accounted until it's released
+        reserved = self.reserve_in_thread(queue, 6)
+        self.assertFalse(reserved.wait(TIMEOUT))
+        queue.release(6)
+        self.assertTrue(reserved.wait(TIMEOUT))
+
+    def test_item_larger_than_the_limit_is_accepted_alone(self):
+        queue = PipelineQueue(1, max_bytes=10)
+        self.assertTrue(queue.reserve(20))
+
+    def test_close_stops_the_producer(self):
+        queue = PipelineQueue(1)
+        self.assertTrue(queue.reserve())
+
+        reserved = threading.Event()
+        results = []
+
+        def reserve():
+            results.append(queue.reserve())
+            reserved.set()
+
+        threading.Thread(target=reserve, daemon=True).start()
+        queue.close()
+        self.assertTrue(reserved.wait(TIMEOUT))
+        self.assertEqual(results, [False])
+
+    def test_get_raises_the_producer_error(self):
+        queue = PipelineQueue(2)
+        self.assertTrue(queue.reserve())
+        queue.put("item")
+        queue.finish(ValueError("parsing failed"))
+
+        self.assertEqual(queue.get(), ("item", 0))
+        with self.assertRaises(ValueError):
+            queue.get()
+
+
+if __name__ == "__main__":
+    unittest.main()